@@ -0,0 +1,101 @@
+import os
+import sys
+import argparse
+import tempfile
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import synthetic_meshes
+from input import ObjReader
+from voxelize import VoxelizerWithoutMinecraft
+
+COW_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "test_models", "cow.obj")
+DEFAULT_MESHES = {"slivers": 200, "flat": 8} # the shapes whose triangles' bounding boxes are mostly empty or very thin
+VOXEL_SIZES = [0.02, 0.01] # voxel sizes to check every model at (the SAT algorithm takes over a minute per run on the slivers at 0.005)
+VARIANTS = [(False, 1), (True, 1), (False, 2), (True, 2)] # (sparse, workers)
+
+def get_grids(model, voxel_size, algorithm, sparse, workers):
+    """
+    Voxelizes a model and gets its grids as dense arrays
+
+    Args:
+    - model (ObjReader): parsed model
+    - voxel_size (float): sidelength of each voxel
+    - algorithm (str): "sat" or "raster"
+    - sparse (bool): whether to store the grids as ChunkedGrids
+    - workers (int): number of processes to voxelize with
+
+    Returns:
+    - np.ndarray: voxel grid
+    - np.ndarray: color grid
+    """
+    voxelizer = VoxelizerWithoutMinecraft(model, voxel_size, workers, sparse, algorithm)
+    voxelizer.voxelize()
+    if sparse:
+        return voxelizer.voxel_grid.to_dense(), voxelizer.color_grid.to_dense()
+    return voxelizer.voxel_grid, voxelizer.color_grid
+
+def check(name, model, voxel_size):
+    """
+    Asserts that the raster algorithm gives the same voxels and colors as the SAT algorithm, for every variant of storage
+    and process count
+
+    Args:
+    - name (str): name of the model (for the output)
+    - model (ObjReader): parsed model
+    - voxel_size (float): sidelength of each voxel
+
+    Raises:
+    - AssertionError: if any grid differs
+    """
+    for sparse, workers in VARIANTS:
+        sat_voxels, sat_colors = get_grids(model, voxel_size, "sat", sparse, workers)
+        raster_voxels, raster_colors = get_grids(model, voxel_size, "raster", sparse, workers)
+        label = f"{name} at {voxel_size} (sparse={sparse}, workers={workers})"
+        assert np.array_equal(sat_voxels, raster_voxels), f"{label}: {np.count_nonzero(sat_voxels != raster_voxels)} voxels differ"
+        assert np.array_equal(sat_colors, raster_colors), f"{label}: {np.count_nonzero((sat_colors != raster_colors).any(axis=-1))} colors differ"
+        print(f"{label}: {np.count_nonzero(sat_voxels)} voxels match")
+
+def main(meshes, seed):
+    """
+    Checks the raster algorithm against the SAT algorithm on test_models/cow.obj and the synthetic meshes
+
+    Args:
+    - meshes (dict): number of triangles of each synthetic mesh, by shape
+    - seed (int): random seed
+
+    Raises:
+    - AssertionError: if the algorithms give different grids for any model
+    """
+    model = ObjReader(COW_PATH, use_binary=False)
+    model.read_file()
+    for voxel_size in VOXEL_SIZES:
+        check("cow", model, voxel_size)
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        for shape, triangle_count in meshes.items():
+            path = os.path.join(work_dir, f"{shape}.obj")
+            synthetic_meshes.generate(shape, triangle_count, path, seed)
+            model = ObjReader(path, use_binary=False)
+            model.read_file()
+            for voxel_size in VOXEL_SIZES:
+                check(shape, model, voxel_size)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Checks that the raster and SAT voxelization algorithms give the same voxels and colors")
+    parser.add_argument("--meshes", type=str, nargs="+", metavar="SHAPE[:TRIANGLES]", help=f"Synthetic meshes to check besides the cow, each optionally with its number of triangles (default: {' '.join(f'{s}:{n}' for s, n in DEFAULT_MESHES.items())})")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed (default: 0)")
+    args = parser.parse_args()
+
+    meshes = dict(DEFAULT_MESHES)
+    if args.meshes:
+        meshes = {}
+        for mesh in args.meshes:
+            shape, _, count = mesh.partition(":")
+            if shape not in synthetic_meshes.SHAPES:
+                raise ValueError(f"Unknown shape: {shape} (choose from {', '.join(synthetic_meshes.SHAPES)})")
+            meshes[shape] = int(count) if count else DEFAULT_MESHES.get(shape, 1000)
+
+    # exits with an error (from the failed assert) when the algorithms disagree, so it can run in CI
+    main(meshes, args.seed)
@@ -0,0 +1,94 @@
+import os
+import sys
+import time
+import argparse
+import tempfile
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from kdtree import KDTree
+from color_lookup import ColorLookup
+from average_block_colors import color_block_pairs
+
+def time_call(function, *args):
+    """
+    Times a single call of a function
+
+    Args:
+    - function (callable): function to time
+    - args: arguments to pass to the function
+
+    Returns:
+    - result: whatever the function returned
+    - float: seconds elapsed
+    """
+    start_time = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start_time
+
+def count_mismatches(colors, matched, expected):
+    """
+    Counts colors whose matched palette color is farther away than the exact nearest one (ties are not mismatches)
+
+    Args:
+    - colors (np.ndarray): (M, 3) array of RGB values
+    - matched (np.ndarray): (M, 3) array of the palette colors each method matched
+    - expected (np.ndarray): (M, 3) array of the exact nearest palette colors
+
+    Returns:
+    - int: number of mismatches
+    """
+    colors = colors.astype(np.int64)
+    matched_distances = ((np.asarray(matched, dtype=np.int64) - colors) ** 2).sum(axis=1)
+    expected_distances = ((expected.astype(np.int64) - colors) ** 2).sum(axis=1)
+    return int((matched_distances > expected_distances).sum())
+
+def main(num_colors, num_distinct, seed, lut_sizes):
+    """
+    Compares the KD tree against the exact batched search and lookup tables of various sizes
+
+    Args:
+    - num_colors (int): number of colors to match (i.e. filled voxels)
+    - num_distinct (int): number of distinct colors among them (voxel colors repeat heavily in practice)
+    - seed (int): random seed
+    - lut_sizes (list): bits per channel of each lookup table to benchmark
+    """
+    palette = list(color_block_pairs.keys())
+    rng = np.random.default_rng(seed)
+    distinct_colors = rng.integers(0, 256, (num_distinct, 3), dtype=np.uint8)
+    colors = distinct_colors[rng.integers(0, num_distinct, num_colors)]
+
+    exact = ColorLookup(palette)
+    expected, elapsed = time_call(exact.get_nearest_indices, colors)
+    print(f"{'method':<24}{'setup (s)':>12}{'lookup (s)':>12}{'colors/s':>14}{'mismatches':>12}")
+    print(f"{'exact search (rgb)':<24}{0:>12.3f}{elapsed:>12.3f}{num_colors / elapsed:>14.0f}{0:>12}")
+
+    kdtree, setup = time_call(KDTree, list(palette))
+    nearest, elapsed = time_call(lambda: [kdtree.get_nearest_point(color).value for color in colors.tolist()])
+    mismatches = count_mismatches(colors, nearest, exact.palette[expected])
+    print(f"{'kd tree (per color)':<24}{setup:>12.3f}{elapsed:>12.3f}{num_colors / elapsed:>14.0f}{mismatches:>12}")
+
+    lab = ColorLookup(palette, "lab")
+    _, elapsed = time_call(lab.get_nearest_indices, colors)
+    print(f"{'exact search (lab)':<24}{0:>12.3f}{elapsed:>12.3f}{num_colors / elapsed:>14.0f}{'-':>12}")
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        for lut_bits in lut_sizes:
+            lut, setup = time_call(ColorLookup, palette, "rgb", lut_bits, cache_dir)
+            _, cached_setup = time_call(ColorLookup, palette, "rgb", lut_bits, cache_dir)
+            result, elapsed = time_call(lut.get_nearest_indices, colors)
+            mismatches = count_mismatches(colors, lut.palette[result], exact.palette[expected])
+            label = f"{lut_bits}-bit table"
+            print(f"{label:<24}{setup:>12.3f}{elapsed:>12.3f}{num_colors / elapsed:>14.0f}{mismatches:>12}")
+            print(f"{'  (loaded from cache)':<24}{cached_setup:>12.3f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks the approaches for matching voxel colors to Minecraft blocks")
+    parser.add_argument("--num-colors", type=int, default=1_000_000, help="Number of colors to match (default: 1000000)")
+    parser.add_argument("--num-distinct", type=int, default=5_000, help="Number of distinct colors among them (default: 5000)")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed (default: 0)")
+    parser.add_argument("--lut-bits", type=int, nargs="+", default=[5, 6, 7, 8], help="Lookup table sizes to benchmark, in bits per channel (default: 5 6 7 8)")
+    args = parser.parse_args()
+
+    main(args.num_colors, args.num_distinct, args.seed, args.lut_bits)
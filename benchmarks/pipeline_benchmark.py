@@ -0,0 +1,252 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import tracemalloc
+import subprocess
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import synthetic_meshes
+from kdtree import KDTree
+from input import ObjReader
+from color_lookup import ColorLookup
+from chunked_grid import argwhere
+from average_block_colors import color_block_pairs
+from render import MinecraftWorldEditor, VoxelRenderer
+from voxelize import VoxelizerBase, VoxelizerMinecraft
+from voxel_triangle_intersection import TriangleVoxelIntersection, BatchTriangleVoxelIntersection
+
+DEFAULT_MESHES = {"sphere": 20_000, "slivers": 200, "flat": 8, "scan": 50_000}
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+def measure(function, repeat=1, trace_memory=True, setup=None):
+    """
+    Times a function (best of several runs), then runs it once more while tracing allocations to find its peak memory
+
+    Args:
+    - function (callable): function to measure, taking no arguments
+    - repeat (int): number of timed runs
+    - trace_memory (bool): whether to measure the peak memory (traced separately, since tracing slows things down)
+    - setup (callable): called before every run and not timed (ex. to restore files the function modifies)
+
+    Returns:
+    - result: whatever the function returned on its last timed run
+    - float: seconds taken by the fastest run
+    - int: peak bytes allocated by Python and NumPy during the traced run (None if not traced)
+    """
+    best = np.inf
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start_time = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start_time)
+
+    peak = None
+    if trace_memory:
+        if setup:
+            setup()
+        tracemalloc.start()
+        function()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result, best, peak
+
+def record(results, mesh, triangle_count, voxel_size, stage, seconds, peak, **counts):
+    """
+    Adds a result, along with the throughput of each count (ex. triangles per second)
+
+    Args:
+    - results (list): results so far
+    - mesh (str): name of the mesh
+    - triangle_count (int): number of triangles in the mesh
+    - voxel_size (float): voxel size (None for stages that don't depend on it)
+    - stage (str): name of the stage
+    - seconds (float): time taken
+    - peak (int): peak bytes allocated (None if not measured)
+    - counts: number of items processed, by unit (ex. voxels=1000)
+    """
+    throughput = {f"{unit}/s": count / seconds if seconds > 0 else None for unit, count in counts.items()}
+    results.append({"mesh": mesh, "mesh_triangles": triangle_count, "voxel_size": voxel_size, "stage": stage, "seconds": seconds,
+                    "peak_bytes": peak, **counts, "throughput": throughput})
+    rate = ", ".join(f"{value:,.0f} {unit}" for unit, value in throughput.items() if value is not None)
+    memory = f"{peak / (1 << 20):8.1f} MB" if peak is not None else ""
+    print(f"{mesh:<10}{voxel_size if voxel_size else '-':>8} {stage:<18}{seconds:>10.4f}s {memory}  {rate}")
+
+def get_candidate_pairs(triangles, voxel_size, max_pairs, seed):
+    """
+    Samples triangle-voxel pairs from the triangles' bounding boxes, like the voxelizer tests
+
+    Args:
+    - triangles (np.ndarray): (F, 3, 3) array of triangle vertices
+    - voxel_size (float): sidelength of each voxel
+    - max_pairs (int): maximum number of pairs
+    - seed (int): random seed
+
+    Returns:
+    - np.ndarray: (N, 3, 3) array of each pair's triangle
+    - np.ndarray: (N, 3) array of each pair's voxel center
+    """
+    rng = np.random.default_rng(seed)
+    sample = triangles[rng.permutation(len(triangles))[:max_pairs]]
+    min_corners = np.round(sample.min(axis=1) / voxel_size).astype(np.int64)
+    box_dims = np.round(sample.max(axis=1) / voxel_size).astype(np.int64) - min_corners + 1
+    # cap each box so a few huge triangles can't take up the whole sample
+    box_dims = np.minimum(box_dims, 64)
+    face_ids, voxels = VoxelizerBase._get_box_candidates(min_corners, box_dims)
+    pairs = rng.permutation(len(face_ids))[:max_pairs]
+    return sample[face_ids[pairs]], voxels[pairs] * voxel_size + voxel_size / 2
+
+def get_git_commit():
+    """
+    Gets the commit the benchmark is run on
+
+    Returns:
+    - str: commit hash (None if it can't be found)
+    """
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(results, previous_path):
+    """
+    Prints how long each stage took relative to a previous run
+
+    Args:
+    - results (list): results of this run
+    - previous_path (str): path to the JSON file of a previous run
+    """
+    with open(previous_path, "r") as f:
+        previous = {(r["mesh"], r["mesh_triangles"], r["voxel_size"], r["stage"]): r for r in json.load(f)["results"]}
+    print(f"\ncompared to {previous_path} (time now / time then):")
+    for r in results:
+        old = previous.get((r["mesh"], r["mesh_triangles"], r["voxel_size"], r["stage"]))
+        if old and old["seconds"] > 0:
+            print(f"{r['mesh']:<10}{r['voxel_size'] if r['voxel_size'] else '-':>8} {r['stage']:<18}{r['seconds'] / old['seconds']:>8.2f}x")
+
+def main(meshes, voxel_sizes, world_path, build_location, algorithm, workers, repeat, trace_memory, scalar_pairs, seed, output, previous):
+    """
+    Times each stage of the pipeline on synthetic meshes across a sweep of voxel sizes, and writes the results to JSON
+
+    Args:
+    - meshes (dict): number of triangles of each synthetic mesh, by shape
+    - voxel_sizes (list): voxel sizes to sweep (the meshes fit in a unit cube)
+    - world_path (str): minecraft world to benchmark build_structure on, using a copy (None = skip)
+    - build_location (list): where to build in the world
+    - algorithm (str): voxelization algorithm ("sat" or "raster")
+    - workers (int): number of processes to voxelize with
+    - repeat (int): number of timed runs of each stage (the fastest is kept)
+    - trace_memory (bool): whether to measure each stage's peak memory
+    - scalar_pairs (int): number of pairs to time the per-pair intersection test and kd tree lookups on
+    - seed (int): random seed
+    - output (str): path of the JSON file to write
+    - previous (str): JSON file of a previous run to compare against (None = don't compare)
+    """
+    results = []
+    color_lookup = ColorLookup(list(color_block_pairs.keys()))
+    kdtree = KDTree(list(color_block_pairs.keys()))
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        for shape, triangle_count in meshes.items():
+            path = os.path.join(work_dir, f"{shape}.obj")
+            triangle_count = synthetic_meshes.generate(shape, triangle_count, path, seed)
+
+            def parse():
+                model = ObjReader(path)
+                model.read_file()
+                return model
+            model, seconds, peak = measure(parse, repeat, trace_memory)
+            record(results, shape, triangle_count, None, "parse", seconds, peak, triangles=triangle_count, bytes=os.path.getsize(path))
+
+            triangles = model.vertices[model.faces]
+            for voxel_size in voxel_sizes:
+                pair_triangles, pair_centers = get_candidate_pairs(triangles, voxel_size, scalar_pairs, seed)
+                pairs = [(triangle.tolist(), center.tolist()) for triangle, center in zip(pair_triangles, pair_centers)]
+                _, seconds, peak = measure(lambda: [TriangleVoxelIntersection(t, c, voxel_size).intersects() for t, c in pairs], repeat, trace_memory)
+                record(results, shape, triangle_count, voxel_size, "intersects", seconds, peak, tests=len(pairs))
+                _, seconds, peak = measure(lambda: BatchTriangleVoxelIntersection(pair_triangles, pair_centers, voxel_size).intersects(), repeat, trace_memory)
+                record(results, shape, triangle_count, voxel_size, "batch_intersects", seconds, peak, tests=len(pairs))
+
+                def voxelize():
+                    voxelizer = VoxelizerMinecraft(model, voxel_size, color_lookup, workers, algorithm=algorithm)
+                    voxelizer.voxelize()
+                    return voxelizer
+                voxelizer, seconds, peak = measure(voxelize, repeat, trace_memory)
+                indices = argwhere(voxelizer.voxel_grid)
+                voxel_count = len(indices)
+                record(results, shape, triangle_count, voxel_size, "voxelize", seconds, peak, triangles=triangle_count, voxels=voxel_count)
+
+                colors = voxelizer.color_grid[tuple(indices[:scalar_pairs].T)].tolist()
+                _, seconds, peak = measure(lambda: [kdtree.get_nearest_point(color) for color in colors], repeat, trace_memory)
+                record(results, shape, triangle_count, voxel_size, "kdtree", seconds, peak, colors=len(colors))
+
+                for exposed in (False, True):
+                    _, seconds, peak = measure(lambda: VoxelRenderer.get_mesh_arrays(voxelizer.voxel_grid, voxelizer.color_grid, exposed), repeat, trace_memory)
+                    record(results, shape, triangle_count, voxel_size, "mesh_exposed" if exposed else "mesh", seconds, peak, voxels=voxel_count)
+
+                if world_path:
+                    # build into a fresh copy of the world every time, so every run writes the same blocks
+                    world_copy = os.path.join(work_dir, "world")
+                    def copy_world():
+                        shutil.rmtree(world_copy, ignore_errors=True)
+                        shutil.copytree(world_path, world_copy)
+                    build = lambda: MinecraftWorldEditor(world_copy).build_structure(voxelizer.block_grid, voxelizer.block_palette, build_location)
+                    _, seconds, peak = measure(build, repeat, trace_memory, copy_world)
+                    record(results, shape, triangle_count, voxel_size, "build_structure", seconds, peak, voxels=voxel_count)
+                del voxelizer
+
+    peak_rss = None
+    try:
+        import resource
+        peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+    except ImportError: # not available on Windows
+        pass
+
+    meta = {"time": time.strftime("%Y-%m-%dT%H:%M:%S"), "commit": get_git_commit(), "python": platform.python_version(),
+            "numpy": np.__version__, "platform": platform.platform(), "cpu_count": os.cpu_count(), "peak_rss_bytes": peak_rss,
+            "settings": {"meshes": meshes, "voxel_sizes": voxel_sizes, "algorithm": algorithm, "workers": workers,
+                         "repeat": repeat, "scalar_pairs": scalar_pairs, "seed": seed, "world": bool(world_path)}}
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump({"meta": meta, "results": results}, f, indent=2)
+    print(f"\nwrote {output}")
+
+    if previous:
+        compare(results, previous)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks each stage of the voxelization pipeline on synthetic meshes")
+    parser.add_argument("--meshes", type=str, nargs="+", metavar="SHAPE[:TRIANGLES]", help=f"Synthetic meshes to benchmark, each optionally with its number of triangles (default: {' '.join(f'{s}:{n}' for s, n in DEFAULT_MESHES.items())})")
+    parser.add_argument("--voxel-sizes", type=float, nargs="+", default=[0.05, 0.02, 0.01], help="Voxel sizes to sweep, relative to the meshes' unit size (default: 0.05 0.02 0.01)")
+    parser.add_argument("--world-path", type=str, help="Minecraft world to also benchmark building in (a copy is used, so the world is left untouched)")
+    parser.add_argument("--build-location", type=int, nargs=3, default=[0, 100, 0], metavar=("X", "Y", "Z"), help="Where to build in the world (default: 0 100 0)")
+    parser.add_argument("--algorithm", type=str, choices=VoxelizerBase.ALGORITHMS, default="sat", help="Voxelization algorithm (default: sat)")
+    parser.add_argument("--workers", type=int, default=1, help="Number of processes to voxelize with (default: 1)")
+    parser.add_argument("--repeat", type=int, default=1, help="Number of timed runs of each stage, keeping the fastest (default: 1)")
+    parser.add_argument("--no-memory", action="store_true", help="Skip measuring each stage's peak memory (which runs each stage once more)")
+    parser.add_argument("--scalar-pairs", type=int, default=5_000, help="Number of triangle-voxel pairs and colors to time the per-item intersection test and kd tree on (default: 5000)")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed (default: 0)")
+    parser.add_argument("--output", type=str, help="JSON file to write the results to (default: benchmarks/results/pipeline_<time>.json)")
+    parser.add_argument("--compare", type=str, metavar="JSON", help="Results of a previous run to compare against")
+    args = parser.parse_args()
+
+    meshes = dict(DEFAULT_MESHES)
+    if args.meshes:
+        meshes = {}
+        for mesh in args.meshes:
+            shape, _, count = mesh.partition(":")
+            if shape not in synthetic_meshes.SHAPES:
+                raise ValueError(f"Unknown shape: {shape} (choose from {', '.join(synthetic_meshes.SHAPES)})")
+            meshes[shape] = int(count) if count else DEFAULT_MESHES[shape]
+    output = args.output or os.path.join(RESULTS_DIR, f"pipeline_{time.strftime('%Y%m%d-%H%M%S')}.json")
+
+    main(meshes, args.voxel_sizes, args.world_path, args.build_location, args.algorithm, args.workers, args.repeat,
+         not args.no_memory, args.scalar_pairs, args.seed, output, args.compare)
@@ -0,0 +1,75 @@
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+import numpy as np
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+MAIN_PATH = os.path.join(SRC_DIR, "main.py")
+TARGET_SECONDS = 0.5 # startup time the CLI should stay under (python src/main.py --help)
+HEAVY_MODULES = ("pyvista", "vtk", "vtkmodules", "yaml", "pyanvileditor") # modules that must only be imported once they're needed
+
+def time_command(command, repeat):
+    """
+    Times a command run in a fresh process (median of several runs, since process startup is noisy)
+
+    Args:
+    - command (list): command line to run
+    - repeat (int): number of runs
+
+    Returns:
+    - float: median seconds taken
+    """
+    seconds = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        subprocess.run(command, check=True, stdout=subprocess.DEVNULL, cwd=SRC_DIR)
+        seconds.append(time.perf_counter() - start_time)
+    return float(np.median(seconds))
+
+def get_imported_modules(module):
+    """
+    Imports a module in a fresh process and gets every module that was imported along with it
+
+    Args:
+    - module (str): name of the module to import (from src)
+
+    Returns:
+    - set: names of the imported modules
+    """
+    code = f"import sys, json; import {module}; print(json.dumps(sorted(sys.modules)))"
+    output = subprocess.run([sys.executable, "-c", code], check=True, capture_output=True, text=True, cwd=SRC_DIR).stdout
+    return set(json.loads(output))
+
+def main(repeat, target):
+    """
+    Measures the CLI's startup time against the target and checks that it doesn't import the rendering backends or PyAnvilEditor
+
+    Args:
+    - repeat (int): number of runs of each command
+    - target (float): startup time to stay under, in seconds
+
+    Returns:
+    - bool: whether the startup time is under the target and no heavy module was imported
+    """
+    interpreter = time_command([sys.executable, "-c", "pass"], repeat)
+    numpy_only = time_command([sys.executable, "-c", "import numpy"], repeat)
+    cli = time_command([sys.executable, MAIN_PATH, "--help"], repeat)
+    print(f"python alone:        {interpreter:.3f}s")
+    print(f"python + numpy:      {numpy_only:.3f}s")
+    print(f"main.py --help:      {cli:.3f}s (target {target:.3f}s, {cli - numpy_only:.3f}s more than importing numpy)")
+
+    heavy = sorted({name.split(".")[0] for name in get_imported_modules("main")} & set(HEAVY_MODULES))
+    print(f"heavy modules imported by main: {', '.join(heavy) if heavy else 'none'}")
+    return cli <= target and not heavy
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measures how long the command line takes to start, and checks that PyVista/VTK and PyAnvilEditor aren't imported at startup")
+    parser.add_argument("--repeat", type=int, default=5, help="Number of runs of each command, keeping the median (default: 5)")
+    parser.add_argument("--target", type=float, default=TARGET_SECONDS, help=f"Startup time to stay under in seconds (default: {TARGET_SECONDS})")
+    args = parser.parse_args()
+
+    # exits with an error when the target is missed, so it can run in CI
+    raise SystemExit(0 if main(args.repeat, args.target) else 1)
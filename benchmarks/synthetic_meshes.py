@@ -0,0 +1,152 @@
+import argparse
+import numpy as np
+
+def sphere(triangle_count, seed=0):
+    """
+    Builds a UV sphere (a closed surface of evenly sized triangles)
+
+    Args:
+    - triangle_count (int): approximate number of triangles
+    - seed (int): unused, for the same signature as the other shapes
+
+    Returns:
+    - vertices (np.ndarray): (V, 3) array of vertex positions within the unit cube
+    - faces (np.ndarray): (F, 3) array of vertex indices of each triangle
+    """
+    rings = max(int(np.sqrt(triangle_count / 4)), 2)
+    segments = 2 * rings
+    theta = np.linspace(0, np.pi, rings + 1)[1:-1]
+    phi = np.linspace(0, 2 * np.pi, segments, endpoint=False)
+    theta, phi = np.meshgrid(theta, phi, indexing="ij")
+    vertices = np.stack((np.sin(theta) * np.cos(phi), np.sin(theta) * np.sin(phi), np.cos(theta)), axis=-1).reshape(-1, 3)
+    vertices = np.vstack((vertices, [[0, 0, 1], [0, 0, -1]])) * 0.5 + 0.5
+    north, south = len(vertices) - 2, len(vertices) - 1
+
+    ring = np.arange(rings - 1).reshape(-1, 1) * segments
+    a = ring + np.arange(segments)
+    b = ring + (np.arange(segments) + 1) % segments
+    bands = np.concatenate((np.stack((a[:-1], b[:-1], a[1:]), axis=-1), np.stack((b[:-1], b[1:], a[1:]), axis=-1))).reshape(-1, 3)
+    caps = np.concatenate((np.stack((np.full(segments, north), b[0], a[0]), axis=-1),
+                           np.stack((np.full(segments, south), a[-1], b[-1]), axis=-1)))
+    return vertices, np.vstack((bands, caps))
+
+def slivers(triangle_count, seed=0):
+    """
+    Builds randomly placed long, thin triangles (whose bounding boxes are mostly empty)
+
+    Args:
+    - triangle_count (int): number of triangles
+    - seed (int): random seed
+
+    Returns:
+    - vertices (np.ndarray): (V, 3) array of vertex positions within the unit cube
+    - faces (np.ndarray): (F, 3) array of vertex indices of each triangle
+    """
+    rng = np.random.default_rng(seed)
+    starts = rng.uniform(0, 1, (triangle_count, 3))
+    ends = rng.uniform(0, 1, (triangle_count, 3))
+    offsets = rng.normal(0, 1e-3, (triangle_count, 3))
+    vertices = np.stack((starts, ends, starts + offsets), axis=1).clip(0, 1).reshape(-1, 3)
+    return vertices, np.arange(len(vertices)).reshape(-1, 3)
+
+def flat(triangle_count, seed=0):
+    """
+    Builds a few huge triangles on slanted planes through the unit cube (few triangles, each covering many voxels)
+
+    Args:
+    - triangle_count (int): number of triangles
+    - seed (int): random seed
+
+    Returns:
+    - vertices (np.ndarray): (V, 3) array of vertex positions within the unit cube
+    - faces (np.ndarray): (F, 3) array of vertex indices of each triangle
+    """
+    rng = np.random.default_rng(seed)
+    # each triangle covers half of the unit square, on a random plane z = a + b * x + c * y
+    halves = np.array([[[0, 0], [1, 0], [0, 1]], [[1, 1], [0, 1], [1, 0]]], dtype=np.float64)
+    xy = halves[rng.integers(0, 2, triangle_count)]
+    a = rng.uniform(0.25, 0.75, (triangle_count, 1))
+    b, c = rng.uniform(-0.25, 0.25, (2, triangle_count, 1))
+    z = a + b * (xy[:, :, 0] - 0.5) + c * (xy[:, :, 1] - 0.5)
+    vertices = np.concatenate((xy, z[:, :, np.newaxis]), axis=-1).reshape(-1, 3)
+    return vertices, np.arange(len(vertices)).reshape(-1, 3)
+
+def scan(triangle_count, seed=0):
+    """
+    Builds a dense, noisy height field like a 3D scan of terrain (many tiny triangles)
+
+    Args:
+    - triangle_count (int): approximate number of triangles
+    - seed (int): random seed
+
+    Returns:
+    - vertices (np.ndarray): (V, 3) array of vertex positions within the unit cube
+    - faces (np.ndarray): (F, 3) array of vertex indices of each triangle
+    """
+    rng = np.random.default_rng(seed)
+    n = max(int(np.sqrt(triangle_count / 2)), 1) + 1
+    x, y = np.meshgrid(np.linspace(0, 1, n), np.linspace(0, 1, n), indexing="ij")
+    z = 0.5 + 0.2 * np.sin(6 * x) * np.cos(5 * y) + 0.05 * np.sin(40 * x + 30 * y) + rng.normal(0, 0.2 / n, x.shape)
+    vertices = np.stack((x, y, z.clip(0, 1)), axis=-1).reshape(-1, 3)
+
+    corner = (np.arange(n - 1).reshape(-1, 1) * n + np.arange(n - 1)).reshape(-1)
+    faces = np.concatenate((np.stack((corner, corner + n, corner + 1), axis=-1),
+                            np.stack((corner + 1, corner + n, corner + n + 1), axis=-1)))
+    return vertices, faces
+
+SHAPES = {"sphere": sphere, "slivers": slivers, "flat": flat, "scan": scan}
+
+def get_colors(vertices):
+    """
+    Colors vertices with a smooth gradient over their positions (so voxel colors vary like a textured model's)
+
+    Args:
+    - vertices (np.ndarray): (V, 3) array of vertex positions within the unit cube
+
+    Returns:
+    - np.ndarray: (V, 3) array of RGB values from 0 to 1
+    """
+    return np.stack((vertices[:, 0], 0.5 + 0.5 * np.sin(6 * vertices[:, 1]), vertices[:, 2] ** 2), axis=1)
+
+def write_obj(path, vertices, faces, scale=1.0):
+    """
+    Writes a mesh to an OBJ file, with vertex colors
+
+    Args:
+    - path (str): path to write to
+    - vertices (np.ndarray): (V, 3) array of vertex positions within the unit cube
+    - faces (np.ndarray): (F, 3) array of vertex indices of each triangle
+    - scale (float): size of the mesh (multiplies the vertex positions)
+    """
+    with open(path, "w") as f:
+        np.savetxt(f, np.hstack((vertices * scale, get_colors(vertices))), fmt="v %.6f %.6f %.6f %.4f %.4f %.4f")
+        np.savetxt(f, faces + 1, fmt="f %d %d %d")
+
+def generate(shape, triangle_count, path, seed=0, scale=1.0):
+    """
+    Generates a synthetic mesh and writes it to an OBJ file
+
+    Args:
+    - shape (str): one of SHAPES
+    - triangle_count (int): (approximate) number of triangles
+    - path (str): path to write to
+    - seed (int): random seed
+    - scale (float): size of the mesh
+
+    Returns:
+    - int: number of triangles written
+    """
+    vertices, faces = SHAPES[shape](triangle_count, seed)
+    write_obj(path, vertices, faces, scale)
+    return len(faces)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Writes synthetic colored meshes for benchmarking")
+    parser.add_argument("shape", type=str, choices=SHAPES, help="Shape of the mesh")
+    parser.add_argument("triangle_count", type=int, help="(Approximate) number of triangles")
+    parser.add_argument("path", type=str, help="Path of the OBJ file to write")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed (default: 0)")
+    parser.add_argument("--scale", type=float, default=1.0, help="Size of the mesh (default: 1, so voxel sizes like 0.01 give 100 voxels across)")
+    args = parser.parse_args()
+
+    print(f"wrote {generate(args.shape, args.triangle_count, args.path, args.seed, args.scale)} triangles to {args.path}")
@@ -0,0 +1,217 @@
+import io
+import os
+import sys
+import time
+import zlib
+import shutil
+import argparse
+import tempfile
+import numpy as np
+from pyanvileditor import nbt, world
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from average_block_colors import color_block_pairs
+from render import MinecraftWorldEditor
+
+DATA_VERSION = 1631 # minecraft 1.13.2, whose block states are packed across longs like MinecraftWorldEditor writes them
+GROUND_HEIGHT = 4 # the generated chunks are stone below this height, with a layer of grass on top
+
+def get_ground_states():
+    """
+    Packs the block states of a section of stone with a layer of grass on top (palette: air, stone, grass_block)
+
+    Returns:
+    - np.ndarray: (256,) array of signed 64 bit longs
+    """
+    heights = np.arange(4096) >> 8
+    states = np.where(heights < GROUND_HEIGHT, 1, np.where(heights == GROUND_HEIGHT, 2, 0))
+    return MinecraftWorldEditor._pack_block_states(states, 4)
+
+def make_chunk(chunk_x, chunk_z, ground_states):
+    """
+    Builds a chunk with a single section of ground, stored like a region file stores it
+
+    Args:
+    - chunk_x (int): chunk x coordinate
+    - chunk_z (int): chunk z coordinate
+    - ground_states (list): packed block states of the section (see get_ground_states)
+
+    Returns:
+    - bytes: 4 byte length, 1 byte compression type, then the compressed chunk
+    """
+    palette = [nbt.CompoundTag(children=[nbt.StringTag("minecraft:air", tag_name="Name")]),
+               nbt.CompoundTag(children=[nbt.StringTag("minecraft:stone", tag_name="Name")]),
+               nbt.CompoundTag(children=[nbt.StringTag("minecraft:grass_block", tag_name="Name"),
+                                         nbt.CompoundTag(tag_name="Properties", children=[nbt.StringTag("false", tag_name="snowy")])])]
+    section = nbt.CompoundTag(children=[
+        nbt.ByteTag(0, tag_name="Y"),
+        nbt.ListTag(nbt.CompoundTag.clazz_id, tag_name="Palette", children=palette),
+        nbt.LongArrayTag(tag_name="BlockStates", children=[nbt.LongTag(v) for v in ground_states]),
+        nbt.ByteArrayTag(tag_name="BlockLight", children=[nbt.ByteTag(0)] * 2048),
+        nbt.ByteArrayTag(tag_name="SkyLight", children=[nbt.ByteTag(-1)] * 2048)])
+    level = nbt.CompoundTag(tag_name="Level", children=[
+        nbt.IntTag(chunk_x, tag_name="xPos"),
+        nbt.IntTag(chunk_z, tag_name="zPos"),
+        nbt.IntArrayTag(tag_name="Biomes", children=[nbt.IntTag(1)] * 256),
+        nbt.ListTag(nbt.CompoundTag.clazz_id, tag_name="Sections", children=[section])])
+    root = nbt.CompoundTag(tag_name="", children=[nbt.IntTag(DATA_VERSION, tag_name="DataVersion"), level])
+    buffer = io.BytesIO()
+    root.serialize(buffer)
+    compressed = zlib.compress(buffer.getvalue())
+    return (len(compressed) + 1).to_bytes(4, byteorder="big") + bytes([2]) + compressed
+
+def generate_world(world_path, chunk_radius):
+    """
+    Writes a world of flat ground chunks around the origin, so it spans the four regions (and chunks) meeting there
+
+    Args:
+    - world_path (str): directory to write the world to
+    - chunk_radius (int): the chunks from -chunk_radius to chunk_radius - 1 are generated along x and z
+    """
+    ground_states = get_ground_states().tolist()
+    chunks = [(chunk_x, chunk_z) for chunk_x in range(-chunk_radius, chunk_radius) for chunk_z in range(-chunk_radius, chunk_radius)]
+    os.makedirs(os.path.join(world_path, "region"), exist_ok=True)
+    for region_x, region_z in {(chunk_x >> 5, chunk_z >> 5) for chunk_x, chunk_z in chunks}:
+        locations = np.zeros(1024, dtype=">u4")
+        body, sector = [], 2
+        for chunk_x, chunk_z in chunks:
+            if (chunk_x >> 5, chunk_z >> 5) != (region_x, region_z):
+                continue
+            payload = make_chunk(chunk_x, chunk_z, ground_states)
+            sector_count = -(-len(payload) // MinecraftWorldEditor.SECTOR_SIZE)
+            locations[(chunk_x & 31) + (chunk_z & 31) * 32] = (sector << 8) | sector_count
+            body.append(payload + bytes(sector_count * MinecraftWorldEditor.SECTOR_SIZE - len(payload)))
+            sector += sector_count
+        with open(os.path.join(world_path, "region", f"r.{region_x}.{region_z}.mca"), "wb") as region_file:
+            region_file.write(locations.tobytes() + bytes(MinecraftWorldEditor.SECTOR_SIZE) + b"".join(body))
+
+def get_structure(shape, palette_size, density, seed):
+    """
+    Builds a random block grid, with the stone and grass of the ground among its blocks
+
+    Args:
+    - shape (list): dimensions of the grid
+    - palette_size (int): number of blocks in the palette (besides air)
+    - density (float): fraction of the grid's cells holding a block
+    - seed (int): random seed
+
+    Returns:
+    - np.ndarray: 3D grid of indices into the palette (0 = no block)
+    - list: minecraft block names
+    """
+    block_names = ["stone", "grass_block"] + [name for name in dict.fromkeys(color_block_pairs.values()) if name not in ("stone", "grass_block")]
+    block_palette = ["air"] + block_names[:palette_size]
+    rng = np.random.default_rng(seed)
+    block_grid = rng.integers(1, len(block_palette), size=shape, dtype=np.uint8)
+    block_grid[rng.random(shape) >= density] = 0
+    return block_grid, block_palette
+
+def build_per_block(world_path, block_grid, block_palette, build_location):
+    """
+    Builds a structure the way it was built before MinecraftWorldEditor.write_blocks, one block at a time with pyanvileditor
+
+    Args:
+    - world_path (str): path to the minecraft world
+    - block_grid (np.ndarray): 3D grid of indices into block_palette (0 = no block)
+    - block_palette (list): minecraft block names
+    - build_location (list): the XYZ coords at which to build the structure
+    """
+    with world.World(world_path) as minecraft_world:
+        for x, y, z in np.argwhere(block_grid).tolist():
+            block = minecraft_world.get_block((x + build_location[0], y + build_location[1], z + build_location[2]))
+            block.set_state(world.BlockState(f"minecraft:{block_palette[block_grid[x, y, z]]}", {}))
+
+def get_section_blocks(world_path):
+    """
+    Reads the block state of every block of every section in a world
+
+    Args:
+    - world_path (str): path to the minecraft world
+
+    Returns:
+    - dict: (M,) array of each section's block states (name and properties) by region file, chunk index, and section y
+    """
+    sections = {}
+    region_dir = os.path.join(world_path, "region")
+    for region_name in sorted(os.listdir(region_dir)):
+        with open(os.path.join(region_dir, region_name), "rb") as region_file:
+            region_data = region_file.read()
+        locations = np.frombuffer(region_data, dtype=">u4", count=1024)
+        for chunk_index in np.flatnonzero(locations).tolist():
+            start = int(locations[chunk_index] >> 8) * MinecraftWorldEditor.SECTOR_SIZE
+            length = int.from_bytes(region_data[start:start + 4], byteorder="big")
+            chunk_nbt = MinecraftWorldEditor._decode_chunk(region_data[start:start + 4 + length])
+            for section in chunk_nbt.get("Level").get("Sections").children:
+                if not section.has("Palette"):
+                    continue
+                palette = []
+                for entry in section.get("Palette").children:
+                    properties = sorted((name, tag.get()) for name, tag in entry.get("Properties").children.items()) if entry.has("Properties") else []
+                    palette.append(entry.get("Name").get() + "".join(f"[{name}={value}]" for name, value in properties))
+                states = MinecraftWorldEditor._unpack_block_states(section.get("BlockStates").get())
+                sections[(region_name, chunk_index, section.get("Y").get())] = np.array(palette)[states]
+    return sections
+
+def compare_worlds(expected_path, actual_path):
+    """
+    Counts the blocks that differ between two worlds (a missing section is the same as one full of air)
+
+    Args:
+    - expected_path (str): path to the first minecraft world
+    - actual_path (str): path to the second minecraft world
+
+    Returns:
+    - int: number of sections compared
+    - int: number of blocks that differ
+    """
+    expected, actual = get_section_blocks(expected_path), get_section_blocks(actual_path)
+    air = np.full(4096, "minecraft:air")
+    keys = set(expected) | set(actual)
+    return len(keys), sum(int(np.count_nonzero(expected.get(key, air) != actual.get(key, air))) for key in keys)
+
+def main(shape, build_location, palette_size, density, seed):
+    """
+    Builds a random structure into copies of a generated world with MinecraftWorldEditor and with pyanvileditor one
+    block at a time, and asserts that the worlds end up with the same blocks
+
+    Args:
+    - shape (list): dimensions of the structure
+    - build_location (list): the XYZ coords at which to build the structure
+    - palette_size (int): number of blocks in the structure's palette (more than 16 needs more than 4 bits per block)
+    - density (float): fraction of the structure's cells holding a block
+    - seed (int): random seed
+
+    Raises:
+    - AssertionError: if the worlds' blocks differ
+    """
+    block_grid, block_palette = get_structure(shape, palette_size, density, seed)
+    # enough chunks around the origin for the structure, plus a chunk of margin
+    chunk_radius = max(-min(build_location[0], build_location[2]), max(build_location[0] + shape[0], build_location[2] + shape[2])) // 16 + 2
+    with tempfile.TemporaryDirectory() as work_dir:
+        expected_path, actual_path = os.path.join(work_dir, "per_block"), os.path.join(work_dir, "write_blocks")
+        generate_world(expected_path, chunk_radius)
+        shutil.copytree(expected_path, actual_path)
+
+        start_time = time.perf_counter()
+        build_per_block(expected_path, block_grid, block_palette, build_location)
+        print(f"per block (pyanvileditor): {time.perf_counter() - start_time:.2f}s")
+        start_time = time.perf_counter()
+        block_count = MinecraftWorldEditor(actual_path).build_structure(block_grid, block_palette, build_location)
+        print(f"build_structure:           {time.perf_counter() - start_time:.2f}s")
+
+        section_count, different = compare_worlds(expected_path, actual_path)
+        print(f"{block_count} blocks of {len(block_palette) - 1} kinds written, {section_count} sections compared, {different} blocks differ")
+        assert different == 0, f"{different} blocks differ between the worlds"
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Checks that MinecraftWorldEditor writes the same blocks as building one block at a time with pyanvileditor")
+    parser.add_argument("--shape", type=int, nargs=3, default=[40, 24, 40], metavar=("X", "Y", "Z"), help="Dimensions of the random structure (default: 40 24 40)")
+    parser.add_argument("--build-location", type=int, nargs=3, default=[-20, 2, -20], metavar=("X", "Y", "Z"), help="Where to build the structure, across the regions meeting at the origin (default: -20 2 -20)")
+    parser.add_argument("--palette-size", type=int, default=24, help="Number of different blocks in the structure, more than 16 for sections needing more than 4 bits per block (default: 24)")
+    parser.add_argument("--density", type=float, default=0.3, help="Fraction of the structure's cells holding a block (default: 0.3)")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed (default: 0)")
+    args = parser.parse_args()
+
+    # exits with an error (from the failed assert) when the worlds differ, so it can run in CI
+    main(args.shape, args.build_location, args.palette_size, args.density, args.seed)
@@ -0,0 +1,227 @@
+import os
+import json
+import time
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from input import ObjReader
+from color_lookup import ColorLookup
+from average_block_colors import color_block_pairs
+from render import MinecraftWorldEditor
+from voxelize import VoxelizerBase, VoxelizerMinecraft
+from dither import Dither
+from solid_fill import SolidFill
+
+# color lookup of each worker process, built once by _init_worker rather than once per model
+_color_lookup = None
+
+def _init_worker(color_metric, lut_bits, lut_cache_dir):
+    """
+    Builds the color lookup once in each worker process
+
+    Args:
+    - color_metric (str): how color distance is measured ("rgb" or "lab")
+    - lut_bits (int): bits per channel of the cached color lookup table (None = exact search)
+    - lut_cache_dir (str): directory the lookup table is cached in
+    """
+    global _color_lookup
+    _color_lookup = ColorLookup(list(color_block_pairs.keys()), color_metric, lut_bits, lut_cache_dir)
+
+def _voxelize_job(job, use_binary):
+    """
+    Voxelizes one model of a batch (runs in worker processes)
+
+    Args:
+    - job (dict): the model's settings from the manifest (see BatchRunner.OPTIONS)
+    - use_binary (bool): whether to load the model from (or save it to) a binary .m2m file next to it
+
+    Returns:
+    - positions (np.ndarray): (M, 3) int32 array of world coordinates of the model's blocks
+    - palette_ids (np.ndarray): (M,) array of indices into block_palette
+    - block_palette (list): minecraft block names
+    - stats (dict): number of faces, voxels, and seconds taken by each step
+    """
+    start_time = time.perf_counter()
+    if not os.path.isfile(job["model_path"]):
+        raise FileNotFoundError(f"Couldn't find file: {job['model_path']}")
+    model = ObjReader(job["model_path"], use_binary)
+    model.read_file()
+    read_time = time.perf_counter()
+
+    voxelizer = VoxelizerMinecraft(model, job["voxel_size"], _color_lookup, 1, job["sparse"], job["algorithm"],
+                                   color_mode=job["color_mode"])
+    voxelizer.voxelize()
+    if job["fill"]:
+        voxelizer.fill_interior()
+    hollowed = voxelizer.hollow(job["hollow"]) if job["hollow"] else 0
+    voxelizer.dither(job["dither"])
+    positions, palette_ids = MinecraftWorldEditor.get_blocks(voxelizer.block_grid, job["build_location"])
+    end_time = time.perf_counter()
+
+    stats = {"faces": len(model.faces), "voxels": len(positions), "hollowed": hollowed,
+             "read_seconds": read_time - start_time, "voxelize_seconds": end_time - read_time}
+    # blocks are sent back compactly rather than as grids, since they're all held until the world is written
+    return positions.astype(np.int32), palette_ids.astype(np.uint16), voxelizer.block_palette, stats
+
+class BatchRunner:
+    """
+    Voxelizes the models listed in a manifest across a process pool and builds them all in one minecraft world, which is
+    opened once and written region by region after every model is done
+    """
+
+    # settings each model can have, with the defaults used when neither the model nor the manifest's defaults give them
+    OPTIONS = {"voxel_size": None, "build_location": None, "algorithm": "sat", "fill": False, "hollow": None,
+               "sparse": False, "color_mode": "face", "dither": "none"}
+
+    def __init__(self, manifest_path, workers=1, color_metric="rgb", lut_bits=None, lut_cache_dir=None, use_binary=True):
+        """
+        Initializes BatchRunner
+
+        Args:
+        - manifest_path (str): path to a JSON (or YAML, if PyYAML is installed) manifest (see load_manifest)
+        - workers (int): number of models voxelized at once (each in its own process)
+        - color_metric (str): how color distance is measured when matching minecraft blocks ("rgb" or "lab")
+        - lut_bits (int): bits per channel of the cached color lookup table (None = exact search without table)
+        - lut_cache_dir (str): directory the lookup table is cached in
+        - use_binary (bool): whether to load the models from (or save them to) binary .m2m files next to them
+        """
+        self.manifest_path = manifest_path
+        self.workers = workers
+        self.color_metric = color_metric
+        self.lut_bits = lut_bits
+        self.lut_cache_dir = lut_cache_dir
+        self.use_binary = use_binary
+        self.world_path, self.jobs = self.load_manifest(manifest_path)
+
+    @staticmethod
+    def load_manifest(path):
+        """
+        Reads a manifest, which lists the world to build in and the models to build, ex.
+        {"world_path": "path/to/world", "defaults": {"voxel_size": 0.02},
+         "models": [{"model_path": "cow.obj", "build_location": [0, 70, 0]},
+                    {"model_path": "tree.obj", "voxel_size": 0.01, "build_location": [40, 70, 0], "fill": true}]}
+        (paths are relative to the manifest)
+
+        Args:
+        - path (str): path to a .json, .yaml, or .yml file
+
+        Returns:
+        - world_path (str): path to the minecraft world
+        - jobs (list): settings of each model (see OPTIONS), with the defaults filled in
+
+        Raises:
+        - ValueError: if the manifest is missing the world or a model's path, voxel size, or build location, or has
+        invalid settings
+        """
+        with open(path) as f:
+            if path.lower().endswith((".yaml", ".yml")):
+                try:
+                    import yaml # optional, and only imported for YAML manifests to keep startup fast
+                except ImportError:
+                    raise ValueError("PyYAML must be installed to read YAML manifests (pip install pyyaml), or use JSON")
+                manifest = yaml.safe_load(f)
+            else:
+                manifest = json.load(f)
+
+        base_dir = os.path.dirname(os.path.abspath(path))
+        if not manifest.get("world_path"):
+            raise ValueError("Manifest must give world_path")
+        world_path = os.path.join(base_dir, manifest["world_path"])
+        defaults = {**BatchRunner.OPTIONS, **manifest.get("defaults", {})}
+
+        jobs = []
+        for n, model in enumerate(manifest.get("models", [])):
+            job = {**defaults, **model}
+            unknown = set(job) - set(BatchRunner.OPTIONS) - {"model_path"}
+            if unknown:
+                raise ValueError(f"Model {n} has unknown settings: {', '.join(sorted(unknown))}")
+            if not job.get("model_path") or job["voxel_size"] is None or job["build_location"] is None:
+                raise ValueError(f"Model {n} must give model_path, voxel_size, and build_location (or have them in defaults)")
+            if job["voxel_size"] <= 0:
+                raise ValueError(f"Model {n}: voxel size must be > 0")
+            if len(job["build_location"]) != 3:
+                raise ValueError(f"Model {n}: build location must be [x, y, z]")
+            if job["algorithm"] not in VoxelizerBase.ALGORITHMS or job["color_mode"] not in VoxelizerBase.COLOR_MODES \
+                    or job["dither"] not in Dither.MODES or job["hollow"] not in (None, *SolidFill.SHELL_CONNECTIVITIES):
+                raise ValueError(f"Model {n} has an invalid algorithm, color_mode, dither, or hollow")
+            if job["fill"] and job["sparse"]:
+                raise ValueError(f"Model {n}: fill can't be combined with sparse (a filled model isn't sparse)")
+            job["model_path"] = os.path.join(base_dir, job["model_path"])
+            job["build_location"] = [int(coordinate) for coordinate in job["build_location"]]
+            jobs.append(job)
+        return world_path, jobs
+
+    def run(self, report_path=None):
+        """
+        Voxelizes every model and builds them all in the world, printing (and optionally saving) a throughput report
+
+        Args:
+        - report_path (str): path of a JSON file to write the report to (None = only print it)
+
+        Returns:
+        - dict: time and counts of each model and of the whole batch (models that failed have an "error" instead)
+        """
+        start_time = time.perf_counter()
+        init_args = (self.color_metric, self.lut_bits, self.lut_cache_dir)
+        results = [None] * len(self.jobs)
+        reports = [{"model_path": job["model_path"], "voxel_size": job["voxel_size"]} for job in self.jobs]
+
+        def collect(n, get_result):
+            try:
+                results[n] = get_result()
+                reports[n].update(results[n][3])
+                print(f"[{n + 1}/{len(self.jobs)}] {self.jobs[n]['model_path']}: {results[n][3]['voxels']} voxels")
+            except Exception as e: # one bad model shouldn't stop the rest of the batch
+                reports[n]["error"] = str(e)
+                print(f"[{n + 1}/{len(self.jobs)}] {self.jobs[n]['model_path']}: Error: {e}")
+
+        if self.workers > 1:
+            with ProcessPoolExecutor(self.workers, initializer=_init_worker, initargs=init_args) as executor:
+                futures = [executor.submit(_voxelize_job, job, self.use_binary) for job in self.jobs]
+                for n, future in enumerate(futures):
+                    collect(n, future.result)
+        else:
+            _init_worker(*init_args)
+            for n, job in enumerate(self.jobs):
+                collect(n, lambda: _voxelize_job(job, self.use_binary))
+        voxelize_time = time.perf_counter()
+
+        # a single writer opens the world once, and writes the blocks of every model region by region (in manifest order
+        # where models overlap)
+        print("writing world")
+        structures = [result[:3] for result in results if result is not None]
+        blocks_written = 0
+        write_error = None
+        try:
+            blocks_written = MinecraftWorldEditor(self.world_path).write_blocks(structures) if structures else 0
+        except (OSError, ValueError) as e:
+            write_error = str(e)
+            print(f"Error: {e}")
+        end_time = time.perf_counter()
+
+        done = [report for report in reports if "error" not in report]
+        total_seconds = end_time - start_time
+        report = {
+            "models": reports,
+            "succeeded": len(done),
+            "failed": len(reports) - len(done),
+            "workers": self.workers,
+            "faces": sum(report["faces"] for report in done),
+            "voxels": sum(report["voxels"] for report in done),
+            "hollowed": sum(report["hollowed"] for report in done),
+            "blocks_written": blocks_written,
+            "write_error": write_error,
+            "voxelize_seconds": voxelize_time - start_time,
+            "write_seconds": end_time - voxelize_time,
+            "total_seconds": total_seconds,
+            "models_per_second": len(done) / total_seconds,
+            "faces_per_second": sum(report["faces"] for report in done) / total_seconds,
+            "blocks_per_second": blocks_written / total_seconds,
+        }
+        print(f"{len(done)} of {len(reports)} models built in {total_seconds:.2f}s "
+              f"(voxelizing {report['voxelize_seconds']:.2f}s, writing {report['write_seconds']:.2f}s): "
+              f"{report['faces_per_second']:.0f} faces/s, {report['blocks_per_second']:.0f} blocks/s")
+        if report_path:
+            with open(report_path, "w") as f:
+                json.dump(report, f, indent=2)
+            print(f"report written to {report_path}")
+        return report
@@ -0,0 +1,230 @@
+import numpy as np
+
+class ChunkedGrid:
+    """Sparse 3D grid made of 16x16x16 chunks (like minecraft sections) which are only allocated once written to"""
+
+    CHUNK_BITS = 4
+    CHUNK_SIZE = 1 << CHUNK_BITS
+    CHUNK_MASK = CHUNK_SIZE - 1
+
+    def __init__(self, shape, dtype):
+        """
+        Initializes ChunkedGrid
+
+        Args:
+        - shape (list): grid dimensions, where any dimensions after the first three are stored per cell (ex. [x, y, z, 3] for RGB)
+        - dtype (np.dtype): data type of the cells (empty cells are None for object grids, 0 otherwise)
+        """
+        self.shape = tuple(int(n) for n in shape)
+        self.dtype = np.dtype(dtype)
+        self.cell_shape = self.shape[3:]
+        self.fill_value = None if self.dtype == object else 0
+        self.chunks = {} # maps (chunk x, chunk y, chunk z) to a dense chunk array
+
+    @property
+    def nbytes(self):
+        """Total number of bytes used by the allocated chunks"""
+        return sum(chunk.nbytes for chunk in self.chunks.values())
+
+    def __getitem__(self, index):
+        """
+        Gets the values of the cells at the given indices (cells in unallocated chunks are empty)
+
+        Args:
+        - index (tuple): x, y, and z indices (ints or equally sized int arrays)
+
+        Returns:
+        - np.ndarray: values of the cells (or a single value if the indices were ints)
+        """
+        x, y, z = (np.atleast_1d(np.asarray(i, dtype=np.int64)) for i in index)
+        values = np.full((len(x),) + self.cell_shape, self.fill_value, dtype=self.dtype)
+        for key, cells in self._group_by_chunk(x, y, z):
+            chunk = self.chunks.get(key)
+            if chunk is not None:
+                values[cells] = chunk[x[cells] & self.CHUNK_MASK, y[cells] & self.CHUNK_MASK, z[cells] & self.CHUNK_MASK]
+        return values if np.ndim(index[0]) else values[0]
+
+    def __setitem__(self, index, values):
+        """
+        Sets the values of the cells at the given indices, allocating any chunks that haven't been yet
+
+        Args:
+        - index (tuple): x, y, and z indices (ints or equally sized int arrays)
+        - values: value for every cell, or array with a value for each cell
+        """
+        x, y, z = (np.atleast_1d(np.asarray(i, dtype=np.int64)) for i in index)
+        values = np.broadcast_to(np.asarray(values, dtype=self.dtype), (len(x),) + self.cell_shape)
+        for key, cells in self._group_by_chunk(x, y, z):
+            chunk = self.chunks.get(key)
+            if chunk is None:
+                chunk = self.chunks[key] = np.full((self.CHUNK_SIZE,) * 3 + self.cell_shape, self.fill_value, dtype=self.dtype)
+            chunk[x[cells] & self.CHUNK_MASK, y[cells] & self.CHUNK_MASK, z[cells] & self.CHUNK_MASK] = values[cells]
+
+    def _group_by_chunk(self, x, y, z):
+        """
+        Groups cell indices by the chunk they fall in
+
+        Args:
+        - x (np.ndarray): x indices
+        - y (np.ndarray): y indices
+        - z (np.ndarray): z indices
+
+        Returns:
+        - generator: (chunk key, array of positions in x/y/z of the cells in that chunk) pairs
+        """
+        chunk_counts = [-(-n // self.CHUNK_SIZE) for n in self.shape[:3]]
+        keys = ((x >> self.CHUNK_BITS) * chunk_counts[1] + (y >> self.CHUNK_BITS)) * chunk_counts[2] + (z >> self.CHUNK_BITS)
+        order = np.argsort(keys, kind="stable")
+        boundaries = np.flatnonzero(np.diff(keys[order])) + 1
+        for cells in np.split(order, boundaries):
+            if len(cells):
+                first = cells[0]
+                yield (int(x[first] >> self.CHUNK_BITS), int(y[first] >> self.CHUNK_BITS), int(z[first] >> self.CHUNK_BITS)), cells
+
+    def argwhere(self):
+        """
+        Gets the indices of every non-empty cell
+
+        Returns:
+        - np.ndarray: (M, 3) array of x, y, and z indices
+        """
+        indices = [np.empty((0, 3), dtype=np.int64)]
+        for (cx, cy, cz), chunk in self.chunks.items():
+            indices.append(np.argwhere(self._get_filled(chunk)) + np.array([cx, cy, cz]) * self.CHUNK_SIZE)
+        return np.concatenate(indices)
+
+    def _get_filled(self, cells):
+        """
+        Finds the non-empty cells of part of a chunk
+
+        Args:
+        - cells (np.ndarray): part of a chunk array
+
+        Returns:
+        - np.ndarray: bool array over the first three dimensions of cells
+        """
+        filled = cells != self.fill_value if self.dtype == object else cells.astype(bool)
+        return filled.reshape(filled.shape[:3] + (-1,)).any(axis=3) if self.cell_shape else filled
+
+    def query_box(self, box_min, box_max):
+        """
+        Gets the indices and values of the non-empty cells within a box, only reading the chunks overlapping it
+
+        Args:
+        - box_min (list): minimum indices of the box (inclusive)
+        - box_max (list): maximum indices of the box (inclusive)
+
+        Returns:
+        - np.ndarray: (M, 3) array of x, y, and z indices
+        - np.ndarray: values of the cells
+        """
+        indices, values = [np.empty((0, 3), dtype=np.int64)], [np.empty((0,) + self.cell_shape, dtype=self.dtype)]
+        for key, chunk in self.chunks.items():
+            chunk_min = np.array(key) * self.CHUNK_SIZE
+            low, high = np.maximum(np.subtract(box_min, chunk_min), 0), np.minimum(np.subtract(box_max, chunk_min), self.CHUNK_MASK)
+            if (low > high).any():
+                continue
+            cells = chunk[low[0]:high[0] + 1, low[1]:high[1] + 1, low[2]:high[2] + 1]
+            found = np.argwhere(self._get_filled(cells))
+            indices.append(found + low + chunk_min)
+            values.append(cells[found[:, 0], found[:, 1], found[:, 2]])
+        return np.concatenate(indices), np.concatenate(values)
+
+    def iter_batches(self, batch_size):
+        """
+        Streams the indices and values of the non-empty cells a group of chunks at a time
+
+        Args:
+        - batch_size (int): number of cells read at a time (at least one chunk)
+
+        Returns:
+        - generator: (M, 3) indices and values of the cells of each group of chunks
+        """
+        keys = sorted(self.chunks)
+        group_size = max(batch_size // self.CHUNK_SIZE ** 3, 1)
+        for start in range(0, len(keys), group_size):
+            indices, values = [np.empty((0, 3), dtype=np.int64)], [np.empty((0,) + self.cell_shape, dtype=self.dtype)]
+            for key in keys[start:start + group_size]:
+                chunk = self.chunks[key]
+                found = np.argwhere(self._get_filled(chunk))
+                indices.append(found + np.array(key) * self.CHUNK_SIZE)
+                values.append(chunk[found[:, 0], found[:, 1], found[:, 2]])
+            yield np.concatenate(indices), np.concatenate(values)
+
+    def to_dense(self):
+        """
+        Converts the grid to a regular NumPy array
+
+        Returns:
+        - np.ndarray: dense array with the grid's shape and dtype
+        """
+        dense = np.full(self.shape, self.fill_value, dtype=self.dtype)
+        for (cx, cy, cz), chunk in self.chunks.items():
+            x, y, z = cx * self.CHUNK_SIZE, cy * self.CHUNK_SIZE, cz * self.CHUNK_SIZE
+            dense[x:x + self.CHUNK_SIZE, y:y + self.CHUNK_SIZE, z:z + self.CHUNK_SIZE] = \
+                chunk[:self.shape[0] - x, :self.shape[1] - y, :self.shape[2] - z]
+        return dense
+
+def argwhere(grid):
+    """
+    Gets the indices of every non-empty cell of a dense, chunked, or octree grid
+
+    Args:
+    - grid (np.ndarray, ChunkedGrid, or OctreeGrid): grid of voxels, colors, or block palette indices
+
+    Returns:
+    - np.ndarray: (M, 3) array of x, y, and z indices
+    """
+    if not isinstance(grid, np.ndarray):
+        return grid.argwhere()
+    if grid.ndim > 3:
+        grid = grid.reshape(grid.shape[:3] + (-1,)).any(axis=3)
+    return np.argwhere(grid)
+
+def query_box(grid, box_min, box_max):
+    """
+    Gets the indices and values of the non-empty cells of a dense, chunked, or octree grid within a box
+
+    Args:
+    - grid (np.ndarray, ChunkedGrid, or OctreeGrid): grid of voxels, colors, or block palette indices
+    - box_min (list): minimum indices of the box (inclusive)
+    - box_max (list): maximum indices of the box (inclusive)
+
+    Returns:
+    - np.ndarray: (M, 3) array of x, y, and z indices
+    - np.ndarray: values of the cells
+    """
+    if not isinstance(grid, np.ndarray):
+        return grid.query_box(box_min, box_max)
+    box_min = np.maximum(np.asarray(box_min, dtype=np.int64), 0)
+    cells = grid[box_min[0]:box_max[0] + 1, box_min[1]:box_max[1] + 1, box_min[2]:box_max[2] + 1]
+    found = argwhere(cells)
+    return found + box_min, cells[found[:, 0], found[:, 1], found[:, 2]]
+
+def iter_batches(grid, batch_size):
+    """
+    Streams the indices and values of the non-empty cells of a dense, chunked, or octree grid in batches, so that the 
+    indices of every cell never have to be held at once (each batch's cells are near each other: slabs of a dense grid, 
+    groups of chunks, or runs of an octree's leaves in Morton order)
+
+    Args:
+    - grid (np.ndarray, ChunkedGrid, or OctreeGrid): grid of voxels, colors, or block palette indices
+    - batch_size (int): approximate number of cells in each batch
+
+    Returns:
+    - generator: (M, 3) indices and values of each batch's cells
+    """
+    if not isinstance(grid, np.ndarray):
+        yield from grid.iter_batches(batch_size)
+        return
+    # slabs of whole layers along x, each holding about batch_size non-empty cells
+    layers = grid.reshape(grid.shape[0], -1, int(np.prod(grid.shape[3:], dtype=np.int64)))
+    cumulative_counts = np.cumsum([np.count_nonzero(layer.any(axis=1)) for layer in layers])
+    start = 0
+    while start < grid.shape[0]:
+        counted = cumulative_counts[start - 1] if start else 0
+        stop = max(int(np.searchsorted(cumulative_counts, counted + batch_size, side="right")), start + 1)
+        cells = grid[start:stop]
+        found = argwhere(cells)
+        yield found + np.array([start, 0, 0]), cells[found[:, 0], found[:, 1], found[:, 2]]
+        start = stop
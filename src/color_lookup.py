@@ -0,0 +1,173 @@
+import os
+import hashlib
+import numpy as np
+
+class ColorLookup:
+    """Class for matching many colors at once to their nearest color in a small palette"""
+
+    METRICS = ("rgb", "lab")
+    CHUNK_SIZE = 1 << 13 # number of colors compared against the whole palette at a time
+
+    def __init__(self, palette, metric="rgb", lut_bits=None, cache_dir=None):
+        """
+        Initializes ColorLookup
+
+        Args:
+        - palette (list): list of RGB tuples (0-255) to match colors against
+        - metric (str): "rgb" for Euclidean RGB distance, or "lab" for CIELAB distance (CIE76 delta E)
+        - lut_bits (int): if given, bits per channel of a precomputed lookup table (8 = exact, fewer = smaller but approximate)
+        - cache_dir (str): directory to save/load lookup tables in so they are only computed once
+
+        Raises:
+        - ValueError: if palette is empty, metric is unknown, or lut_bits isn't within 1-8
+        """
+        if not palette:
+            raise ValueError("Invalid input, palette can't be empty")
+        if metric not in self.METRICS:
+            raise ValueError(f"Invalid metric, must be one of: {', '.join(self.METRICS)}")
+        if lut_bits is not None and not 1 <= lut_bits <= 8:
+            raise ValueError("Invalid lut_bits, must be within 1-8")
+
+        self.palette = np.array(palette, dtype=np.uint8)
+        self.metric = metric
+        self.lut_bits = lut_bits
+        self.cache_dir = cache_dir
+        self.palette_coords = self.to_metric_space(self.palette)
+        self.lut = self.load_lut() if lut_bits else None
+
+    def get_nearest_indices(self, colors):
+        """
+        Finds the nearest palette color for each of the given colors
+
+        Args:
+        - colors (np.ndarray): (M, 3) array of RGB values (0-255)
+
+        Returns:
+        - np.ndarray: (M,) array of indices into the palette
+        """
+        colors = np.asarray(colors, dtype=np.uint8).reshape(-1, 3)
+
+        if self.lut is not None:
+            quantized = (colors >> (8 - self.lut_bits)).astype(np.int64)
+            return self.lut[(quantized[:, 0] << (2 * self.lut_bits)) | (quantized[:, 1] << self.lut_bits) | quantized[:, 2]]
+
+        # voxel colors repeat heavily, so only search for each distinct color once
+        unique_colors, inverse = np.unique(self.pack(colors), return_inverse=True)
+        return self.search(self.unpack(unique_colors))[inverse.reshape(-1)]
+
+    def search(self, colors):
+        """
+        Exhaustively compares colors against every palette color (ties go to the earliest palette color)
+
+        Args:
+        - colors (np.ndarray): (M, 3) array of RGB values (0-255)
+
+        Returns:
+        - np.ndarray: (M,) array of indices into the palette
+        """
+        index_dtype = np.uint8 if len(self.palette) <= 256 else np.uint16
+        nearest = np.empty(len(colors), dtype=index_dtype)
+        for start in range(0, len(colors), self.CHUNK_SIZE):
+            coords = self.to_metric_space(colors[start:start + self.CHUNK_SIZE])
+            differences = coords[:, np.newaxis, :] - self.palette_coords[np.newaxis, :, :]
+            nearest[start:start + self.CHUNK_SIZE] = np.einsum("ijk,ijk->ij", differences, differences).argmin(axis=1)
+        return nearest
+
+    def to_metric_space(self, colors):
+        """
+        Converts RGB colors into the coordinates that distances are measured in
+
+        Args:
+        - colors (np.ndarray): (M, 3) array of RGB values (0-255)
+
+        Returns:
+        - np.ndarray: (M, 3) array of coordinates (integers for "rgb", so distances are exact)
+        """
+        if self.metric == "rgb":
+            return colors.astype(np.int32)
+        return self.rgb_to_lab(colors)
+
+    @staticmethod
+    def rgb_to_lab(colors):
+        """
+        Converts sRGB colors to CIELAB (D65 white point)
+
+        Args:
+        - colors (np.ndarray): (M, 3) array of RGB values (0-255)
+
+        Returns:
+        - np.ndarray: (M, 3) array of L*, a*, b* values
+        """
+        rgb = colors.astype(np.float64) / 255
+        linear = np.where(rgb > 0.04045, ((rgb + 0.055) / 1.055) ** 2.4, rgb / 12.92)
+        xyz = linear @ np.array([
+            [0.4124564, 0.2126729, 0.0193339],
+            [0.3575761, 0.7151522, 0.1191920],
+            [0.1804375, 0.0721750, 0.9503041]])
+        xyz /= np.array([0.95047, 1.0, 1.08883])
+        f = np.where(xyz > (6 / 29) ** 3, np.cbrt(xyz), xyz / (3 * (6 / 29) ** 2) + 4 / 29)
+        return np.stack((116 * f[:, 1] - 16, 500 * (f[:, 0] - f[:, 1]), 200 * (f[:, 1] - f[:, 2])), axis=1)
+
+    def load_lut(self):
+        """
+        Loads the lookup table from the cache directory, or builds it (and caches it if a directory was given)
+
+        Returns:
+        - np.ndarray: (2 ** (3 * lut_bits),) array of palette indices for each quantized color
+        """
+        cache_path = None
+        if self.cache_dir:
+            palette_hash = hashlib.sha1(self.palette.tobytes()).hexdigest()[:16]
+            cache_path = os.path.join(self.cache_dir, f"lut_{self.metric}_{self.lut_bits}_{palette_hash}.npy")
+            if os.path.exists(cache_path):
+                return np.load(cache_path)
+
+        lut = self.build_lut()
+        if cache_path:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            np.save(cache_path, lut)
+        return lut
+
+    def build_lut(self):
+        """
+        Builds the lookup table by searching for the nearest palette color of each quantization bin's center
+
+        Returns:
+        - np.ndarray: (2 ** (3 * lut_bits),) array of palette indices for each quantized color
+        """
+        shift = 8 - self.lut_bits
+        levels = (np.arange(1 << self.lut_bits, dtype=np.uint32) << shift) + ((1 << shift) >> 1)
+        bins = np.arange(1 << (3 * self.lut_bits), dtype=np.uint32)
+        mask = (1 << self.lut_bits) - 1
+        centers = np.stack((
+            levels[bins >> (2 * self.lut_bits)],
+            levels[(bins >> self.lut_bits) & mask],
+            levels[bins & mask]), axis=1).astype(np.uint8)
+        return self.search(centers)
+
+    @staticmethod
+    def pack(colors):
+        """
+        Packs RGB colors into single 24 bit integers
+
+        Args:
+        - colors (np.ndarray): (M, 3) array of RGB values (0-255)
+
+        Returns:
+        - np.ndarray: (M,) array of packed colors
+        """
+        colors = colors.astype(np.uint32)
+        return (colors[:, 0] << 16) | (colors[:, 1] << 8) | colors[:, 2]
+
+    @staticmethod
+    def unpack(packed):
+        """
+        Unpacks 24 bit integers into RGB colors
+
+        Args:
+        - packed (np.ndarray): (M,) array of packed colors
+
+        Returns:
+        - np.ndarray: (M, 3) array of RGB values (0-255)
+        """
+        return np.stack(((packed >> 16) & 255, (packed >> 8) & 255, packed & 255), axis=1).astype(np.uint8)
@@ -0,0 +1,143 @@
+import numpy as np
+
+class Dither:
+    """Matches voxel colors to minecraft blocks with 3D ordered dithering or error diffusion, to avoid banding on gradients"""
+
+    MODES = ("none", "bayer", "floyd-steinberg")
+    BAYER_BITS = 2 # the ordered dither repeats every 2^BAYER_BITS voxels along each axis (4x4x4 = 64 thresholds)
+    # order of the 8 voxels of a 2x2x2 cube, where each consecutive pair is diagonally opposite (so thresholds spread evenly)
+    BAYER_BASE = np.array([[[0, 3], [5, 6]], [[7, 4], [2, 1]]])
+    # the pattern is shifted for the green and blue channels, so the channels aren't all offset the same way at once
+    CHANNEL_SHIFTS = np.array([[0, 0, 0], [1, 0, 1], [0, 1, 1]])
+    SPREAD_SCALE = 4 # offsets span this many times the typical spacing of the palette (best on gradients in testing)
+    # forward neighbors which receive a voxel's error (the 3 face neighbors get twice the share of the 3 edge neighbors), all
+    # later than the voxel in the sweep over x + y + z
+    DIFFUSION_OFFSETS = np.array([[1, 0, 0], [0, 1, 0], [0, 0, 1], [1, 1, 0], [1, 0, 1], [0, 1, 1]])
+    DIFFUSION_WEIGHTS = np.array([2, 2, 2, 1, 1, 1], dtype=np.float64)
+
+    @staticmethod
+    def get_block_indices(mode, positions, colors, color_lookup):
+        """
+        Matches voxel colors to palette colors with the given dithering mode
+
+        Args:
+        - mode (str): one of MODES
+        - positions (np.ndarray): (M, 3) array of each voxel's position (world positions keep tiles aligned)
+        - colors (np.ndarray): (M, 3) array of each voxel's RGB color (0-255)
+        - color_lookup (ColorLookup): for finding the nearest palette colors
+
+        Returns:
+        - np.ndarray: (M,) array of indices into the palette
+        """
+        if mode == "bayer":
+            return Dither.ordered(positions, colors, color_lookup)
+        if mode == "floyd-steinberg":
+            return Dither.error_diffusion(positions, colors, color_lookup)
+        return color_lookup.get_nearest_indices(colors)
+
+    @staticmethod
+    def get_bayer_thresholds(positions):
+        """
+        Gets each voxel's threshold from a 3D Bayer matrix tiled over the grid, computed directly from the bits of the
+        positions (the lowest bits choose the most significant part of the threshold)
+
+        Args:
+        - positions (np.ndarray): (M, 3) array of voxel positions
+
+        Returns:
+        - np.ndarray: (M,) array of thresholds from -0.5 to 0.5
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        values = np.zeros(len(positions), dtype=np.int64)
+        for bit in range(Dither.BAYER_BITS):
+            x, y, z = ((positions >> bit) & 1).T
+            values += Dither.BAYER_BASE[x, y, z] << (3 * (Dither.BAYER_BITS - 1 - bit))
+        return (values + 0.5) / (1 << (3 * Dither.BAYER_BITS)) - 0.5
+
+    @staticmethod
+    def get_spread(palette):
+        """
+        Gets how far colors are offset by the ordered dither, from the typical distance between neighboring palette colors
+
+        Args:
+        - palette (np.ndarray): (P, 3) array of palette colors
+
+        Returns:
+        - float: SPREAD_SCALE times the median distance from each palette color to its nearest other palette color
+        """
+        palette = np.asarray(palette, dtype=np.float64)
+        distances = np.linalg.norm(palette[:, np.newaxis] - palette[np.newaxis], axis=-1)
+        np.fill_diagonal(distances, np.inf)
+        return Dither.SPREAD_SCALE * float(np.median(distances.min(axis=1))) if len(palette) > 1 else 0.0
+
+    @staticmethod
+    def ordered(positions, colors, color_lookup):
+        """
+        Ordered dithering: offsets each voxel's color by its Bayer threshold (scaled to the palette's spacing) before finding
+        the nearest palette color, all in one vectorized pass
+
+        Args:
+        - positions (np.ndarray): (M, 3) array of voxel positions
+        - colors (np.ndarray): (M, 3) array of RGB colors (0-255)
+        - color_lookup (ColorLookup): for finding the nearest palette colors
+
+        Returns:
+        - np.ndarray: (M,) array of indices into the palette
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        thresholds = np.stack([Dither.get_bayer_thresholds(positions + shift) for shift in Dither.CHANNEL_SHIFTS], axis=1)
+        dithered = np.round(colors + thresholds * Dither.get_spread(color_lookup.palette)).clip(0, 255).astype(np.uint8)
+        return color_lookup.get_nearest_indices(dithered)
+
+    @staticmethod
+    def error_diffusion(positions, colors, color_lookup):
+        """
+        Floyd-Steinberg style error diffusion in 3D: voxels are matched in wavefronts of equal x + y + z, and each voxel's
+        error (its color minus its palette color) is split among its present forward neighbors, which are all in later
+        wavefronts. Each wavefront is matched in one vectorized step, so there is one step per diagonal slice of the grid
+        rather than one per voxel
+
+        Args:
+        - positions (np.ndarray): (M, 3) array of voxel positions
+        - colors (np.ndarray): (M, 3) array of RGB colors (0-255)
+        - color_lookup (ColorLookup): for finding the nearest palette colors
+
+        Returns:
+        - np.ndarray: (M,) array of indices into the palette
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        block_indices = np.zeros(len(positions), dtype=np.int64)
+        if not len(positions):
+            return block_indices
+
+        # find each voxel's forward neighbors by searching the sorted keys of the voxels (-1 = not present)
+        low = positions.min(axis=0)
+        shape = positions.max(axis=0) - low + 2
+        keys = np.ravel_multi_index((positions - low).T, shape)
+        order = np.argsort(keys)
+        sorted_keys = keys[order]
+        neighbors = np.empty((len(positions), len(Dither.DIFFUSION_OFFSETS)), dtype=np.int64)
+        for k, offset in enumerate(Dither.DIFFUSION_OFFSETS):
+            neighbor_keys = np.ravel_multi_index((positions - low + offset).T, shape)
+            found = np.minimum(np.searchsorted(sorted_keys, neighbor_keys), len(keys) - 1)
+            neighbors[:, k] = np.where(sorted_keys[found] == neighbor_keys, order[found], -1)
+
+        # each voxel's error is shared among the neighbors that are present
+        weights = np.where(neighbors >= 0, Dither.DIFFUSION_WEIGHTS, 0)
+        totals = weights.sum(axis=1, keepdims=True)
+        weights = np.divide(weights, totals, out=np.zeros_like(weights), where=totals > 0)
+
+        palette = color_lookup.palette.astype(np.float64)
+        errors = np.zeros((len(positions), 3))
+        wavefronts = positions.sum(axis=1)
+        sweep = np.argsort(wavefronts, kind="stable")
+        starts = np.flatnonzero(np.diff(wavefronts[sweep], prepend=wavefronts[sweep[0]] - 1))
+        for ids in np.split(sweep, starts[1:]):
+            wanted = (colors[ids] + errors[ids]).clip(0, 255)
+            block_indices[ids] = color_lookup.get_nearest_indices(np.round(wanted).astype(np.uint8))
+            error = wanted - palette[block_indices[ids]]
+            targets = neighbors[ids]
+            present = targets >= 0
+            shares = weights[ids][present][:, np.newaxis] * np.repeat(error, present.sum(axis=1), axis=0)
+            np.add.at(errors, targets[present], shares)
+        return block_indices
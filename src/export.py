@@ -0,0 +1,406 @@
+import os
+import gzip
+import time
+import struct
+import numpy as np
+from chunked_grid import iter_batches, query_box
+
+class NBTWriter:
+    """Streams NBT tags to a binary file (ex. a gzip file), writing large arrays straight from NumPy"""
+
+    END, BYTE, SHORT, INT, LONG, BYTE_ARRAY, STRING, LIST, COMPOUND, INT_ARRAY, LONG_ARRAY = 0, 1, 2, 3, 4, 7, 8, 9, 10, 11, 12
+
+    def __init__(self, file):
+        """
+        Initializes NBTWriter
+
+        Args:
+        - file (file object): binary file to write to
+        """
+        self.file = file
+
+    @staticmethod
+    def get_header(tag_type, name):
+        """
+        Gets the bytes that start a named tag
+
+        Args:
+        - tag_type (int): type of the tag (ex. NBTWriter.INT)
+        - name (str): name of the tag
+
+        Returns:
+        - bytes: the tag type, then the length of the name and the name itself
+        """
+        encoded = name.encode()
+        return struct.pack(">bH", tag_type, len(encoded)) + encoded
+
+    def begin_compound(self, name):
+        """
+        Starts a compound, whose tags are written afterwards by the caller and closed with end_compound
+
+        Args:
+        - name (str): name of the compound
+        """
+        self.file.write(self.get_header(self.COMPOUND, name))
+
+    def end_compound(self):
+        """
+        Ends the compound (or list element) being written with an end tag
+        """
+        self.file.write(bytes([self.END]))
+
+    def begin_list(self, name, element_type, length):
+        """
+        Starts a list, whose elements (payloads without names, ex. a compound's tags followed by end_compound) are written
+        afterwards by the caller
+
+        Args:
+        - name (str): name of the list
+        - element_type (int): type of the elements
+        - length (int): number of elements
+        """
+        self.file.write(self.get_header(self.LIST, name) + struct.pack(">bi", element_type, length))
+
+    def write_short(self, name, value):
+        """
+        Writes a short tag (a 16 bit signed int, ex. a schematic's width)
+
+        Args:
+        - name (str): name of the tag
+        - value (int): value of the tag
+        """
+        self.file.write(self.get_header(self.SHORT, name) + struct.pack(">h", value))
+
+    def write_int(self, name, value):
+        """
+        Writes an int tag (a 32 bit signed int)
+
+        Args:
+        - name (str): name of the tag
+        - value (int): value of the tag
+        """
+        self.file.write(self.get_header(self.INT, name) + struct.pack(">i", value))
+
+    def write_long(self, name, value):
+        """
+        Writes a long tag (a 64 bit signed int, ex. a timestamp)
+
+        Args:
+        - name (str): name of the tag
+        - value (int): value of the tag
+        """
+        self.file.write(self.get_header(self.LONG, name) + struct.pack(">q", value))
+
+    def write_string(self, name, value):
+        """
+        Writes a string tag, encoded as UTF-8 after its length in bytes
+
+        Args:
+        - name (str): name of the tag
+        - value (str): value of the tag
+        """
+        encoded = value.encode()
+        self.file.write(self.get_header(self.STRING, name) + struct.pack(">H", len(encoded)) + encoded)
+
+    def write_int_array(self, name, values):
+        """
+        Writes a whole int array tag at once (for small arrays, see begin_array for streaming large ones)
+
+        Args:
+        - name (str): name of the tag
+        - values (list or np.ndarray): the ints of the array
+        """
+        values = np.asarray(values, dtype=">i4")
+        self.file.write(self.get_header(self.INT_ARRAY, name) + struct.pack(">i", len(values)) + values.tobytes())
+
+    def begin_array(self, name, tag_type, length):
+        """
+        Starts a byte, int, or long array, whose contents are written afterwards by the caller (so they can be streamed)
+
+        Args:
+        - name (str): name of the array
+        - tag_type (int): NBTWriter.BYTE_ARRAY, INT_ARRAY, or LONG_ARRAY
+        - length (int): number of elements
+        """
+        self.file.write(self.get_header(tag_type, name) + struct.pack(">i", length))
+
+    def write_xyz(self, name, size):
+        """
+        Writes a compound of x, y, and z ints (ex. the size of a litematic region)
+
+        Args:
+        - name (str): name of the compound
+        - size (list): x, y, and z values
+        """
+        self.begin_compound(name)
+        for axis, value in zip("xyz", size):
+            self.write_int(axis, int(value))
+        self.end_compound()
+
+class StructureExporter:
+    """
+    Writes a block grid to a file which existing tools can paste into a world: a Sponge schematic (.schem, WorldEdit), a
+    vanilla structure (.nbt, structure blocks), or a litematic (.litematic, Litematica)
+    """
+
+    FORMATS = {".schem": "write_sponge_schematic", ".nbt": "write_structure", ".litematic": "write_litematic"}
+    DATA_VERSION = 1631 # Minecraft 1.13.2, the same chunk format MinecraftWorldEditor writes
+    LITEMATIC_VERSION = 4 # the first litematic version with MinecraftDataVersion
+    COMPRESS_LEVEL = 6
+    SLAB_VOXELS = 1 << 22 # approximate number of cells (or blocks) converted and compressed at a time
+
+    # each block of a vanilla structure is a compound of its palette index and position, which all have the same layout
+    # (an int tag named "state", a list tag of 3 ints named "pos", and an end tag), so they're built as one NumPy record array
+    STRUCTURE_BLOCK = np.dtype([
+        ("state_header", "S8"), ("state", ">i4"), ("pos_header", "S11"), ("pos", ">i4", 3), ("end", "u1")])
+    STATE_HEADER = NBTWriter.get_header(NBTWriter.INT, "state")
+    POS_HEADER = NBTWriter.get_header(NBTWriter.LIST, "pos") + struct.pack(">bi", NBTWriter.INT, 3)
+
+    def __init__(self, block_grid, block_palette, name="mesh2minecraft"):
+        """
+        Initializes StructureExporter, cropping the grid to the blocks it contains
+
+        Args:
+        - block_grid (np.ndarray, ChunkedGrid, or OctreeGrid): 3D grid of indices into block_palette (0 = no block)
+        - block_palette (list): minecraft block names
+        - name (str): name stored in the file (litematics and their regions have names)
+        """
+        self.name = name
+        self.block_grid = block_grid
+        # find the blocks' bounding box and which blocks are used in one pass over batches of them, without keeping them
+        low, high = np.full(3, np.iinfo(np.int64).max), np.full(3, -1)
+        block_counts = np.zeros(max(len(block_palette), 1), dtype=np.int64)
+        for indices, palette_ids in iter_batches(block_grid, self.SLAB_VOXELS):
+            palette_ids = np.asarray(palette_ids, dtype=np.int64)
+            indices, palette_ids = indices[palette_ids > 0], palette_ids[palette_ids > 0]
+            if len(indices):
+                low, high = np.minimum(low, indices.min(axis=0)), np.maximum(high, indices.max(axis=0))
+                block_counts += np.bincount(palette_ids, minlength=len(block_counts))
+        self.low = low if (high >= 0).all() else np.zeros(3, dtype=np.int64)
+        self.size = high - self.low + 1 if (high >= 0).all() else np.zeros(3, dtype=np.int64)
+        self.block_count = int(block_counts.sum())
+
+        # only the blocks that are used go in the palette, with air first
+        used = np.flatnonzero(block_counts)
+        self.remap = np.zeros(len(block_counts), dtype=np.int64)
+        self.remap[used] = np.arange(1, len(used) + 1)
+        self.state_counts = np.bincount(self.remap, weights=block_counts, minlength=len(used) + 1).astype(np.int64)
+        self.palette = ["minecraft:air"] + [f"minecraft:{block_palette[i]}" for i in used.tolist()]
+
+    def export(self, path):
+        """
+        Writes the blocks to a file, in the format given by its extension (see FORMATS)
+
+        Args:
+        - path (str): path of the file to write
+
+        Returns:
+        - int: number of blocks written
+
+        Raises:
+        - ValueError: if the extension isn't one of FORMATS
+        """
+        extension = os.path.splitext(path)[1].lower()
+        if extension not in self.FORMATS:
+            raise ValueError(f"Export path must end in one of {', '.join(self.FORMATS)}")
+        temp_path = path + ".tmp"
+        with gzip.open(temp_path, "wb", compresslevel=self.COMPRESS_LEVEL) as f:
+            getattr(self, self.FORMATS[extension])(NBTWriter(f))
+        os.replace(temp_path, path)
+        return self.block_count
+
+    def _iter_slabs(self, cells_per_slab):
+        """
+        Splits the grid's cells into consecutive slabs in YZX order, filling each with its blocks' palette indices (read 
+        from the layers of the grid the slab covers, with query_box)
+
+        Args:
+        - cells_per_slab (int): number of cells in each slab (except the last)
+
+        Returns:
+        - generator: (M,) int64 array of each slab's palette indices (0 = air)
+        """
+        width, height, length = self.size.tolist()
+        volume = width * height * length
+        for start in range(0, volume, cells_per_slab):
+            stop = min(start + cells_per_slab, volume)
+            first_layer, last_layer = start // (width * length), (stop - 1) // (width * length)
+            indices, palette_ids = self._query_layers(first_layer, last_layer)
+            cell_indices = (indices[:, 1] * length + indices[:, 2]) * width + indices[:, 0]
+            in_slab = (cell_indices >= start) & (cell_indices < stop)
+            cells = np.zeros(stop - start, dtype=np.int64)
+            cells[cell_indices[in_slab] - start] = self.remap[palette_ids[in_slab]]
+            yield cells
+
+    def _query_layers(self, first_layer, last_layer):
+        """
+        Gets the blocks within a range of layers of the structure
+
+        Args:
+        - first_layer (int): first y of the range, relative to the structure
+        - last_layer (int): last y of the range (inclusive)
+
+        Returns:
+        - np.ndarray: (M, 3) array of the blocks' positions relative to the structure
+        - np.ndarray: (M,) array of the blocks' indices into the grid's block palette
+        """
+        box_min = self.low + [0, first_layer, 0]
+        box_max = self.low + self.size - 1
+        box_max[1] = self.low[1] + last_layer
+        indices, palette_ids = query_box(self.block_grid, box_min, box_max)
+        palette_ids = np.asarray(palette_ids, dtype=np.int64)
+        return indices[palette_ids > 0] - self.low, palette_ids[palette_ids > 0]
+
+    @staticmethod
+    def encode_varints(values):
+        """
+        Encodes non-negative ints as varints (7 bits per byte, with the high bit set on every byte but the last), the
+        way Sponge schematics store their block data
+
+        Args:
+        - values (np.ndarray): (M,) array of non-negative ints below 2^21
+
+        Returns:
+        - np.ndarray: uint8 array of the encoded bytes
+        """
+        values = np.asarray(values, dtype=np.int64)
+        byte_counts = 1 + (values >= 1 << 7) + (values >= 1 << 14)
+        if byte_counts.max(initial=1) == 1:
+            return values.astype(np.uint8)
+        owners = np.repeat(np.arange(len(values)), byte_counts)
+        positions = np.arange(len(owners)) - np.repeat(np.cumsum(byte_counts) - byte_counts, byte_counts)
+        encoded = (values[owners] >> (7 * positions)) & 0x7F
+        encoded |= np.where(positions < byte_counts[owners] - 1, 0x80, 0)
+        return encoded.astype(np.uint8)
+
+    @staticmethod
+    def pack_bits(values, width):
+        """
+        Packs ints tightly into 64 bit longs, lowest bits first, with values spanning two longs where needed (how
+        litematics store their block states)
+
+        Args:
+        - values (np.ndarray): (M,) array of non-negative ints below 2^width
+        - width (int): bits per value
+
+        Returns:
+        - np.ndarray: (ceil(M * width / 64),) array of big endian signed longs
+        """
+        # every 64 values fill exactly width longs, so value i of each group of 64 always lands at the same bits of the
+        # same long(s), and the groups are packed a column at a time
+        values = np.asarray(values, dtype=np.uint64)
+        groups = np.concatenate((values, np.zeros(-len(values) % 64, dtype=np.uint64))).reshape(-1, 64)
+        words = np.zeros((len(groups), width), dtype=np.uint64)
+        for i in range(64):
+            word, shift = divmod(i * width, 64)
+            words[:, word] |= groups[:, i] << np.uint64(shift)
+            if shift + width > 64:
+                words[:, word + 1] |= groups[:, i] >> np.uint64(64 - shift)
+        return words.reshape(-1)[:-(-len(values) * width // 64)].astype(">u8").view(">i8")
+
+    def write_sponge_schematic(self, writer):
+        """
+        Writes a Sponge schematic (version 2), which stores the palette as a compound of block names and indices, and every
+        cell's palette index as a varint
+
+        Args:
+        - writer (NBTWriter): writer of the gzip file
+        """
+        if (self.size > 0xFFFF).any():
+            raise ValueError("Sponge schematics can't be larger than 65535 blocks along any axis")
+        width, height, length = self.size.tolist()
+        writer.begin_compound("Schematic")
+        writer.write_int("Version", 2)
+        writer.write_int("DataVersion", self.DATA_VERSION)
+        # the dimensions are unsigned shorts, stored as signed
+        for name, value in (("Width", width), ("Height", height), ("Length", length)):
+            writer.write_short(name, value - (value >> 15 << 16))
+        writer.write_int_array("Offset", [0, 0, 0])
+        writer.write_int("PaletteMax", len(self.palette))
+        writer.begin_compound("Palette")
+        for index, block_state in enumerate(self.palette):
+            writer.write_int(block_state, index)
+        writer.end_compound()
+
+        # air takes one byte per cell, and every block whose index needs more than 7 bits takes one or two more
+        states = np.arange(len(self.state_counts))
+        extra_bytes = int(self.state_counts[states >= 1 << 7].sum() + self.state_counts[states >= 1 << 14].sum())
+        writer.begin_array("BlockData", NBTWriter.BYTE_ARRAY, int(np.prod(self.size)) + extra_bytes)
+        for cells in self._iter_slabs(self.SLAB_VOXELS):
+            writer.file.write(self.encode_varints(cells).tobytes())
+        writer.begin_list("BlockEntities", NBTWriter.COMPOUND, 0)
+        writer.end_compound()
+
+    def write_structure(self, writer):
+        """
+        Writes a vanilla structure, which lists each block (but not air) with its palette index and position
+
+        Args:
+        - writer (NBTWriter): writer of the gzip file
+        """
+        writer.begin_compound("")
+        writer.write_int("DataVersion", self.DATA_VERSION)
+        writer.begin_list("size", NBTWriter.INT, 3)
+        writer.file.write(self.size.astype(">i4").tobytes())
+        writer.begin_list("palette", NBTWriter.COMPOUND, len(self.palette) - 1)
+        for block_state in self.palette[1:]:
+            writer.write_string("Name", block_state)
+            writer.end_compound()
+
+        # the blocks can be listed in any order, so they're written in the order the grid streams them
+        writer.begin_list("blocks", NBTWriter.COMPOUND, self.block_count)
+        for indices, palette_ids in iter_batches(self.block_grid, self.SLAB_VOXELS):
+            palette_ids = np.asarray(palette_ids, dtype=np.int64)
+            indices, palette_ids = indices[palette_ids > 0], palette_ids[palette_ids > 0]
+            blocks = np.zeros(len(indices), dtype=self.STRUCTURE_BLOCK)
+            blocks["state_header"] = self.STATE_HEADER
+            blocks["state"] = self.remap[palette_ids] - 1 # air isn't in a structure's palette
+            blocks["pos_header"] = self.POS_HEADER
+            blocks["pos"] = indices - self.low
+            writer.file.write(blocks.tobytes())
+        writer.begin_list("entities", NBTWriter.COMPOUND, 0)
+        writer.end_compound()
+
+    def write_litematic(self, writer):
+        """
+        Writes a litematic with a single region, which stores every cell's palette index tightly packed in longs
+
+        Args:
+        - writer (NBTWriter): writer of the gzip file
+        """
+        volume = int(np.prod(self.size))
+        now = int(time.time() * 1000)
+        writer.begin_compound("")
+        writer.write_int("MinecraftDataVersion", self.DATA_VERSION)
+        writer.write_int("Version", self.LITEMATIC_VERSION)
+        writer.begin_compound("Metadata")
+        writer.write_string("Name", self.name)
+        writer.write_string("Author", "mesh2minecraft")
+        writer.write_string("Description", "")
+        writer.write_int("RegionCount", 1)
+        writer.write_int("TotalBlocks", self.block_count)
+        writer.write_int("TotalVolume", volume)
+        writer.write_long("TimeCreated", now)
+        writer.write_long("TimeModified", now)
+        writer.write_xyz("EnclosingSize", self.size)
+        writer.end_compound()
+
+        writer.begin_compound("Regions")
+        writer.begin_compound(self.name)
+        writer.write_xyz("Position", [0, 0, 0])
+        writer.write_xyz("Size", self.size)
+        writer.begin_list("BlockStatePalette", NBTWriter.COMPOUND, len(self.palette))
+        for block_state in self.palette:
+            writer.write_string("Name", block_state)
+            writer.end_compound()
+
+        # slabs hold a multiple of 64 cells, so every slab starts on a long boundary
+        width = max(2, (len(self.palette) - 1).bit_length())
+        writer.begin_array("BlockStates", NBTWriter.LONG_ARRAY, -(-volume * width // 64))
+        for cells in self._iter_slabs(self.SLAB_VOXELS):
+            writer.file.write(self.pack_bits(cells, width).tobytes())
+        for name in ("TileEntities", "Entities", "PendingBlockTicks", "PendingFluidTicks"):
+            writer.begin_list(name, NBTWriter.COMPOUND, 0)
+        writer.end_compound()
+        writer.end_compound()
+        writer.end_compound()
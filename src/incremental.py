@@ -0,0 +1,320 @@
+import os
+import copy
+import bisect
+import json
+import hashlib
+import numpy as np
+from chunked_grid import ChunkedGrid, argwhere
+from render import MinecraftWorldEditor
+
+class IncrementalVoxelizer:
+    """
+    Re-voxelizes only the parts of a model whose triangles changed since the last run with the same settings, and rewrites
+    only the blocks (and so only the minecraft chunks) that changed. Each run saves the model's triangles and the voxels
+    they produced, which the next run compares against
+    """
+
+    VERSION = 2 # bumped whenever the saved state or the voxelization results change, so older states are never used
+    # multipliers of the two 64 bit hashes identifying each triangle (large odd constants with well mixed bits)
+    HASH_MULTIPLIERS = (0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F)
+    STAT_NAMES = ("changed_triangles", "dirty_chunks", "revoxelized_triangles", "reused_voxels")
+
+    def __init__(self, state_dir, model_path, settings):
+        """
+        Initializes IncrementalVoxelizer
+
+        Args:
+        - state_dir (str): directory the state of each model's last run is saved in
+        - model_path (str): path to the model file (the state belongs to the path, not the file's contents)
+        - settings (dict): JSON serializable settings which affect the voxelization (a change means starting over)
+        """
+        key = json.dumps({"version": self.VERSION, "model_path": os.path.abspath(model_path), **settings}, sort_keys=True)
+        self.path = os.path.join(state_dir, f"state_{hashlib.sha256(key.encode()).hexdigest()}.npz")
+        self.stats = dict.fromkeys(self.STAT_NAMES, 0)
+        self.previous = None # state of the last run (see load)
+        self.state = {} # state of this run, saved by save
+
+    @staticmethod
+    def get_triangle_keys(model):
+        """
+        Identifies each triangle by its vertex positions and colors (so moving, recoloring, or reordering its vertices
+        counts as a change, but renumbering the model's vertices doesn't), with two 64 bit hashes
+
+        Args:
+        - model (ObjReader or VoxelizerBase): has vertices, colors, and faces arrays
+
+        Returns:
+        - np.ndarray: (F, 2) uint64 array of hashes
+        """
+        positions = np.ascontiguousarray(model.vertices[model.faces], dtype=np.float64).reshape(len(model.faces), 9)
+        colors = np.ascontiguousarray(model.colors[model.faces], dtype=np.float64).reshape(len(model.faces), 9)
+        words = np.concatenate((positions.view(np.uint64), colors.view(np.uint64)), axis=1)
+
+        keys = np.zeros((len(words), 2), dtype=np.uint64)
+        for n, multiplier in enumerate(IncrementalVoxelizer.HASH_MULTIPLIERS):
+            hashes = np.full(len(words), n, dtype=np.uint64)
+            for column in words.T:
+                hashes = (hashes ^ column) * np.uint64(multiplier)
+                hashes ^= hashes >> np.uint64(29)
+            keys[:, n] = hashes
+        return keys
+
+    @staticmethod
+    def match_triangles(old_keys, new_keys):
+        """
+        Finds the triangles which are the same in both versions of a model and in the same order relative to each other.
+        A voxel only takes its color from the triangles intersecting it and their order, so voxels that no changed
+        triangle touches come out exactly the same
+
+        Args:
+        - old_keys (np.ndarray): (F1, 2) hashes of the old triangles (see get_triangle_keys)
+        - new_keys (np.ndarray): (F2, 2) hashes of the new triangles
+
+        Returns:
+        - old_changed (np.ndarray): (F1,) bool array of old triangles which were removed (or moved in the order)
+        - new_changed (np.ndarray): (F2,) bool array of new triangles which were added (or moved in the order)
+        """
+        # sort the keys of both versions together; the sort is stable, so each group of equal keys lists its old
+        # triangles first and then its new ones, each in their original order
+        keys = np.concatenate((old_keys, new_keys))
+        order = np.lexsort((keys[:, 1], keys[:, 0]))
+        sorted_keys = keys[order]
+        first = np.concatenate(([True], (sorted_keys[1:] != sorted_keys[:-1]).any(axis=1)))
+        groups = np.cumsum(first) - 1
+        starts = np.flatnonzero(first)
+        is_old = order < len(old_keys)
+        old_counts = np.bincount(groups[is_old], minlength=len(starts))
+        new_counts = np.bincount(groups, minlength=len(starts)) - old_counts
+
+        # match the nth copy of a triangle in the old version with its nth copy in the new version
+        ranks = np.arange(len(keys)) - starts[groups]
+        matched = is_old & (ranks < new_counts[groups])
+        old_matched = order[matched]
+        new_matched = order[starts[groups[matched]] + old_counts[groups[matched]] + ranks[matched]] - len(old_keys)
+
+        # keep as many matches as possible whose old order agrees with their new order (the rest count as removed and added
+        # again)
+        order = np.argsort(new_matched)
+        old_matched, new_matched = old_matched[order], new_matched[order]
+        in_order = IncrementalVoxelizer.get_increasing(old_matched)
+
+        old_changed = np.ones(len(old_keys), dtype=bool)
+        new_changed = np.ones(len(new_keys), dtype=bool)
+        old_changed[old_matched[in_order]] = False
+        new_changed[new_matched[in_order]] = False
+        return old_changed, new_changed
+
+    @staticmethod
+    def get_increasing(values):
+        """
+        Finds a longest increasing subsequence of distinct values. Values which are in order with every other value belong
+        to one anyway, so only the rest (usually few, ex. the triangles moved by an edit) go through the O(n log n) search
+
+        Args:
+        - values (np.ndarray): (M,) array of distinct ints
+
+        Returns:
+        - np.ndarray: (M,) bool array of the values in the subsequence
+        """
+        if len(values) == 0:
+            return np.ones(0, dtype=bool)
+        in_order = (values == np.maximum.accumulate(values)) & (values == np.minimum.accumulate(values[::-1])[::-1])
+        rest = np.flatnonzero(~in_order)
+
+        # patience sorting: tails[k] is the smallest value ending an increasing subsequence of length k + 1
+        tails, tail_positions, previous = [], [], np.full(len(rest), -1)
+        for n, value in enumerate(values[rest].tolist()):
+            k = bisect.bisect_left(tails, value)
+            if k > 0:
+                previous[n] = tail_positions[k - 1]
+            if k == len(tails):
+                tails.append(value)
+                tail_positions.append(n)
+            else:
+                tails[k] = value
+                tail_positions[k] = n
+        n = tail_positions[-1] if tail_positions else -1
+        while n >= 0:
+            in_order[rest[n]] = True
+            n = previous[n]
+        return in_order
+
+    @staticmethod
+    def get_box_counts(prefix_sums, min_corners, max_corners):
+        """
+        Counts the marked cells within many boxes at once, from the 3D prefix sums of the marked cells
+
+        Args:
+        - prefix_sums (np.ndarray): grid of prefix sums, padded with a layer of zeros at the start of each axis
+        - min_corners (np.ndarray): (B, 3) array of each box's minimum cell
+        - max_corners (np.ndarray): (B, 3) array of each box's maximum cell
+
+        Returns:
+        - np.ndarray: (B,) array of the number of marked cells within each box
+        """
+        counts = np.zeros(len(min_corners), dtype=np.int64)
+        for corner in np.ndindex(2, 2, 2):
+            # inclusion-exclusion over the box's 8 corners
+            x, y, z = np.where(corner, max_corners + 1, min_corners).T
+            counts += (-1) ** (3 - sum(corner)) * prefix_sums[x, y, z]
+        return counts
+
+    def load(self):
+        """
+        Loads the state of the last run
+
+        Returns:
+        - dict: arrays of the last run (see save), or None if there wasn't one
+        """
+        if not os.path.exists(self.path):
+            return None
+        with np.load(self.path) as data:
+            return {name: data[name] for name in data.files}
+
+    def voxelize(self, voxelizer, axis_counts=None):
+        """
+        Voxelizes a model, only voxelizing the 16x16x16 chunks of the grid that changed triangles overlap (before or after
+        the change) and keeping the last run's voxels everywhere else. Every triangle overlapping a changed chunk is
+        voxelized again (limited to the box around the changed chunks), so the results match voxelizing the whole model
+
+        Args:
+        - voxelizer (VoxelizerBase): voxelizer of the new version of the model
+        - axis_counts (np.ndarray): if given, array to add the number of pairs rejected by each separating axis to
+        """
+        keys = self.get_triangle_keys(voxelizer)
+        triangles = voxelizer.vertices[voxelizer.faces]
+        # bounding voxels of every triangle (same rounding as VoxelizerBase.voxelize)
+        boxes = np.stack((np.round(triangles.min(axis=1) / voxelizer.voxel_size),
+                          np.round(triangles.max(axis=1) / voxelizer.voxel_size)), axis=1).astype(np.int64)
+        self.stats = dict.fromkeys(self.STAT_NAMES, 0)
+        self.previous = self.load()
+
+        if self.previous is None:
+            voxelizer.voxelize(axis_counts)
+            self.stats["changed_triangles"] = len(keys)
+            self.stats["revoxelized_triangles"] = len(keys)
+        else:
+            old_changed, new_changed = self.match_triangles(self.previous["triangle_keys"], keys)
+            self.stats["changed_triangles"] = int(old_changed.sum() + new_changed.sum())
+            voxelizer.grid_init()
+            grid_min_corner, grid_max_corner = np.array(voxelizer.grid_min_corner), np.array(voxelizer.grid_max_corner)
+
+            # mark the chunks (aligned to multiples of 16 voxels, like a sparse grid's) that changed triangles overlap,
+            # adding each box to a difference grid so that large triangles cost no more than small ones
+            bits = ChunkedGrid.CHUNK_BITS
+            low_chunk = grid_min_corner >> bits
+            chunk_shape = (grid_max_corner >> bits) - low_chunk + 1
+            changed_boxes = np.concatenate((self.previous["triangle_boxes"][old_changed], boxes[new_changed]))
+            box_min = np.maximum(changed_boxes[:, 0], grid_min_corner)
+            box_max = np.minimum(changed_boxes[:, 1], grid_max_corner)
+            inside = (box_min <= box_max).all(axis=1)
+            box_min, box_max = (box_min[inside] >> bits) - low_chunk, (box_max[inside] >> bits) - low_chunk
+            differences = np.zeros(chunk_shape + 1, dtype=np.int64)
+            for corner in np.ndindex(2, 2, 2):
+                x, y, z = np.where(corner, box_max + 1, box_min).T
+                np.add.at(differences, (x, y, z), (-1) ** sum(corner))
+            dirty = differences.cumsum(axis=0).cumsum(axis=1).cumsum(axis=2)[:-1, :-1, :-1] > 0
+            self.stats["dirty_chunks"] = int(dirty.sum())
+
+            # keep the last run's voxels outside the dirty chunks
+            indices = self.previous["indices"].astype(np.int64)
+            chunks = (indices >> bits) - low_chunk
+            keep = ((indices >= grid_min_corner) & (indices <= grid_max_corner)).all(axis=1)
+            keep[keep] = ~dirty[tuple(chunks[keep].T)]
+            parts = [(indices[keep], self.previous["colors"][keep], self.previous["blocks"][keep])]
+            self.stats["reused_voxels"] = int(keep.sum())
+
+            prefix_sums = np.zeros(chunk_shape + 1, dtype=np.int64)
+            prefix_sums[1:, 1:, 1:] = dirty.cumsum(axis=0).cumsum(axis=1).cumsum(axis=2)
+            triangle_min = (np.clip(boxes[:, 0], grid_min_corner, grid_max_corner) >> bits) - low_chunk
+            triangle_max = (np.clip(boxes[:, 1], grid_min_corner, grid_max_corner) >> bits) - low_chunk
+            touching = np.flatnonzero(self.get_box_counts(prefix_sums, triangle_min, triangle_max) > 0)
+            self.stats["revoxelized_triangles"] = len(touching)
+
+            voxelizer.stats = dict.fromkeys(voxelizer.STAT_NAMES, 0)
+            if len(touching):
+                # voxelize the triangles touching the dirty chunks (in their original order) in the box around those chunks,
+                # but only keep the voxels within them, as the rest of the box may be missing other triangles
+                dirty_chunks = np.argwhere(dirty)
+                part = copy.copy(voxelizer)
+                part.faces = voxelizer.faces[touching]
+                part.sparse = True
+                part.bounds = (np.maximum((dirty_chunks.min(axis=0) + low_chunk) << bits, grid_min_corner).tolist(),
+                               np.minimum(((dirty_chunks.max(axis=0) + low_chunk + 1) << bits) - 1, grid_max_corner).tolist())
+                part.voxelize(axis_counts)
+                part_indices = argwhere(part.voxel_grid)
+                x, y, z = part_indices.T
+                part_indices = part_indices + part.grid_min_corner
+                inside = dirty[tuple(((part_indices >> bits) - low_chunk).T)]
+                parts.append((part_indices[inside], part.color_grid[x, y, z][inside], part.block_grid[x, y, z][inside]))
+                voxelizer.stats = part.stats
+
+            indices, colors, blocks = [np.concatenate(arrays) for arrays in zip(*parts)]
+            x, y, z = (indices - grid_min_corner).T
+            voxelizer.voxel_grid[x, y, z] = True
+            voxelizer.color_grid[x, y, z] = colors
+            voxelizer.block_grid[x, y, z] = blocks
+
+        # the surface voxels are saved before filling or dithering, which are redone on the whole grid every run
+        indices = argwhere(voxelizer.voxel_grid)
+        x, y, z = indices.T
+        self.state.update(
+            triangle_keys=keys,
+            triangle_boxes=boxes.astype(np.int32),
+            indices=(indices + voxelizer.grid_min_corner).astype(np.int32),
+            colors=voxelizer.color_grid[x, y, z],
+            blocks=voxelizer.block_grid[x, y, z])
+
+    def build(self, voxelizer, world_path, build_location):
+        """
+        Builds the voxelizer's blocks in a minecraft world, only writing the blocks which differ from what the last run
+        built there (removed blocks are replaced with air), so only the chunks containing changes are rewritten
+
+        Args:
+        - voxelizer (VoxelizerMinecraft): voxelizer whose grids have been populated
+        - world_path (str): path to the minecraft world
+        - build_location (list): minecraft world coordinates at which to build the structure
+
+        Returns:
+        - int: number of blocks written
+        """
+        positions, palette_ids = MinecraftWorldEditor.get_blocks(voxelizer.block_grid, build_location)
+        block_palette = list(voxelizer.block_palette)
+        built_palette = block_palette
+        self.state.update(built_world=os.path.abspath(world_path), built_positions=positions.astype(np.int32),
+                          built_ids=palette_ids.astype(np.uint16), built_palette=np.array(block_palette))
+
+        previous = self.previous
+        if previous is not None and "built_world" in previous and str(previous["built_world"]) == self.state["built_world"]:
+            # compare what each position held before and after, by block name (0 = no block)
+            built_palette = ["air"] + sorted(set(block_palette[1:]) | set(previous["built_palette"][1:].tolist()))
+            new_ids = np.array([built_palette.index(name) if i else 0 for i, name in enumerate(block_palette)])[palette_ids]
+            old_ids = np.array([built_palette.index(name) if i else 0 for i, name in enumerate(previous["built_palette"].tolist())])
+            old_ids = old_ids[previous["built_ids"].astype(np.int64)]
+
+            all_positions, inverse = np.unique(np.concatenate((previous["built_positions"].astype(np.int64), positions)),
+                                               axis=0, return_inverse=True)
+            inverse = inverse.reshape(-1)
+            old_blocks = np.zeros(len(all_positions), dtype=np.int64)
+            new_blocks = np.zeros(len(all_positions), dtype=np.int64)
+            old_blocks[inverse[:len(old_ids)]] = old_ids
+            new_blocks[inverse[len(old_ids):]] = new_ids
+            changed = old_blocks != new_blocks
+            positions, palette_ids = all_positions[changed], new_blocks[changed]
+
+        if len(positions) == 0:
+            return 0
+        return MinecraftWorldEditor(world_path).write_blocks([(positions, palette_ids, built_palette)])
+
+    def save(self):
+        """Saves the state of this run (keeping what the last run built if nothing was built this time)"""
+        state = dict(self.state)
+        if "built_world" not in state and self.previous is not None and "built_world" in self.previous:
+            state.update({name: self.previous[name] for name in self.previous if name.startswith("built_")})
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        # write to a temporary file first so that an interrupted run never leaves a partial state behind
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as f:
+            np.savez_compressed(f, **state)
+        os.replace(temp_path, self.path)
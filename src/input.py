@@ -1,34 +1,257 @@
+import os
+import json
+import shutil
+import hashlib
+import numpy as np
+
+class ArrayBuffer:
+    """Growable NumPy array which rows can be appended to without going through Python lists"""
+
+    def __init__(self, width, dtype, capacity=1024):
+        """
+        Initializes ArrayBuffer
+
+        Args:
+        - width (int): number of values in each row
+        - dtype (np.dtype): data type of the values
+        - capacity (int): number of rows to allocate initially
+        """
+        self.data = np.empty((capacity, width), dtype=dtype)
+        self.size = 0
+
+    def extend(self, rows):
+        """
+        Appends rows to the buffer, doubling its capacity whenever it runs out of space
+
+        Args:
+        - rows (np.ndarray): (k, width) array of rows to append
+        """
+        new_size = self.size + len(rows)
+        if new_size > len(self.data):
+            self.data.resize((max(new_size, 2 * len(self.data)), self.data.shape[1]), refcheck=False)
+        self.data[self.size:new_size] = rows
+        self.size = new_size
+
+    def to_array(self):
+        """
+        Trims the buffer down to the rows that were appended
+
+        Returns:
+        - np.ndarray: (size, width) array of the appended rows
+        """
+        self.data.resize((self.size, self.data.shape[1]), refcheck=False)
+        return self.data
+
 class FileReader:
     """Base class for reading and parsing files"""
 
-    def __init__(self, file_path):
+    BINARY_VERSION = 2 # bumped whenever parsing or the binary format changes, so older binary files are never used
+    BINARY_ARRAYS = ("vertices", "colors", "faces")
+    HASH_CHUNK_SIZE = 1 << 20 # number of bytes of the file hashed at a time
+
+    def __init__(self, file_path, use_binary=False):
         """
         Initializes FileReader
 
         Args:
         - file_path (str): path to file location
+        - use_binary (bool): whether to load the parsed arrays from a binary file next to the input file when it's up to 
+        date, and otherwise write one after parsing
         """
         self.file_path = file_path
-        self.file_contents = None
-        self.vertices = []
-        self.faces = []
-        self.colors = []
-    
+        self.use_binary = use_binary
+        self.vertices = np.empty((0, 3), dtype=np.float64)
+        self.faces = np.empty((0, 3), dtype=np.int32)
+        self.colors = np.empty((0, 3), dtype=np.float64)
+
     def read_file(self):
         """Opens file (or handles corresponding error) and initiates reading and parsing"""
         try:
+            if self.use_binary and self.load_binary():
+                return
             with open(self.file_path, "r") as f:
-                self.file_contents = f.read()
-                self.parse()
+                self.parse(f)
+            if self.use_binary:
+                self.save_binary()
+        except FileNotFoundError:
+            print(f"Couldn't find file: {self.file_path}")
+        except Exception as e:
+            print(f"Error reading input file: {str(e)}")
+
+    def get_binary_path(self):
+        """
+        Gets the path of the binary file's directory, which sits next to the input file
+
+        Returns:
+        - str: path ending in .m2m
+        """
+        return f"{self.file_path}.m2m"
+
+    def get_file_hash(self):
+        """
+        Hashes the contents of the input file
+
+        Returns:
+        - str: SHA-256 hex digest
+        """
+        digest = hashlib.sha256()
+        with open(self.file_path, "rb") as f:
+            for chunk in iter(lambda: f.read(self.HASH_CHUNK_SIZE), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def load_binary(self):
+        """
+        Memory-maps the parsed arrays from the binary file if it matches the input file (same size and modification time, 
+        or else same contents)
+
+        Returns:
+        - bool: whether the arrays were loaded
+        """
+        binary_path = self.get_binary_path()
+        try:
+            with open(os.path.join(binary_path, "meta.json"), "r") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return False
+
+        stat = os.stat(self.file_path)
+        if meta.get("version") != self.BINARY_VERSION or meta.get("size") != stat.st_size:
+            return False
+        if meta.get("mtime_ns") != stat.st_mtime_ns:
+            # the file may have only been touched (ex. by a fresh checkout), so fall back to comparing contents
+            if meta.get("sha256") != self.get_file_hash():
+                return False
+            meta["mtime_ns"] = stat.st_mtime_ns
+            try:
+                self._write_meta(meta)
+            except OSError:
+                pass # still valid, the contents just have to be hashed again next time
+
+        try:
+            arrays = [np.load(os.path.join(binary_path, f"{name}.npy"), mmap_mode="r") for name in self.BINARY_ARRAYS]
+        except (OSError, ValueError):
+            return False
+        self.vertices, self.colors, self.faces = arrays
+        return True
+
+    def save_binary(self):
+        """Writes the parsed arrays to the binary file (skipped if the directory can't be written to)"""
+        binary_path = self.get_binary_path()
+        try:
+            self._remove_meta()
+            for name in self.BINARY_ARRAYS:
+                np.save(os.path.join(binary_path, f"{name}.npy"), np.ascontiguousarray(getattr(self, name)))
+            self._write_file_meta()
+        except OSError as e:
+            print(f"Couldn't write binary file: {str(e)}")
+
+    def read_file_out_of_core(self, work_dir, chunk_size=None):
+        """
+        Like read_file, but parses the file straight into .npy files on disk one chunk at a time and memory-maps them, so 
+        the parsed arrays never have to fit in memory
+
+        Args:
+        - work_dir (str): directory to write the arrays to when use_binary isn't set (otherwise they become the binary file)
+        - chunk_size (int): number of characters parsed at a time (defaults to the subclass's CHUNK_SIZE), which sets the 
+        peak memory used while parsing
+        """
+        try:
+            if self.use_binary and self.load_binary():
+                return
+            directory = self.get_binary_path() if self.use_binary else work_dir
+            if self.use_binary:
+                self._remove_meta()
+            os.makedirs(directory, exist_ok=True)
+
+            # append the raw bytes of each chunk, then copy them into .npy files once the number of rows is known
+            raw_paths = [os.path.join(directory, f"{name}.raw") for name in self.BINARY_ARRAYS]
+            raw_files = [open(path, "wb") for path in raw_paths]
+            row_counts = [0] * len(raw_files)
+            try:
+                with open(self.file_path, "r") as f:
+                    for arrays in self.parse_chunks(f, chunk_size):
+                        for i, array in enumerate(arrays):
+                            raw_files[i].write(np.ascontiguousarray(array).tobytes())
+                            row_counts[i] += len(array)
+            finally:
+                for raw_file in raw_files:
+                    raw_file.close()
+
+            for name, raw_path, row_count in zip(self.BINARY_ARRAYS, raw_paths, row_counts):
+                # the raw bytes are already laid out like the array, so they only need a .npy header in front of them 
+                # (copied through a small buffer rather than a memory map, whose written pages would count as used memory)
+                header = {"descr": np.lib.format.dtype_to_descr(getattr(self, name).dtype), "fortran_order": False, "shape": (row_count, 3)}
+                with open(os.path.join(directory, f"{name}.npy"), "wb") as npy_file, open(raw_path, "rb") as raw_file:
+                    np.lib.format.write_array_header_1_0(npy_file, header)
+                    shutil.copyfileobj(raw_file, npy_file)
+                os.remove(raw_path)
+            if self.use_binary:
+                self._write_file_meta()
+
+            arrays = [np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r") for name in self.BINARY_ARRAYS]
+            self.vertices, self.colors, self.faces = arrays
         except FileNotFoundError:
             print(f"Couldn't find file: {self.file_path}")
         except Exception as e:
             print(f"Error reading input file: {str(e)}")
 
-    def parse(self):
+    def _remove_meta(self):
+        """Creates the binary file's directory and removes its metadata, so the arrays aren't trusted while being written"""
+        binary_path = self.get_binary_path()
+        os.makedirs(binary_path, exist_ok=True)
+        # the metadata is removed first and written last, so the arrays are never trusted while partially written
+        if os.path.exists(os.path.join(binary_path, "meta.json")):
+            os.remove(os.path.join(binary_path, "meta.json"))
+
+    def _write_file_meta(self):
+        """Writes the binary file's metadata for the input file as it is now"""
+        stat = os.stat(self.file_path)
+        self._write_meta({"version": self.BINARY_VERSION, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns, 
+                          "sha256": self.get_file_hash()})
+
+    def _write_meta(self, meta):
+        """
+        Writes the binary file's metadata
+
+        Args:
+        - meta (dict): format version and the size, modification time, and hash of the input file
+        """
+        meta_path = os.path.join(self.get_binary_path(), "meta.json")
+        with open(f"{meta_path}.tmp", "w") as f:
+            json.dump(meta, f)
+        os.replace(f"{meta_path}.tmp", meta_path)
+
+    def parse(self, file):
+        """
+        Parses the whole file into vertices, faces, and colors
+
+        Args:
+        - file (io.TextIOBase): the opened file to be parsed
+        """
+        vertices = ArrayBuffer(3, np.float64)
+        colors = ArrayBuffer(3, np.float64)
+        faces = ArrayBuffer(3, np.int32)
+        for chunk_vertices, chunk_colors, chunk_faces in self.parse_chunks(file):
+            vertices.extend(chunk_vertices)
+            colors.extend(chunk_colors)
+            faces.extend(chunk_faces)
+
+        self.vertices = vertices.to_array()
+        self.colors = colors.to_array()
+        self.faces = faces.to_array()
+
+    def parse_chunks(self, file, chunk_size=None):
         """
         File parsing must be implemented by subclass
-        
+
+        Args:
+        - file (io.TextIOBase): the opened file to be parsed
+        - chunk_size (int): number of characters parsed at a time (None = the subclass's default)
+
+        Returns:
+        - generator: (vertices, colors, faces) arrays parsed from each part of the file, in order
+
         Raises:
         - NotImplementedError
         """
@@ -37,16 +260,49 @@ class FileReader:
 class ObjReader(FileReader):
     """File reading and parsing logic specific to OBJ files"""
 
-    def parse(self):
-        """Extracts vertices, faces, and colors from OBJ files"""
-        lines = self.file_contents.split("\n")
-        for line in lines:
-            data = line.strip().split()
-            if not data:
-                continue
-            elif data[0] == "v":
-                self.vertices.append([float(data[i]) for i in range(1, 4)])
-                if len(data) > 4: # if vertex colors included in obj file then read these too
-                    self.colors.append([float(data[i]) for i in range(4, 7)])
-            elif data[0] == "f":
-                self.faces.append([int(data[i].split("/")[0]) - 1 for i in range(1, 4)])
\ No newline at end of file
+    CHUNK_SIZE = 1 << 22 # number of characters read from the file at a time
+
+    def parse_chunks(self, file, chunk_size=None):
+        """
+        Streams vertices, faces, and colors from OBJ files into NumPy arrays one chunk at a time
+
+        Args:
+        - file (io.TextIOBase): the opened OBJ file
+        - chunk_size (int): number of characters read from the file at a time (defaults to CHUNK_SIZE)
+
+        Returns:
+        - generator: (vertices, colors, faces) arrays parsed from each chunk, in order
+        """
+        chunk_size = chunk_size or self.CHUNK_SIZE
+        vertex_count = 0 # needed to resolve negative (relative) indices
+        leftover = ""
+
+        while True:
+            chunk = file.read(chunk_size)
+            lines = (leftover + chunk).split("\n")
+            leftover = lines.pop() if chunk else "" # last line may continue in the next chunk
+
+            vertex_values, color_values, face_indices = [], [], []
+            for line in lines:
+                data = line.split()
+                if not data:
+                    continue
+                elif data[0] == "v":
+                    vertex_values.extend(data[1:4])
+                    if len(data) > 4: # if vertex colors included in obj file then read these too
+                        color_values.extend(data[4:7])
+                    vertex_count += 1
+                elif data[0] == "f":
+                    # only the vertex index is needed from forms like v, v/vt, v//vn, and v/vt/vn
+                    indices = [int(token.split("/", 1)[0]) for token in data[1:]]
+                    indices = [i - 1 if i > 0 else vertex_count + i for i in indices]
+                    # fan-triangulate quads and n-gons
+                    for i in range(1, len(indices) - 1):
+                        face_indices.extend((indices[0], indices[i], indices[i + 1]))
+
+            yield (np.array(vertex_values, dtype=np.float64).reshape(-1, 3),
+                   np.array(color_values, dtype=np.float64).reshape(-1, 3),
+                   np.array(face_indices, dtype=np.int32).reshape(-1, 3))
+
+            if not chunk:
+                break
@@ -0,0 +1,120 @@
+import os
+import sys
+import json
+import time
+import pstats
+import cProfile
+import contextlib
+
+try:
+    import resource
+except ImportError: # not available on Windows
+    resource = None
+
+class Instrumentation:
+    """Records how long each stage of a run takes along with counts and peak memory, and optionally profiles stages"""
+
+    PROFILE_LINES = 20 # number of functions printed from each stage's profile
+
+    def __init__(self, enabled=False, profile_stages=(), profile_dir="."):
+        """
+        Initializes Instrumentation
+
+        Args:
+        - enabled (bool): whether to record anything (when disabled, stages and counts are ignored)
+        - profile_stages (list): names of the stages to run under cProfile
+        - profile_dir (str): directory to dump each profiled stage's stats to (ex. voxelize.prof)
+        """
+        self.enabled = enabled or bool(profile_stages)
+        self.profile_stages = set(profile_stages)
+        self.profile_dir = profile_dir
+        self.stages = []
+        self.counts = {}
+
+    @staticmethod
+    def get_peak_memory():
+        """
+        Gets the peak memory used by this process so far
+
+        Returns:
+        - int: peak resident memory in bytes (None if it can't be measured on this platform)
+        """
+        if resource is None:
+            return None
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024 # macOS reports bytes, Linux reports kilobytes
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """
+        Times a stage of the run (used as a with statement), profiling it if requested
+
+        Args:
+        - name (str): name of the stage (ex. "voxelize")
+        """
+        if not self.enabled:
+            yield
+            return
+
+        profiler = cProfile.Profile() if name in self.profile_stages else None
+        start_time = time.perf_counter()
+        if profiler:
+            profiler.enable()
+        try:
+            yield
+        finally:
+            if profiler:
+                profiler.disable()
+            seconds = time.perf_counter() - start_time
+            peak = self.get_peak_memory()
+            self.stages.append({"name": name, "seconds": seconds, "peak_rss_bytes": peak})
+            memory = f", peak memory {peak / (1 << 20):.0f} MB" if peak is not None else ""
+            print(f"[{name}] {seconds:.3f}s{memory}")
+            if profiler:
+                self._dump_profile(name, profiler)
+
+    def count(self, name, value):
+        """
+        Adds to a count (ex. number of voxels filled)
+
+        Args:
+        - name (str): name of the count
+        - value (int): amount to add
+        """
+        if self.enabled:
+            self.counts[name] = self.counts.get(name, 0) + int(value)
+
+    def get_report(self):
+        """
+        Gathers everything recorded so far
+
+        Returns:
+        - dict: the stages (in order), counts, total time, and peak memory
+        """
+        return {"stages": self.stages, "counts": self.counts, "total_seconds": sum(stage["seconds"] for stage in self.stages),
+                "peak_rss_bytes": self.get_peak_memory()}
+
+    def write_report(self, path):
+        """
+        Writes everything recorded so far to a JSON file
+
+        Args:
+        - path (str): path of the JSON file
+        """
+        with open(path, "w") as f:
+            json.dump(self.get_report(), f, indent=2)
+
+    def _dump_profile(self, name, profiler):
+        """
+        Writes a stage's profile to a file (which can be opened with pstats or tools like snakeviz) and prints its most
+        expensive functions
+
+        Args:
+        - name (str): name of the stage
+        - profiler (cProfile.Profile): the stage's profiler
+        """
+        os.makedirs(self.profile_dir, exist_ok=True)
+        path = os.path.join(self.profile_dir, f"{name}.prof")
+        profiler.dump_stats(path)
+        print(f"[{name}] profile written to {path}")
+        pstats.Stats(profiler, stream=sys.stdout).sort_stats("cumulative").print_stats(self.PROFILE_LINES)
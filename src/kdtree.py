@@ -106,8 +106,14 @@ class KDTree:
         point_val = point[index]
 
         if point_val < node_val:
-            next_node = node.left
+            next_node, other_node = node.left, node.right
         else:
-            next_node = node.right
+            next_node, other_node = node.right, node.left
 
-        return self.get_nearest_point_helper(next_node, point, depth + 1, closest_node)
\ No newline at end of file
+        closest_node = self.get_nearest_point_helper(next_node, point, depth + 1, closest_node)
+
+        # the other side of the splitting plane can only hold a closer point if the plane is closer than the closest point
+        if abs(point_val - node_val) < self.distance(closest_node.value, point):
+            closest_node = self.get_nearest_point_helper(other_node, point, depth + 1, closest_node)
+
+        return closest_node
\ No newline at end of file
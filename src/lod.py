@@ -0,0 +1,89 @@
+import numpy as np
+from chunked_grid import ChunkedGrid, argwhere
+
+class VoxelLevel:
+    """One level of detail of a voxelization, with the same grid attributes as a voxelizer"""
+
+    def __init__(self, voxel_size, grid_min_corner, voxel_grid, color_grid, block_grid, block_palette):
+        """
+        Initializes VoxelLevel
+
+        Args:
+        - voxel_size (float): sidelength of the voxels at this level
+        - grid_min_corner (list): position of the voxel in the minimum corner of the grid
+        - voxel_grid (np.ndarray or ChunkedGrid): bool for each voxel dictating its presence
+        - color_grid (np.ndarray or ChunkedGrid): RGB value for each voxel
+        - block_grid (np.ndarray or ChunkedGrid): index into block_palette for each voxel
+        - block_palette (list): minecraft block names which block_grid indexes into (0 = no block)
+        """
+        self.voxel_size = voxel_size
+        self.grid_min_corner = grid_min_corner
+        self.voxel_grid = voxel_grid
+        self.color_grid = color_grid
+        self.block_grid = block_grid
+        self.block_palette = block_palette
+
+    def reduce(self, color_lookup=None):
+        """
+        Builds the next coarser level, where each voxel covers 2x2x2 voxels of this level (aligned to even voxel positions)
+        and is present if any of them are, with their average color
+
+        Args:
+        - color_lookup (ColorLookup): for matching the average colors to minecraft blocks (if None, each coarse voxel
+        takes the block of its first present voxel)
+
+        Returns:
+        - VoxelLevel: the coarser level
+        """
+        indices = argwhere(self.voxel_grid)
+        x, y, z = indices.T
+        colors = self.color_grid[x, y, z].astype(np.int64)
+        blocks = self.block_grid[x, y, z]
+
+        # group the voxels by the coarse voxel containing them
+        grid_min_corner = [corner >> 1 for corner in self.grid_min_corner]
+        coarse_indices = ((indices + self.grid_min_corner) >> 1) - grid_min_corner
+        shape = [int(n) for n in (((np.array(self.voxel_grid.shape[:3]) - 1 + self.grid_min_corner) >> 1) - grid_min_corner + 1)]
+        unique_keys, first_voxels, inverse, counts = np.unique(
+            np.ravel_multi_index(coarse_indices.T, shape), return_index=True, return_inverse=True, return_counts=True)
+        inverse = inverse.reshape(-1)
+
+        color_sums = np.stack([np.bincount(inverse, colors[:, i], len(unique_keys)) for i in range(3)], axis=1)
+        average_colors = np.round(color_sums / counts[:, np.newaxis]).astype(np.uint8)
+        if color_lookup is not None:
+            coarse_blocks = color_lookup.get_nearest_indices(average_colors).astype(blocks.dtype) + 1
+        else:
+            coarse_blocks = blocks[first_voxels]
+
+        if isinstance(self.voxel_grid, ChunkedGrid):
+            voxel_grid = ChunkedGrid(shape, bool)
+            color_grid = ChunkedGrid(shape + [3,], np.uint8)
+            block_grid = ChunkedGrid(shape, blocks.dtype)
+        else:
+            voxel_grid = np.zeros(shape, dtype=bool)
+            color_grid = np.zeros(shape + [3,], dtype=np.uint8)
+            block_grid = np.zeros(shape, dtype=blocks.dtype)
+        coarse_x, coarse_y, coarse_z = np.unravel_index(unique_keys, shape)
+        voxel_grid[coarse_x, coarse_y, coarse_z] = True
+        color_grid[coarse_x, coarse_y, coarse_z] = average_colors
+        block_grid[coarse_x, coarse_y, coarse_z] = coarse_blocks
+        return VoxelLevel(2 * self.voxel_size, grid_min_corner, voxel_grid, color_grid, block_grid, self.block_palette)
+
+def build_pyramid(voxels, voxel_size, levels, color_lookup=None):
+    """
+    Builds a pyramid of levels of detail (like mipmaps) from a voxelization, each level halving the resolution
+
+    Args:
+    - voxels (VoxelizerBase or CachedVoxels): voxelization results at the finest level
+    - voxel_size (float): sidelength of the voxels at the finest level
+    - levels (int): number of coarser levels to build
+    - color_lookup (ColorLookup): for matching the coarser levels' colors to minecraft blocks
+
+    Returns:
+    - list: VoxelLevels from the finest (the given voxelization) to the coarsest
+    """
+    pyramid = [VoxelLevel(voxel_size, list(voxels.grid_min_corner), voxels.voxel_grid, voxels.color_grid,
+                          voxels.block_grid, voxels.block_palette)]
+    for _ in range(levels):
+        pyramid.append(pyramid[-1].reduce(color_lookup))
+    return pyramid
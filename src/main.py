@@ -1,61 +1,324 @@
+import os
 import time
 import argparse
-from kdtree import KDTree
+import numpy as np
 from input import ObjReader
+from color_lookup import ColorLookup
 from average_block_colors import color_block_pairs
+from chunked_grid import argwhere
 from render import MinecraftWorldEditor, VoxelRenderer
-from voxelize import VoxelizerMinecraft, VoxelizerWithoutMinecraft
+from lod import build_pyramid
+from octree import SparseVoxelOctree
+from tiled import TiledVoxelizer
+from batch import BatchRunner
+from voxel_cache import VoxelCache
+from instrumentation import Instrumentation
+from dither import Dither
+from solid_fill import SolidFill
+from export import StructureExporter
+from incremental import IncrementalVoxelizer
+from voxel_triangle_intersection import BatchTriangleVoxelIntersection
+from voxelize import VoxelizerBase, VoxelizerMinecraft, VoxelizerWithoutMinecraft
 
-def main(model_path, voxel_size, world_path, build_location):
+LUT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "mesh2minecraft")
+VOXEL_CACHE_DIR = os.path.join(LUT_CACHE_DIR, "voxels")
+INCREMENTAL_DIR = os.path.join(LUT_CACHE_DIR, "incremental")
+STAGES = ("read", "cache", "color_lookup", "voxelize", "fill", "hollow", "dither", "octree", "lods", "preview", "export", "build", "render", "tiled")
+
+def main(model_path, voxel_size, world_path, build_location, *, workers=1, color_metric="rgb", lut_bits=None, sparse=False, exposed_faces_only=False, algorithm="sat", fill=False, cache_size=1024, use_binary=True, lods=0, octree_path=None, max_memory=None, tile_output=None, metrics_path=None, profile_stages=(), profile_dir=".", color_mode="face", dither="none", render=True, export_path=None, incremental=False, hollow=None):
     """
-    Reads input data, builds KD tree if necessary, voxelizes, and renders
+    Reads input data, builds color lookup if necessary, voxelizes, and renders (the options after build_location are 
+    keyword-only, since there are too many of them to pass in order)
     
     Args:
-    - model_path (str): path to 3D model
-    - voxel_size (float): sidelength of each voxel (smaller = more detail)
+    - model_path (str): path to 3D model (or to an octree .svo file, which is loaded instead of voxelizing)
+    - voxel_size (float): sidelength of each voxel (smaller = more detail, ignored when loading an octree)
     - world_path (str): path to minecraft world
     - build_location (list): minecraft world coordinates at which to build the structure
+    - workers (int): number of processes to voxelize with
+    - color_metric (str): how color distance is measured when matching minecraft blocks ("rgb" or "lab")
+    - lut_bits (int): bits per channel of the cached color lookup table (None = exact search without table)
+    - sparse (bool): whether to store the grids in 16x16x16 chunks, only allocating the chunks containing voxels
+    - exposed_faces_only (bool): whether to only render the voxel faces that aren't hidden by neighboring voxels
+    - algorithm (str): how candidate voxels are found ("sat" = each triangle's bounding box, "raster" = scan-converted columns)
+    - fill (bool): whether to also fill the voxels enclosed by the model's surface
+    - cache_size (int): size limit of the voxelization cache in megabytes (0 = don't cache)
+    - use_binary (bool): whether to load the model from (or save it to) a binary .m2m file next to it
+    - lods (int): number of coarser levels of detail to build, the coarsest of which is rendered as a preview first
+    - octree_path (str): path to save the voxelization to as a sparse voxel octree (None = don't save)
+    - max_memory (int): if given, voxelizes out of core one tile at a time, with tiles and batches sized to fit this many megabytes
+    - tile_output (str): directory to save each tile to as an octree when voxelizing out of core without minecraft
+    - metrics_path (str): path of a JSON file to write each stage's time, counts, and peak memory to (None = don't record)
+    - profile_stages (list): names of stages (see STAGES) to run under cProfile
+    - profile_dir (str): directory to write the profiles of profile_stages to
+    - color_mode (str): how voxel colors are sampled ("face" = first intersecting triangle's average color, "barycentric" = 
+    average of every intersecting triangle's color interpolated at the voxel's center)
+    - dither (str): how voxel colors are matched to minecraft blocks ("none" = nearest block, "bayer" = ordered dithering, 
+    "floyd-steinberg" = error diffusion)
+    - render (bool): whether to render with PyVista when not building in minecraft (False = only voxelize, ex. to save an 
+    octree or fill the cache, without ever importing PyVista or VTK)
+    - export_path (str): path to export the blocks to as a .schem, .nbt, or .litematic file (None = don't export)
+    - incremental (bool): whether to only voxelize (and rewrite in the world) what changed since the last incremental run 
+    of the model with the same settings, instead of using the cache
+    - hollow (int): if given, removes the voxels which can't be seen from outside, leaving a watertight shell with this 
+    connectivity (26 = thinnest, 6 = voxels touching by faces)
     """
+    instrumentation = Instrumentation(bool(metrics_path), profile_stages, profile_dir)
     try:
         build_in_minecraft = True if world_path and build_location else False
+        # exporting needs the voxels matched to minecraft blocks too, even without a world
+        use_blocks = build_in_minecraft or bool(export_path)
 
         start_time = time.time()
 
         print("preprocessing")
 
-        model = ObjReader(model_path)
-        model.read_file()
+        if max_memory:
+            # the model and its grid may not fit in memory, so each tile is written out as soon as it's voxelized
+            with instrumentation.stage("color_lookup"):
+                color_lookup = ColorLookup(list(color_block_pairs.keys()), color_metric, lut_bits, LUT_CACHE_DIR) if use_blocks else None
+            with instrumentation.stage("tiled"):
+                tiler = TiledVoxelizer(model_path, voxel_size, max_memory * 1024 * 1024, use_binary, workers, sparse, algorithm, color_mode, dither)
+                tiler.voxelize(color_lookup, world_path, build_location, tile_output or f"{model_path}.tiles")
+            for name, value in tiler.stats.items():
+                instrumentation.count(name, value)
+            print(f"Time elapsed: {time.time() - start_time}")
+            return
 
-        if build_in_minecraft:
-            kdtree = KDTree(list(color_block_pairs.keys()))
-            voxelizer = VoxelizerMinecraft(model, voxel_size, kdtree)
+        loaded_octree = model_path.lower().endswith(".svo")
+        if loaded_octree:
+            with instrumentation.stage("read"):
+                voxelizer = SparseVoxelOctree.load(model_path)
+            voxel_size = voxelizer.voxel_size
+
+        # identify the results by the model's contents and every setting that changes them
+        settings = {"voxel_size": voxel_size, "algorithm": algorithm, "fill": fill}
+        if hollow:
+            settings["hollow"] = hollow
+        if color_mode != "face":
+            settings["color_mode"] = color_mode # so that results cached before color modes existed stay valid
+        if use_blocks:
+            settings.update(palette=[[list(color), block] for color, block in color_block_pairs.items()], 
+                            color_metric=color_metric, lut_bits=lut_bits)
+            if dither != "none":
+                settings["dither"] = dither
+        cache = VoxelCache(VOXEL_CACHE_DIR, cache_size * 1024 * 1024) if cache_size > 0 and not loaded_octree and not incremental else None
+        incremental_voxelizer = IncrementalVoxelizer(INCREMENTAL_DIR, model_path, settings) if incremental else None
+        if not loaded_octree:
+            with instrumentation.stage("cache"):
+                cache_key = cache.get_key(model_path, settings) if cache else None
+                voxelizer = cache.load(cache_key, sparse) if cache else None
+        with instrumentation.stage("color_lookup"):
+            color_lookup = ColorLookup(list(color_block_pairs.keys()), color_metric, lut_bits, LUT_CACHE_DIR) if use_blocks else None
+
+        if loaded_octree:
+            print(f"loaded octree ({len(voxelizer.colors)} voxels)")
+        elif voxelizer:
+            print("loaded voxelization from cache")
         else:
-            voxelizer = VoxelizerWithoutMinecraft(model, voxel_size)
+            with instrumentation.stage("read"):
+                model = ObjReader(model_path, use_binary)
+                model.read_file()
+            instrumentation.count("faces", len(model.faces))
+
+            if use_blocks:
+                voxelizer = VoxelizerMinecraft(model, voxel_size, color_lookup, workers, sparse, algorithm, color_mode=color_mode)
+            else:
+                voxelizer = VoxelizerWithoutMinecraft(model, voxel_size, workers, sparse, algorithm, color_mode=color_mode)
+
+            print("voxelizing")
+            # counting which separating axis rejects each pair costs a little, so it's only done when instrumenting
+            axis_counts = np.zeros(len(BatchTriangleVoxelIntersection.AXIS_NAMES), dtype=np.int64) if instrumentation.enabled else None
+            with instrumentation.stage("voxelize"):
+                if incremental_voxelizer:
+                    incremental_voxelizer.voxelize(voxelizer, axis_counts)
+                else:
+                    voxelizer.voxelize(axis_counts)
+            if incremental_voxelizer:
+                incremental_stats = incremental_voxelizer.stats
+                if incremental_voxelizer.previous is None:
+                    print("no earlier incremental run of this model with these settings, so every triangle was voxelized")
+                else:
+                    print(f"{incremental_stats['changed_triangles']} triangles changed: {incremental_stats['revoxelized_triangles']} "
+                          f"triangles voxelized again in {incremental_stats['dirty_chunks']} chunks, {incremental_stats['reused_voxels']} voxels reused")
+                for name, value in incremental_stats.items():
+                    instrumentation.count(name, value)
+            stats = voxelizer.stats
+            avoided = stats["candidates"] - stats["tested"]
+            print(f"{stats['tested']} of {stats['candidates']} candidate triangle-voxel pairs needed a full intersection test "
+                  f"({avoided} avoided: {stats['skipped']} already filled, {stats['trivial']} voxels hit by a triangle's vertex)")
+            for name, value in stats.items():
+                instrumentation.count(name, value)
+            if axis_counts is not None:
+                for name, value in zip(BatchTriangleVoxelIntersection.AXIS_NAMES, axis_counts):
+                    instrumentation.count(f"separated_by_{name}", value)
+
+            if fill:
+                print("filling")
+                with instrumentation.stage("fill"):
+                    instrumentation.count("filled", voxelizer.fill_interior())
+
+            if hollow:
+                print("hollowing")
+                with instrumentation.stage("hollow"):
+                    hollowed = voxelizer.hollow(hollow)
+                instrumentation.count("hollowed", hollowed)
+                print(f"removed {hollowed} voxels which can't be seen from outside ({len(argwhere(voxelizer.voxel_grid))} left)")
 
-        print("voxelizing")
-        voxelizer.voxelize()
+            if use_blocks and dither != "none":
+                print("dithering")
+                with instrumentation.stage("dither"):
+                    voxelizer.dither(dither)
+
+            if cache:
+                with instrumentation.stage("cache"):
+                    cache.save(cache_key, voxelizer)
+
+        if instrumentation.enabled:
+            instrumentation.count("voxels", len(argwhere(voxelizer.voxel_grid)))
+
+        if octree_path:
+            with instrumentation.stage("octree"):
+                octree = SparseVoxelOctree.from_grids(voxelizer, voxel_size)
+                octree.save(octree_path)
+            print(f"saved octree to {octree_path} ({len(octree.colors)} voxels, {os.path.getsize(octree_path)} bytes)")
+
+        if lods > 0:
+            # halve the resolution repeatedly, rather than voxelizing again at each voxel size
+            with instrumentation.stage("lods"):
+                pyramid = build_pyramid(voxelizer, voxel_size, lods, color_lookup)
+            for level, voxels in enumerate(pyramid):
+                print(f"level {level}: voxel size {voxels.voxel_size:g}, {len(argwhere(voxels.voxel_grid))} voxels")
 
         print(f"Time elapsed: {time.time() - start_time}")
 
+        if lods > 0 and render:
+            print("previewing the coarsest level")
+            with instrumentation.stage("preview"):
+                VoxelRenderer.render_without_minecraft_blocks(pyramid[-1].voxel_grid, pyramid[-1].color_grid, exposed_faces_only)
+
+        if export_path:
+            if len(voxelizer.block_palette) < 2:
+                raise ValueError("The octree has no minecraft blocks to export (save it while building in minecraft or exporting)")
+            with instrumentation.stage("export"):
+                blocks_exported = StructureExporter(voxelizer.block_grid, voxelizer.block_palette).export(export_path)
+            instrumentation.count("blocks_exported", blocks_exported)
+            print(f"exported {blocks_exported} blocks to {export_path} ({os.path.getsize(export_path)} bytes)")
+
         if build_in_minecraft:
-            MinecraftWorldEditor(world_path).build_structure(voxelizer.block_grid, build_location)
-        else:
-            VoxelRenderer.render_without_minecraft_blocks(voxelizer.voxel_grid, voxelizer.color_grid)
+            if len(voxelizer.block_palette) < 2:
+                raise ValueError("The octree has no minecraft blocks to build (save it while building in minecraft or exporting)")
+            with instrumentation.stage("build"):
+                if incremental_voxelizer:
+                    blocks_written = incremental_voxelizer.build(voxelizer, world_path, build_location)
+                else:
+                    blocks_written = MinecraftWorldEditor(world_path).build_structure(voxelizer.block_grid, voxelizer.block_palette, build_location)
+            instrumentation.count("blocks_written", blocks_written)
+            if incremental_voxelizer:
+                print(f"{blocks_written} blocks changed in the world")
+
+        if incremental_voxelizer:
+            incremental_voxelizer.save()
+
+        if render and not build_in_minecraft:
+            with instrumentation.stage("render"):
+                VoxelRenderer.render_without_minecraft_blocks(voxelizer.voxel_grid, voxelizer.color_grid, exposed_faces_only)
             
     except Exception as e:
         print(f"Error: {e}")
+    finally:
+        if metrics_path:
+            instrumentation.write_report(metrics_path)
+            print(f"metrics written to {metrics_path}")
+
+def emit_binaries(paths):
+    """
+    Parses OBJ files and writes their binary .m2m files (ex. to precompile an asset library), skipping up to date ones
+
+    Args:
+    - paths (list): paths to OBJ files, or to directories which are searched recursively for OBJ files
+    """
+    model_paths = []
+    for path in paths:
+        if os.path.isdir(path):
+            for directory, _, file_names in sorted(os.walk(path)):
+                model_paths += [os.path.join(directory, name) for name in sorted(file_names) if name.lower().endswith(".obj")]
+        else:
+            model_paths.append(path)
+
+    for model_path in model_paths:
+        start_time = time.time()
+        ObjReader(model_path, use_binary=True).read_file()
+        print(f"{model_path} -> {model_path}.m2m ({time.time() - start_time:.2f}s)")
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Voxelizes a 3D model and either builds it in Minecraft or renders it with PyVista")
-    parser.add_argument("model_path", type=str, help="Path to the 3D model (ex. your_model.obj)")
-    parser.add_argument("voxel_size", type=float, help="Side length of each voxel (smaller means higher resolution and thus more voxels)")
+    parser.add_argument("model_path", type=str, nargs="?", help="Path to the 3D model (ex. your_model.obj), or to an octree saved with --save-octree (ex. your_model.svo)")
+    parser.add_argument("voxel_size", type=float, nargs="?", help="Side length of each voxel (smaller means higher resolution and thus more voxels), not needed for octrees")
     parser.add_argument("--world-path", type=str, help="Path to the Minecraft world")
     parser.add_argument("--build-location", type=str, help="Coordinates at which to build model in the form: \"(x,y,z)\" (quotes must be included)")
+    parser.add_argument("--workers", type=int, default=1, help="Number of processes to voxelize with (default: 1)")
+    parser.add_argument("--color-metric", type=str, choices=ColorLookup.METRICS, default="rgb", help="Color distance used to match Minecraft blocks: rgb or lab (perceptual, CIELAB delta E)")
+    parser.add_argument("--color-lut-bits", type=int, help="Match colors with a lookup table of this many bits per channel (1-8, 8 = exact), cached in ~/.cache/mesh2minecraft")
+    parser.add_argument("--sparse", action="store_true", help="Store the voxels in 16x16x16 chunks which are only allocated where needed (uses far less memory for fine voxel sizes)")
+    parser.add_argument("--exposed-faces-only", action="store_true", help="Only render the voxel faces that aren't hidden by neighboring voxels (faster for large models)")
+    parser.add_argument("--algorithm", type=str, choices=VoxelizerBase.ALGORITHMS, default="sat", help="How candidate voxels are found: sat (test each triangle's whole bounding box) or raster (scan-convert each triangle and only test voxels near its plane), both giving the same result")
+    parser.add_argument("--color-mode", type=str, choices=VoxelizerBase.COLOR_MODES, default="face", help="How voxel colors are sampled: face (the average vertex color of the first triangle intersecting each voxel) or barycentric (the vertex colors interpolated at the point closest to each voxel's center, averaged over every triangle intersecting it, which shows color gradients within large triangles but tests every candidate pair)")
+    parser.add_argument("--dither", type=str, choices=Dither.MODES, default="none", help="Dither the voxel colors onto the Minecraft blocks to avoid banding on smooth gradients: bayer (ordered dithering with a 4x4x4 threshold pattern, fast) or floyd-steinberg (3D error diffusion, slower but better) (default: none)")
+    parser.add_argument("--cache-size", type=int, default=1024, help="Size limit in megabytes of the cache of voxelization results in ~/.cache/mesh2minecraft/voxels, which are reused when the same model is voxelized with the same settings (default: 1024, 0 disables the cache)")
+    parser.add_argument("--fill", action="store_true", help="Fill the inside of the model (each interior voxel takes the color of the nearest surface voxel)")
+    parser.add_argument("--hollow", type=int, nargs="?", const=26, choices=SolidFill.SHELL_CONNECTIVITIES, help="Remove the voxels which can't be seen from outside (the inner layers of thick surfaces, or the inside with --fill) to save blocks, keeping a watertight shell: 26 (the default) keeps only voxels with a face exposed to the outside, and 6 also keeps voxels touching the outside by an edge or corner so the shell's voxels all touch by faces")
+    parser.add_argument("--lods", type=int, default=0, help="Also build this many coarser levels of detail (each halving the resolution) from the voxelization, and preview the coarsest one before the final build/render (default: 0)")
+    parser.add_argument("--no-binary", action="store_true", help="Don't load the model from (or save it to) a binary .m2m file next to it, which skips parsing the OBJ when it hasn't changed")
+    parser.add_argument("--save-octree", type=str, metavar="PATH", help="Save the voxelization as a compact sparse voxel octree (ex. your_model.svo), which can be given as the model path later to build/render without voxelizing")
+    parser.add_argument("--export", type=str, metavar="PATH", help="Export the blocks to a file that can be pasted into any world, in the format given by its extension: .schem (Sponge schematic, for WorldEdit), .nbt (vanilla structure, for structure blocks), or .litematic (Litematica) (the colors are matched to blocks even without --world-path)")
+    parser.add_argument("--incremental", action="store_true", help="After editing a model, only voxelize the parts of it whose triangles changed since the last --incremental run of the same model path with the same settings, and only rewrite the blocks (and chunks) that changed in the world (replaces the voxelization cache)")
+    parser.add_argument("--max-memory", type=int, metavar="MB", help="Voxelize out of core for models too large for memory: the model is parsed to disk and voxelized one tile at a time, with the tiles and every batch sized to fit this many megabytes (on top of what Python and the libraries take), and each tile is built in Minecraft (or saved as an octree in --tile-output) as soon as it's done")
+    parser.add_argument("--tile-output", type=str, metavar="DIR", help="Directory to save each tile's octree to with --max-memory when not building in Minecraft (default: the model path followed by .tiles)")
+    parser.add_argument("--metrics", type=str, metavar="PATH", help="Time each stage and record counts (faces, candidate pairs tested, pairs rejected by each separating axis, filled voxels, blocks written) and peak memory, printing them as it goes and writing them to this JSON file")
+    parser.add_argument("--profile", type=str, nargs="+", choices=STAGES, metavar="STAGE", help=f"Run these stages under cProfile, printing their most expensive functions and writing their full stats to --profile-dir (stages: {', '.join(STAGES)})")
+    parser.add_argument("--profile-dir", type=str, default=".", help="Directory to write the profiles to, as STAGE.prof (default: current directory)")
+    parser.add_argument("--batch", type=str, metavar="MANIFEST", help="Build every model listed in this JSON (or YAML) manifest into one world instead, voxelizing --workers models at a time and writing the world once at the end (with --metrics, the throughput report is written there)")
+    parser.add_argument("--no-render", action="store_true", help="Don't render with PyVista (or preview levels of detail) when not building in Minecraft, ex. when only saving an octree or timing the voxelization, so PyVista and VTK are never loaded")
+    parser.add_argument("--emit-binary", type=str, nargs="+", metavar="PATH", help="Only write the binary .m2m files of these OBJ files (or of every OBJ file in these directories) and exit")
     args = parser.parse_args()
 
-    if args.voxel_size <= 0:
+    if args.emit_binary:
+        emit_binaries(args.emit_binary)
+        raise SystemExit
+
+    if args.batch:
+        if args.workers < 1:
+            raise ValueError("Number of workers must be >= 1")
+        BatchRunner(args.batch, args.workers, args.color_metric, args.color_lut_bits, LUT_CACHE_DIR, not args.no_binary).run(args.metrics)
+        raise SystemExit
+
+    if args.model_path is None:
+        raise ValueError("Model path is required")
+    if args.voxel_size is None and not args.model_path.lower().endswith(".svo"):
+        raise ValueError("Voxel size is required")
+
+    if args.voxel_size is not None and args.voxel_size <= 0:
         raise ValueError("Voxel size must be > 0")
 
+    if args.workers < 1:
+        raise ValueError("Number of workers must be >= 1")
+    if args.cache_size < 0:
+        raise ValueError("Cache size must be >= 0")
+    if args.lods < 0:
+        raise ValueError("Number of levels of detail must be >= 0")
+    if args.max_memory is not None:
+        if args.max_memory < 1:
+            raise ValueError("Max memory must be >= 1")
+        if args.fill or args.hollow or args.lods or args.save_octree or args.export or args.incremental or args.model_path.lower().endswith(".svo"):
+            raise ValueError("Out of core voxelization (--max-memory) can't be combined with --fill, --hollow, --lods, --save-octree, --export, --incremental, or octree input")
+    if args.fill and args.sparse:
+        raise ValueError("Filling the interior (--fill) works on dense grids (a filled model isn't sparse), so it can't be combined with --sparse")
+    if (args.incremental or args.fill or args.hollow) and args.model_path.lower().endswith(".svo"):
+        raise ValueError("Incremental voxelization (--incremental), --fill, and --hollow need a model rather than an octree")
+    if args.export and os.path.splitext(args.export)[1].lower() not in StructureExporter.FORMATS:
+        raise ValueError(f"Export path must end in one of {', '.join(StructureExporter.FORMATS)}")
+
     build_location = None
     if args.build_location:
         try:
@@ -64,4 +327,9 @@ if __name__ == "__main__":
         except ValueError:
             raise ValueError("Build location must be in the form \"(x,y,z)\" (quotes must be included) where x, y, and z are all ints")
 
-    main(args.model_path, args.voxel_size, args.world_path, build_location)
\ No newline at end of file
+    main(args.model_path, args.voxel_size, args.world_path, build_location, workers=args.workers, color_metric=args.color_metric, 
+         lut_bits=args.color_lut_bits, sparse=args.sparse, exposed_faces_only=args.exposed_faces_only, algorithm=args.algorithm, 
+         fill=args.fill, cache_size=args.cache_size, use_binary=not args.no_binary, lods=args.lods, octree_path=args.save_octree, 
+         max_memory=args.max_memory, tile_output=args.tile_output, metrics_path=args.metrics, profile_stages=args.profile or (), 
+         profile_dir=args.profile_dir, color_mode=args.color_mode, dither=args.dither, render=not args.no_render, 
+         export_path=args.export, incremental=args.incremental, hollow=args.hollow)
\ No newline at end of file
@@ -0,0 +1,342 @@
+import json
+import zlib
+import struct
+import numpy as np
+from chunked_grid import argwhere
+
+class SparseVoxelOctree:
+    """
+    Sparse voxel octree stored as flat arrays: each level holds an 8 bit child mask per node, with nodes in Morton order so
+    that a node's children are contiguous in the next level (and are found by counting bits rather than with pointers),
+    and the leaves (voxels) hold their colors and block palette indices
+    """
+
+    MAGIC = b"M2MSVO"
+    VERSION = 1
+    HEADER = struct.Struct("<6sBB3I3qdBI") # magic, version, depth, shape, grid_min_corner, voxel_size, block bytes, palette bytes
+    POPCOUNTS = np.array([bin(i).count("1") for i in range(256)], dtype=np.int64)
+    LEAF_BATCH = 1 << 16 # default number of leaves streamed at a time by iter_leaves
+    SLOT_OFFSETS = np.array([((slot >> 2) & 1, (slot >> 1) & 1, slot & 1) for slot in range(8)]) # child positions within a node
+
+    def __init__(self, shape, grid_min_corner, voxel_size, masks, colors, blocks, block_palette):
+        """
+        Initializes SparseVoxelOctree (see from_grids and load for building one)
+
+        Args:
+        - shape (list): dimensions of the grid the octree covers
+        - grid_min_corner (list): position of the voxel in the minimum corner of the grid
+        - voxel_size (float): sidelength of each voxel
+        - masks (list): uint8 array of child masks for each level above the leaves, from the root down
+        - colors (np.ndarray): (M, 3) array of each leaf's RGB value, in Morton order
+        - blocks (np.ndarray): (M,) array of each leaf's index into block_palette, in Morton order
+        - block_palette (list): minecraft block names which blocks index into (0 = no block)
+        """
+        self.shape = tuple(int(n) for n in shape)
+        self.grid_min_corner = [int(n) for n in grid_min_corner]
+        self.voxel_size = voxel_size
+        self.depth = len(masks)
+        self.masks = masks
+        self.colors = colors
+        self.blocks = blocks
+        self.block_palette = block_palette
+        # index of each node's first child in the next level
+        self.first_children = [np.cumsum(self.POPCOUNTS[mask]) - self.POPCOUNTS[mask] for mask in masks]
+        self.voxel_grid = OctreeGrid(self, "voxel")
+        self.color_grid = OctreeGrid(self, "color")
+        self.block_grid = OctreeGrid(self, "block")
+
+    @property
+    def nbytes(self):
+        """Total number of bytes used by the nodes and leaves"""
+        return sum(mask.nbytes for mask in self.masks) + self.colors.nbytes + self.blocks.nbytes
+
+    @classmethod
+    def from_grids(cls, voxels, voxel_size):
+        """
+        Builds an octree from voxelization results
+
+        Args:
+        - voxels (VoxelizerBase or CachedVoxels): voxelizer (or anything with the same grid attributes) that has been run
+        - voxel_size (float): sidelength of each voxel
+
+        Returns:
+        - SparseVoxelOctree: octree holding the present voxels
+        """
+        shape = voxels.voxel_grid.shape[:3]
+        depth = max((max(shape) - 1).bit_length(), 1)
+        indices = argwhere(voxels.voxel_grid)
+        x, y, z = indices.T
+        codes = cls.encode(indices)
+        order = np.argsort(codes)
+        codes = codes[order]
+        colors = np.asarray(voxels.color_grid[x, y, z], dtype=np.uint8)[order]
+        blocks = np.asarray(voxels.block_grid[x, y, z])[order]
+
+        # build the levels from the leaves up, each parent's mask having a bit set for each of its present children
+        masks = []
+        for _ in range(depth):
+            parents = codes >> np.uint64(3)
+            starts = np.flatnonzero(np.diff(parents, prepend=~np.uint64(0)) != 0)
+            child_bits = (np.uint8(1) << (codes & np.uint64(7)).astype(np.uint8))
+            masks.append(np.bitwise_or.reduceat(child_bits, starts) if len(codes) else np.empty(0, dtype=np.uint8))
+            codes = parents[starts]
+        masks.reverse()
+        return cls(shape, voxels.grid_min_corner, voxel_size, masks, colors, blocks, list(voxels.block_palette))
+
+    @staticmethod
+    def encode(indices):
+        """
+        Interleaves the bits of grid indices into Morton codes (x bits highest within each group of three)
+
+        Args:
+        - indices (np.ndarray): (N, 3) array of grid indices (each below 2 ** 21)
+
+        Returns:
+        - np.ndarray: (N,) uint64 array of Morton codes
+        """
+        codes = np.zeros(len(indices), dtype=np.uint64)
+        for axis in range(3):
+            v = indices[:, axis].astype(np.uint64) & np.uint64(0x1fffff)
+            v = (v | v << np.uint64(32)) & np.uint64(0x1f00000000ffff)
+            v = (v | v << np.uint64(16)) & np.uint64(0x1f0000ff0000ff)
+            v = (v | v << np.uint64(8)) & np.uint64(0x100f00f00f00f00f)
+            v = (v | v << np.uint64(4)) & np.uint64(0x10c30c30c30c30c3)
+            v = (v | v << np.uint64(2)) & np.uint64(0x1249249249249249)
+            codes |= v << np.uint64(2 - axis)
+        return codes
+
+    def find_leaves(self, indices):
+        """
+        Looks up voxels by descending from the root, all at once
+
+        Args:
+        - indices (np.ndarray): (N, 3) array of grid indices
+
+        Returns:
+        - np.ndarray: (N,) index of each voxel's leaf (-1 where the voxel isn't present)
+        """
+        indices = np.asarray(indices, dtype=np.int64).reshape(-1, 3)
+        found = ((indices >= 0) & (indices < self.shape)).all(axis=1) & (len(self.colors) > 0)
+        codes = self.encode(np.where(found[:, np.newaxis], indices, 0))
+        nodes = np.zeros(len(indices), dtype=np.int64)
+        for level in range(self.depth):
+            slots = ((codes >> np.uint64(3 * (self.depth - 1 - level))) & np.uint64(7)).astype(np.int64)
+            masks = self.masks[level][nodes].astype(np.int64)
+            found &= ((masks >> slots) & 1).astype(bool)
+            children = self.first_children[level][nodes] + self.POPCOUNTS[masks & ((1 << slots) - 1)]
+            nodes = np.where(found, children, 0)
+        return np.where(found, nodes, -1)
+
+    def query_box(self, box_min, box_max):
+        """
+        Finds the present voxels within a box, only descending into the nodes that overlap it
+
+        Args:
+        - box_min (list): minimum grid indices of the box (inclusive)
+        - box_max (list): maximum grid indices of the box (inclusive)
+
+        Returns:
+        - indices (np.ndarray): (M, 3) array of grid indices of the voxels, in Morton order
+        - leaves (np.ndarray): (M,) index of each voxel's leaf
+        """
+        if not len(self.colors):
+            return np.empty((0, 3), dtype=np.int64), np.empty(0, dtype=np.int64)
+        box_min, box_max = np.asarray(box_min), np.asarray(box_max)
+        nodes, origins = np.zeros(1, dtype=np.int64), np.zeros((1, 3), dtype=np.int64)
+        for level in range(self.depth):
+            nodes, origins = self._expand(level, nodes, origins)
+            size = 1 << (self.depth - level - 1)
+            overlaps = ((origins * size <= box_max) & ((origins + 1) * size - 1 >= box_min)).all(axis=1)
+            nodes, origins = nodes[overlaps], origins[overlaps]
+        return origins, nodes
+
+    def iter_leaves(self, batch_size=None):
+        """
+        Streams the present voxels in batches of consecutive leaves, walking the tree in Morton order and only descending 
+        into the nodes holding each batch's leaves, so the voxels' indices never have to be held all at once
+
+        Args:
+        - batch_size (int): number of leaves in each batch (defaults to LEAF_BATCH)
+
+        Returns:
+        - generator: (indices, colors, blocks) arrays of each batch's grid indices, RGB values, and block palette indices
+        """
+        batch_size = batch_size or self.LEAF_BATCH
+        if not len(self.colors):
+            return
+        # the first leaf below each node of every level, followed by the number of leaves, so that node n of a level holds 
+        # leaves first_leaves[level][n] up to first_leaves[level][n + 1] (one int per node, like first_children)
+        first_leaves = [np.arange(len(self.colors) + 1)]
+        for level in reversed(range(self.depth)):
+            first_leaves.insert(0, first_leaves[0][np.append(self.first_children[level], len(first_leaves[0]) - 1)])
+
+        for start in range(0, len(self.colors), batch_size):
+            stop = min(start + batch_size, len(self.colors))
+            nodes, origins = np.zeros(1, dtype=np.int64), np.zeros((1, 3), dtype=np.int64)
+            for level in range(self.depth):
+                nodes, origins = self._expand(level, nodes, origins)
+                holds = (first_leaves[level + 1][nodes] < stop) & (first_leaves[level + 1][nodes + 1] > start)
+                nodes, origins = nodes[holds], origins[holds]
+            yield origins, self.colors[start:stop], self.blocks[start:stop]
+
+    def _expand(self, level, nodes, origins):
+        """
+        Expands nodes into their present children, in Morton order
+
+        Args:
+        - level (int): level of the nodes
+        - nodes (np.ndarray): (K,) index of each node within its level
+        - origins (np.ndarray): (K, 3) position of each node, in units of its size
+
+        Returns:
+        - np.ndarray: (M,) index of each child within the next level
+        - np.ndarray: (M, 3) position of each child, in units of its size
+        """
+        masks = self.masks[level][nodes].astype(np.int64)
+        parents, child_slots = np.nonzero(((masks[:, np.newaxis] >> np.arange(8)) & 1).astype(bool))
+        children = self.first_children[level][nodes[parents]] + self.POPCOUNTS[masks[parents] & ((1 << child_slots) - 1)]
+        return children, origins[parents] * 2 + self.SLOT_OFFSETS[child_slots]
+
+    def save(self, path):
+        """
+        Writes the octree to a compact binary file: a fixed header, the block palette (JSON), the node count of each
+        level, and then the zlib compressed child masks, leaf colors, and leaf block indices
+
+        Args:
+        - path (str): path to write to (ex. model.svo)
+        """
+        palette = json.dumps(self.block_palette).encode()
+        header = self.HEADER.pack(self.MAGIC, self.VERSION, self.depth, *self.shape, *self.grid_min_corner,
+                                  self.voxel_size, self.blocks.dtype.itemsize, len(palette))
+        counts = np.array([len(mask) for mask in self.masks], dtype="<u8")
+        body = b"".join([mask.tobytes() for mask in self.masks] + [self.colors.tobytes(), self.blocks.astype(self.blocks.dtype.newbyteorder("<")).tobytes()])
+        with open(path, "wb") as f:
+            f.write(header + palette + counts.tobytes() + zlib.compress(body))
+
+    @classmethod
+    def load(cls, path):
+        """
+        Reads an octree written by save
+
+        Args:
+        - path (str): path to read from
+
+        Returns:
+        - SparseVoxelOctree: the octree
+
+        Raises:
+        - ValueError: if the file isn't an octree file of this version
+        """
+        with open(path, "rb") as f:
+            data = f.read()
+        magic, version, depth, *fields = cls.HEADER.unpack_from(data)
+        if magic != cls.MAGIC or version != cls.VERSION:
+            raise ValueError(f"Invalid octree file: {path}")
+        shape, grid_min_corner, (voxel_size, block_bytes, palette_bytes) = fields[:3], fields[3:6], fields[6:]
+        position = cls.HEADER.size
+        block_palette = json.loads(data[position:position + palette_bytes])
+        position += palette_bytes
+        counts = np.frombuffer(data, dtype="<u8", count=depth, offset=position).astype(np.int64)
+        body = zlib.decompress(data[position + 8 * depth:])
+
+        masks, position = [], 0
+        for count in counts:
+            masks.append(np.frombuffer(body, dtype=np.uint8, count=count, offset=position))
+            position += count
+        leaf_count = int(cls.POPCOUNTS[masks[-1]].sum()) if depth else 0
+        colors = np.frombuffer(body, dtype=np.uint8, count=3 * leaf_count, offset=position).reshape(-1, 3)
+        blocks = np.frombuffer(body, dtype=f"<u{block_bytes}", count=leaf_count, offset=position + 3 * leaf_count)
+        return cls(shape, grid_min_corner, voxel_size, masks, colors, blocks, block_palette)
+
+class OctreeGrid:
+    """View of one of an octree's attributes which can be indexed like a grid (so it can be used in place of one)"""
+
+    def __init__(self, octree, attribute):
+        """
+        Initializes OctreeGrid
+
+        Args:
+        - octree (SparseVoxelOctree): octree to read from
+        - attribute (str): "voxel" (presence), "color" (RGB values), or "block" (block palette indices)
+        """
+        self.octree = octree
+        self.attribute = attribute
+        self.shape = octree.shape + ((3,) if attribute == "color" else ())
+
+    def __getitem__(self, index):
+        """
+        Gets the values of the voxels at the given indices (absent voxels are 0)
+
+        Args:
+        - index (tuple): x, y, and z indices (ints or equally sized int arrays)
+
+        Returns:
+        - np.ndarray: values of the voxels (or a single value if the indices were ints)
+        """
+        x, y, z = (np.atleast_1d(np.asarray(i, dtype=np.int64)) for i in index)
+        leaves = self.octree.find_leaves(np.stack((x, y, z), axis=1))
+        present = leaves >= 0
+        if self.attribute == "voxel":
+            values = present
+        else:
+            source = self.octree.colors if self.attribute == "color" else self.octree.blocks
+            values = np.zeros((len(leaves),) + source.shape[1:], dtype=source.dtype)
+            values[present] = source[leaves[present]]
+        return values if np.ndim(index[0]) else values[0]
+
+    def _select(self, indices, colors, blocks):
+        """
+        Gets this view's values of present voxels, dropping the voxels without a block from block_grid (octrees saved 
+        without minecraft have voxels whose block index is 0, which a dense or chunked block grid wouldn't have)
+
+        Args:
+        - indices (np.ndarray): (M, 3) grid indices of the voxels
+        - colors (np.ndarray): (M, 3) RGB values of the voxels (only needed for color_grid)
+        - blocks (np.ndarray): (M,) block palette indices of the voxels (only needed for block_grid)
+
+        Returns:
+        - np.ndarray: (K, 3) grid indices of the voxels with a value
+        - np.ndarray: values of those voxels
+        """
+        if self.attribute == "block":
+            return indices[blocks > 0], blocks[blocks > 0]
+        return indices, colors if self.attribute == "color" else np.ones(len(indices), dtype=bool)
+
+    def argwhere(self):
+        """
+        Gets the indices of every non-empty cell (for block_grid, only the voxels with a block)
+
+        Returns:
+        - np.ndarray: (M, 3) array of x, y, and z indices
+        """
+        return self.query_box([0, 0, 0], np.array(self.octree.shape) - 1)[0]
+
+    def query_box(self, box_min, box_max):
+        """
+        Gets the indices and values of the non-empty cells within a box, only descending into the nodes overlapping it
+
+        Args:
+        - box_min (list): minimum grid indices of the box (inclusive)
+        - box_max (list): maximum grid indices of the box (inclusive)
+
+        Returns:
+        - np.ndarray: (M, 3) array of x, y, and z indices, in Morton order
+        - np.ndarray: values of the cells
+        """
+        indices, leaves = self.octree.query_box(box_min, box_max)
+        colors = self.octree.colors[leaves] if self.attribute == "color" else None
+        blocks = self.octree.blocks[leaves] if self.attribute == "block" else None
+        return self._select(indices, colors, blocks)
+
+    def iter_batches(self, batch_size):
+        """
+        Streams the indices and values of the non-empty cells in batches of consecutive leaves (see iter_leaves)
+
+        Args:
+        - batch_size (int): number of leaves read at a time
+
+        Returns:
+        - generator: (M, 3) indices and values of each batch's cells, in Morton order
+        """
+        for indices, colors, blocks in self.octree.iter_leaves(batch_size):
+            yield self._select(indices, colors, blocks)
@@ -1,10 +1,17 @@
+import io
+import os
+import gzip
+import time
+import zlib
 import numpy as np
-import pyvista as pv
-from pyanvileditor import world
+from chunked_grid import argwhere, iter_batches
 
 class MinecraftWorldEditor:
     """Class that displays voxelization results by directly editing a minecraft world"""
 
+    SECTOR_SIZE = 4096 # region files are divided into 4KiB sectors
+    BUILD_BATCH = 1 << 20 # approximate number of blocks build_structure writes at a time
+
     def __init__(self, world_path):
         """
         Initializes MinecraftWorldEditor
@@ -14,58 +21,450 @@ class MinecraftWorldEditor:
         """
         self.world_path = world_path
 
-    def build_structure(self, block_grid, build_location):
+    def build_structure(self, block_grid, block_palette, build_location):
+        """
+        Builds the structure defined by the given block grid, streaming its blocks in batches (see iter_batches) and 
+        rewriting each region file a batch touches once per batch (so once in all for structures of up to BUILD_BATCH blocks)
+
+        Args:
+        - block_grid (np.ndarray, ChunkedGrid, or OctreeGrid): 3D grid of indices into block_palette (0 = no block)
+        - block_palette (list): minecraft block names
+        - build_location (tuple): the XYZ coords at which to build the structure
+
+        Returns:
+        - int: number of blocks written
+
+        Raises:
+        - ValueError: if the structure doesn't fit within y = 0-255 or lies in chunks that haven't been generated
+        """
+        # checked up front, since the batches before one that doesn't fit would already be written (the grid spans its 
+        # voxels' bounding box, so the check is the same as for the blocks themselves)
+        if build_location[1] < 0 or build_location[1] + block_grid.shape[1] - 1 > 255:
+            raise ValueError("Structure must fit within y = 0-255")
+        offset = np.array(build_location, dtype=np.int64)
+        return sum(self.write_blocks([(indices + offset, palette_ids, block_palette)]) 
+                   for indices, palette_ids in iter_batches(block_grid, self.BUILD_BATCH))
+
+    @staticmethod
+    def get_blocks(block_grid, build_location):
         """
-        Builds the structure defined by the given block grid
+        Gets the world coordinates and palette indices of the blocks of a block grid
 
         Args:
-        - block_grid (np.ndarray): 3D grid of block names 
+        - block_grid (np.ndarray or ChunkedGrid): 3D grid of indices into a block palette (0 = no block)
         - build_location (tuple): the XYZ coords at which to build the structure
+
+        Returns:
+        - positions (np.ndarray): (M, 3) array of world coordinates of the blocks
+        - palette_ids (np.ndarray): (M,) array of indices into the block palette
+        """
+        indices = argwhere(block_grid)
+        palette_ids = np.asarray(block_grid[indices[:, 0], indices[:, 1], indices[:, 2]], dtype=np.int64)
+        return indices + np.array(build_location, dtype=np.int64), palette_ids
+
+    def write_blocks(self, structures):
+        """
+        Writes the blocks of one or more structures, going through the affected region files in order and rewriting each 
+        of them once (where structures overlap, the later one's blocks are kept)
+
+        Args:
+        - structures (list): (positions, palette_ids, block_palette) of each structure, as returned by get_blocks along 
+        with the minecraft block names its palette_ids index into
+
+        Returns:
+        - int: number of blocks written
+
+        Raises:
+        - ValueError: if the structures don't fit within y = 0-255 or lie in chunks that haven't been generated
+        """
+        # merge the structures' palettes into one list of block states
+        state_ids = {}
+        all_positions, all_ids = [np.empty((0, 3), dtype=np.int64)], [np.empty(0, dtype=np.int64)]
+        for positions, palette_ids, block_palette in structures:
+            remap = np.array([state_ids.setdefault(f"minecraft:{block_name}", len(state_ids)) for block_name in block_palette], dtype=np.int64)
+            all_positions.append(np.asarray(positions, dtype=np.int64))
+            all_ids.append(remap[np.asarray(palette_ids, dtype=np.int64)])
+        block_states = list(state_ids)
+        positions, palette_ids = np.concatenate(all_positions), np.concatenate(all_ids)
+
+        if len(structures) > 1 and len(positions):
+            # keep the last block written to each position
+            _, last = np.unique(positions[::-1], axis=0, return_index=True)
+            keep = np.sort(len(positions) - 1 - last)
+            positions, palette_ids = positions[keep], palette_ids[keep]
+
+        if len(positions) and (positions[:, 1].min() < 0 or positions[:, 1].max() > 255):
+            raise ValueError("Structure must fit within y = 0-255")
+
+        # each region file holds 32x32 chunks, each of which holds 16x16 columns of blocks
+        for (region_x, region_z), voxels in self._group_by(positions[:, [0, 2]] >> 9):
+            self._write_region(region_x, region_z, positions[voxels], palette_ids[voxels], block_states)
+        return len(positions)
+
+    @staticmethod
+    def _group_by(keys):
+        """
+        Groups rows by their keys
+
+        Args:
+        - keys (np.ndarray): (M, K) array of integer keys
+
+        Returns:
+        - generator: (key tuple, array of row indices with that key) pairs
+        """
+        unique_keys, inverse = np.unique(keys, axis=0, return_inverse=True)
+        order = np.argsort(inverse.reshape(-1), kind="stable")
+        boundaries = np.cumsum(np.bincount(inverse.reshape(-1), minlength=len(unique_keys)))[:-1]
+        for key, rows in zip(unique_keys.tolist(), np.split(order, boundaries)):
+            yield tuple(key), rows
+
+    def _write_region(self, region_x, region_z, positions, palette_ids, block_states):
+        """
+        Places blocks in the chunks of a region file, and then rewrites the region file in a single pass
+
+        Args:
+        - region_x (int): region x coordinate
+        - region_z (int): region z coordinate
+        - positions (np.ndarray): (M, 3) array of world coordinates of the blocks
+        - palette_ids (np.ndarray): (M,) array of indices into block_states
+        - block_states (list): namespaced minecraft block names
+        """
+        region_path = os.path.join(self.world_path, "region", f"r.{region_x}.{region_z}.mca")
+        with open(region_path, "rb") as region_file:
+            region_data = region_file.read()
+
+        # the header holds a location (3 byte sector offset, 1 byte sector count) then a timestamp for each chunk
+        locations = np.frombuffer(region_data, dtype=">u4", count=1024)
+        timestamps = np.frombuffer(region_data, dtype=">u4", count=1024, offset=self.SECTOR_SIZE).copy()
+        chunk_payloads = {}
+        for chunk_index in np.flatnonzero(locations).tolist():
+            start = int(locations[chunk_index] >> 8) * self.SECTOR_SIZE
+            length = int.from_bytes(region_data[start:start + 4], byteorder="big")
+            chunk_payloads[chunk_index] = region_data[start:start + 4 + length]
+
+        for (chunk_x, chunk_z), voxels in self._group_by(positions[:, [0, 2]] >> 4):
+            chunk_index = (chunk_x & 31) + (chunk_z & 31) * 32
+            if chunk_index not in chunk_payloads:
+                raise ValueError(f"Chunk ({chunk_x}, {chunk_z}) hasn't been generated yet")
+
+            chunk_nbt = self._decode_chunk(chunk_payloads[chunk_index])
+            self._write_chunk(chunk_nbt, positions[voxels], palette_ids[voxels], block_states)
+            chunk_payloads[chunk_index] = self._encode_chunk(chunk_nbt)
+            timestamps[chunk_index] = int(time.time())
+
+        # lay the chunks out back to back after the header
+        new_locations = np.zeros(1024, dtype=">u4")
+        body = []
+        sector = 2
+        for chunk_index, payload in sorted(chunk_payloads.items()):
+            sector_count = -(-len(payload) // self.SECTOR_SIZE)
+            if sector_count > 255:
+                raise ValueError(f"Chunk at index {chunk_index} of {region_path} is too large to be stored")
+            new_locations[chunk_index] = (sector << 8) | sector_count
+            body.append(payload + bytes(sector_count * self.SECTOR_SIZE - len(payload)))
+            sector += sector_count
+
+        temp_path = region_path + ".tmp"
+        with open(temp_path, "wb") as region_file:
+            region_file.write(new_locations.tobytes())
+            region_file.write(timestamps.astype(">u4").tobytes())
+            region_file.write(b"".join(body))
+        os.replace(temp_path, region_path)
+
+    @staticmethod
+    def get_nbt():
+        """
+        Imports PyAnvilEditor's NBT modules on first use, since only runs that write chunks need them (not runs that only
+        render, export, or save an octree)
+
+        Returns:
+        - module: pyanvileditor.nbt
+        - module: pyanvileditor.stream
+        """
+        from pyanvileditor import nbt, stream
+        return nbt, stream
+
+    @staticmethod
+    def _decode_chunk(payload):
+        """
+        Decompresses and parses a chunk stored in a region file
+
+        Args:
+        - payload (bytes): 4 byte length, 1 byte compression type, then the compressed chunk
+
+        Returns:
+        - nbt.CompoundTag: the chunk's NBT data
+        """
+        length = int.from_bytes(payload[:4], byteorder="big")
+        compressed = payload[5:4 + length]
+        data = gzip.decompress(compressed) if payload[4] == 1 else zlib.decompress(compressed)
+        nbt, stream = MinecraftWorldEditor.get_nbt()
+        return nbt.parse_nbt(stream.InputStream(data))
+
+    @staticmethod
+    def _encode_chunk(chunk_nbt):
+        """
+        Serializes and compresses a chunk to be stored in a region file
+
+        Args:
+        - chunk_nbt (nbt.CompoundTag): the chunk's NBT data
+
+        Returns:
+        - bytes: 4 byte length, 1 byte compression type (2 = zlib), then the compressed chunk
+        """
+        buffer = io.BytesIO()
+        chunk_nbt.serialize(buffer)
+        compressed = zlib.compress(buffer.getvalue())
+        return (len(compressed) + 1).to_bytes(4, byteorder="big") + bytes([2]) + compressed
+
+    def _write_chunk(self, chunk_nbt, positions, palette_ids, block_states):
+        """
+        Places blocks in a chunk, one section (16x16x16 blocks) at a time
+
+        Args:
+        - chunk_nbt (nbt.CompoundTag): the chunk's NBT data
+        - positions (np.ndarray): (M, 3) array of world coordinates of the blocks
+        - palette_ids (np.ndarray): (M,) array of indices into block_states
+        - block_states (list): namespaced minecraft block names
         """
-        with world.World(self.world_path) as minecraft_world:
-            for x in range(block_grid.shape[0]):
-                for y in range(block_grid.shape[1]):
-                    for z in range(block_grid.shape[2]):
-                        if block_grid[x, y, z]:
-                            block = minecraft_world.get_block((x + build_location[0], y + build_location[1], z + build_location[2]))
-                            block.set_state(world.BlockState(f"minecraft:{block_grid[x, y, z]}", {}))
+        nbt = self.get_nbt()[0]
+        sections_tag = chunk_nbt.get("Level").get("Sections")
+        sections = {section.get("Y").get(): section for section in sections_tag.children}
+
+        for (section_y,), voxels in self._group_by(positions[:, [1]] >> 4):
+            if section_y not in sections:
+                sections[section_y] = nbt.CompoundTag(children=[
+                    nbt.ByteTag(section_y, tag_name="Y"),
+                    nbt.ByteArrayTag(tag_name="BlockLight", children=[nbt.ByteTag(0)] * 2048),
+                    nbt.ByteArrayTag(tag_name="SkyLight", children=[nbt.ByteTag(-1)] * 2048)])
+                sections_tag.add_child(sections[section_y])
+
+            x, y, z = (positions[voxels] & 15).T
+            self._write_section(sections[section_y], (y << 8) | (z << 4) | x, palette_ids[voxels], block_states)
+
+    def _write_section(self, section, block_indices, palette_ids, block_states):
+        """
+        Places blocks in a section by rebuilding its palette and packed block states all at once
+
+        Args:
+        - section (nbt.CompoundTag): the section's NBT data
+        - block_indices (np.ndarray): (M,) array of block indices within the section (y * 256 + z * 16 + x)
+        - palette_ids (np.ndarray): (M,) array of indices into block_states
+        - block_states (list): namespaced minecraft block names
+        """
+        nbt = self.get_nbt()[0]
+        if section.has("Palette"):
+            palette = list(section.get("Palette").children)
+            states = self._unpack_block_states(section.get("BlockStates").get())
+        else: # sections containing only air have no palette or block states
+            palette = [nbt.CompoundTag(children=[nbt.StringTag("minecraft:air", tag_name="Name")])]
+            states = np.zeros(4096, dtype=np.int64)
+
+        # reuse the section's palette entries for blocks it already contains (unless they have properties)
+        palette_names = [None if entry.has("Properties") else entry.get("Name").get() for entry in palette]
+        section_ids = np.zeros(len(block_states), dtype=np.int64)
+        for palette_id in np.unique(palette_ids).tolist():
+            if block_states[palette_id] not in palette_names:
+                palette.append(nbt.CompoundTag(children=[nbt.StringTag(block_states[palette_id], tag_name="Name")]))
+                palette_names.append(block_states[palette_id])
+            section_ids[palette_id] = palette_names.index(block_states[palette_id])
+        states[block_indices] = section_ids[palette_ids]
+
+        # drop palette entries which no longer appear in the section
+        used, states = np.unique(states, return_inverse=True)
+        palette = [palette[i] for i in used.tolist()]
+
+        packed = self._pack_block_states(states.reshape(-1), max(4, (len(palette) - 1).bit_length()))
+        section.add_child(nbt.ListTag(nbt.CompoundTag.clazz_id, tag_name="Palette", children=palette))
+        section.add_child(nbt.LongArrayTag(tag_name="BlockStates", children=[nbt.LongTag(v) for v in packed.tolist()]))
+
+    @staticmethod
+    def _unpack_block_states(longs):
+        """
+        Unpacks a section's block states, which are tightly packed across 64 bit longs (values may span two longs)
+
+        Args:
+        - longs (list): the section's BlockStates values
+
+        Returns:
+        - np.ndarray: (4096,) array of palette indices
+        """
+        words = np.array(longs, dtype=np.int64).view(np.uint64)
+        width = len(words) * 64 // 4096
+        offsets = np.arange(4096, dtype=np.uint64) * np.uint64(width)
+        word_indices, shifts = (offsets >> np.uint64(6)).astype(np.int64), offsets & np.uint64(63)
+
+        values = words[word_indices] >> shifts
+        spans = shifts + np.uint64(width) > np.uint64(64)
+        next_words = words[np.minimum(word_indices + 1, len(words) - 1)]
+        values |= np.where(spans, next_words << ((np.uint64(64) - shifts) & np.uint64(63)), np.uint64(0))
+        return (values & np.uint64((1 << width) - 1)).astype(np.int64)
+
+    @staticmethod
+    def _pack_block_states(states, width):
+        """
+        Packs a section's block states tightly across 64 bit longs (values may span two longs)
+
+        Args:
+        - states (np.ndarray): (4096,) array of palette indices
+        - width (int): bits per palette index
+
+        Returns:
+        - np.ndarray: (64 * width,) array of signed 64 bit longs
+        """
+        values = states.astype(np.uint64)
+        offsets = np.arange(4096, dtype=np.uint64) * np.uint64(width)
+        word_indices, shifts = (offsets >> np.uint64(6)).astype(np.int64), offsets & np.uint64(63)
+
+        words = np.zeros(64 * width, dtype=np.uint64)
+        np.bitwise_or.at(words, word_indices, values << shifts)
+        spans = shifts + np.uint64(width) > np.uint64(64)
+        np.bitwise_or.at(words, word_indices[spans] + 1, values[spans] >> (np.uint64(64) - shifts[spans]))
+        return words.view(np.int64)
 
 class VoxelRenderer:
-    """Class that renders voxels without minecraft (using PyVista)"""
+    """Class that renders voxels without minecraft (using PyVista, which is only imported once a mesh is built)"""
+
+    # corners of a voxel relative to its minimum corner, in VTK's hexahedron order
+    HEXAHEDRON_CORNERS = np.array([
+        (0, 0, 0), (1, 0, 0), (1, 1, 0), (0, 1, 0),
+        (0, 0, 1), (1, 0, 1), (1, 1, 1), (0, 1, 1)])
+
+    # for each of the six faces of a voxel: the direction it faces, and its corners (as indices into HEXAHEDRON_CORNERS)
+    FACE_DIRECTIONS = np.array([(-1, 0, 0), (1, 0, 0), (0, -1, 0), (0, 1, 0), (0, 0, -1), (0, 0, 1)])
+    FACE_CORNERS = np.array([
+        (0, 4, 7, 3), (1, 2, 6, 5),
+        (0, 1, 5, 4), (3, 7, 6, 2),
+        (0, 3, 2, 1), (4, 5, 6, 7)])
+    MESH_BATCH = 1 << 18 # approximate number of voxels turned into cells at a time
+
+    @staticmethod
+    def get_pyvista():
+        """
+        Imports PyVista on first use, since importing it (and VTK) takes longer than the rest of startup put together and 
+        isn't needed by runs that only build in minecraft or export
+
+        Returns:
+        - module: pyvista
+        """
+        import pyvista
+        return pyvista
 
     @staticmethod
-    def render_without_minecraft_blocks(voxel_grid, color_grid):
+    def render_without_minecraft_blocks(voxel_grid, color_grid, exposed_faces_only=False):
         """
         Renders voxels with PyVista
 
         Args:
-        - voxel_grid (np.ndarray): 3D bool array indicating voxel presence
-        - color_grid (np.ndarray): 3D array containing RGB values for each voxel
-        """
-        points = []
-        colors = []
-        for x in range(voxel_grid.shape[0]):
-            for y in range(voxel_grid.shape[1]):
-                for z in range(voxel_grid.shape[2]):
-                    if voxel_grid[x, y, z]:
-                        points.extend((
-                            (x, y, z),
-                            (x + 1, y, z),
-                            (x + 1, y + 1, z),
-                            (x, y + 1, z),
-                            (x, y, z + 1),
-                            (x + 1, y, z + 1),
-                            (x + 1, y + 1, z + 1),
-                            (x, y + 1, z + 1)
-                        ))
-                        colors.append(color_grid[x, y, z])
-
-        points = np.array(points, dtype=np.float32)
-        point_indices = np.array(range(len(points)))
-
-        grid = pv.UnstructuredGrid({pv.CellType.HEXAHEDRON: point_indices}, points)
-        grid.cell_data["colors"] = colors
-
-        plotter = pv.Plotter()
-        plotter.add_mesh(grid, scalars="colors", rgb=True) 
-        plotter.show()
\ No newline at end of file
+        - voxel_grid (np.ndarray or ChunkedGrid): 3D bool array indicating voxel presence
+        - color_grid (np.ndarray or ChunkedGrid): 3D array containing RGB values for each voxel
+        - exposed_faces_only (bool): whether to only send VTK the voxel faces that aren't hidden by a neighboring voxel
+        """
+        mesh = VoxelRenderer.build_mesh(voxel_grid, color_grid, exposed_faces_only)
+
+        plotter = VoxelRenderer.get_pyvista().Plotter()
+        plotter.add_mesh(mesh, scalars="colors", rgb=True) 
+        plotter.show()
+
+    @staticmethod
+    def build_mesh(voxel_grid, color_grid, exposed_faces_only=False):
+        """
+        Builds a PyVista mesh of the voxels without opening a window
+
+        Args:
+        - voxel_grid (np.ndarray or ChunkedGrid): 3D bool array indicating voxel presence
+        - color_grid (np.ndarray or ChunkedGrid): 3D array containing RGB values for each voxel
+        - exposed_faces_only (bool): whether to build a surface of only the exposed faces rather than a hexahedron per voxel
+
+        Returns:
+        - pv.UnstructuredGrid or pv.PolyData: mesh with a "colors" cell array
+        """
+        pv = VoxelRenderer.get_pyvista()
+        points, cells, colors = VoxelRenderer.get_mesh_arrays(voxel_grid, color_grid, exposed_faces_only)
+        if exposed_faces_only:
+            mesh = pv.PolyData(points, faces=np.column_stack((np.full(len(cells), 4), cells)).ravel())
+        else:
+            mesh = pv.UnstructuredGrid({pv.CellType.HEXAHEDRON: cells}, points)
+        mesh.cell_data["colors"] = colors
+        return mesh
+
+    @staticmethod
+    def get_mesh_arrays(voxel_grid, color_grid, exposed_faces_only=False):
+        """
+        Computes the points, cells, and cell colors of the voxel mesh, with each lattice point shared by the cells touching 
+        it, reading the voxels in batches (see iter_batches) rather than listing them all first
+
+        Args:
+        - voxel_grid (np.ndarray, ChunkedGrid, or OctreeGrid): 3D bool array indicating voxel presence
+        - color_grid (np.ndarray, ChunkedGrid, or OctreeGrid): 3D array containing RGB values for each voxel
+        - exposed_faces_only (bool): whether to return a quad for each exposed face rather than a hexahedron per voxel
+
+        Returns:
+        - points (np.ndarray): (P, 3) float32 array of lattice points
+        - cells (np.ndarray): (C, 8) hexahedron or (C, 4) quad array of indices into points
+        - colors (np.ndarray): (C, 3) array of RGB values for each cell
+        """
+        shape = np.array(voxel_grid.shape[:3]) + 2 # leaves room for the lattice points (and neighbors) on either side
+        corner_keys, cells, colors = [], [], []
+        for indices, _ in iter_batches(voxel_grid, VoxelRenderer.MESH_BATCH):
+            batch_colors = np.asarray(color_grid[indices[:, 0], indices[:, 1], indices[:, 2]]).reshape(-1, 3)
+            if exposed_faces_only:
+                # a face is exposed when the voxel it faces isn't present (looked up in the grid, since the neighbor may be 
+                # in another batch)
+                voxel_ids, face_ids = [], []
+                for face, direction in enumerate(VoxelRenderer.FACE_DIRECTIONS):
+                    neighbors = indices + direction
+                    inside = np.flatnonzero(((neighbors >= 0) & (neighbors < shape - 2)).all(axis=1))
+                    covered = np.zeros(len(indices), dtype=bool)
+                    covered[inside] = voxel_grid[neighbors[inside, 0], neighbors[inside, 1], neighbors[inside, 2]]
+                    exposed = np.flatnonzero(~covered)
+                    voxel_ids.append(exposed)
+                    face_ids.append(np.full(len(exposed), face))
+                voxel_ids, face_ids = np.concatenate(voxel_ids), np.concatenate(face_ids)
+                corners = indices[voxel_ids, np.newaxis, :] + VoxelRenderer.HEXAHEDRON_CORNERS[VoxelRenderer.FACE_CORNERS[face_ids]]
+                batch_colors = batch_colors[voxel_ids]
+            else:
+                corners = indices[:, np.newaxis, :] + VoxelRenderer.HEXAHEDRON_CORNERS
+
+            # deduplicate each batch's corners as it's read, so that only its distinct lattice points are kept
+            batch_keys, inverse = np.unique(VoxelRenderer._pack(corners.reshape(-1, 3), shape), return_inverse=True)
+            corner_keys.append(batch_keys)
+            cells.append(inverse.reshape(corners.shape[:2]))
+            colors.append(batch_colors)
+
+        # then merge the batches' lattice points, so neighboring cells share points even across batches
+        unique_keys = np.unique(np.concatenate(corner_keys)) if corner_keys else np.empty(0, dtype=np.int64)
+        cells = [np.searchsorted(unique_keys, batch_keys)[batch_cells] for batch_keys, batch_cells in zip(corner_keys, cells)]
+        corner_count = 4 if exposed_faces_only else 8
+        cells = np.concatenate(cells) if cells else np.empty((0, corner_count), dtype=np.int64)
+        colors = np.concatenate(colors) if colors else np.empty((0, 3), dtype=np.uint8)
+        points = VoxelRenderer._unpack(unique_keys, shape).astype(np.float32)
+        return points, cells, colors
+
+    @staticmethod
+    def _pack(indices, shape):
+        """
+        Packs 3D indices into single integers
+
+        Args:
+        - indices (np.ndarray): (M, 3) array of non-negative indices
+        - shape (np.ndarray): exclusive upper bound of each index
+
+        Returns:
+        - np.ndarray: (M,) array of packed indices
+        """
+        return (indices[:, 0] * shape[1] + indices[:, 1]) * shape[2] + indices[:, 2]
+
+    @staticmethod
+    def _unpack(keys, shape):
+        """
+        Unpacks integers packed by _pack back into 3D indices
+
+        Args:
+        - keys (np.ndarray): (M,) array of packed indices
+        - shape (np.ndarray): exclusive upper bound of each index
+
+        Returns:
+        - np.ndarray: (M, 3) array of indices
+        """
+        return np.stack((keys // (shape[1] * shape[2]), (keys // shape[2]) % shape[1], keys % shape[2]), axis=1)
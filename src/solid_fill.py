@@ -0,0 +1,334 @@
+import numpy as np
+
+class SolidFill:
+    """Finds the interior of a voxelized surface and the nearest surface voxel of each interior voxel"""
+
+    BLOCK_ROWS = 1 << 12 # number of grid lines processed at once by the distance transform
+    SHELL_CONNECTIVITIES = (26, 6) # a thin shell of voxels touching by faces, edges, or corners, or a thick one touching by faces
+    LINE_OFFSETS = {6: [(1, 0), (0, 1)], 26: [(1, 0), (0, 1), (1, 1), (1, -1)]} # neighboring lines whose runs can connect
+
+    @staticmethod
+    def get_interior(filled):
+        """
+        Finds the empty voxels which can't be reached from outside the grid without passing through a filled voxel
+
+        Args:
+        - filled (np.ndarray): 3D boolean array of the surface voxels
+
+        Returns:
+        - np.ndarray: 3D boolean array of the interior voxels
+        """
+        return ~SolidFill.get_exterior(filled)[1:-1, 1:-1, 1:-1] & ~filled
+
+    @staticmethod
+    def get_exterior(filled, connectivity=6):
+        """
+        Finds the empty voxels which can be reached from outside the grid without passing through a filled voxel, by
+        labeling the connected components of the empty space: the runs of consecutive empty voxels along the last axis are
+        joined to the overlapping runs of the neighboring lines, and the exterior is the component of the runs on the border
+
+        Args:
+        - filled (np.ndarray): 3D boolean array of the surface voxels
+        - connectivity (int): 6 to only move between voxels sharing a face, or 26 to also move between voxels sharing an edge
+        or a corner (squeezing through diagonal gaps)
+
+        Returns:
+        - np.ndarray: 3D boolean array of the exterior voxels, padded with a layer of exterior voxels on every side
+        """
+        # pad the grid with empty voxels so that the exterior surrounds the model and all of it is one component
+        padded = np.pad(filled, 1)
+        line_length = padded.shape[-1]
+        lines = ~padded.reshape(-1, line_length)
+
+        # each run starts where an empty voxel follows a filled one and ends (exclusively) where a filled one follows an
+        # empty one, so the runs are sorted by line and then by position (the first being the line at the grid's corner)
+        edges = np.diff(np.pad(lines, ((0, 0), (1, 1))).view(np.int8), axis=1)
+        run_starts, run_ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+        del edges
+        run_lines, run_starts = np.divmod(run_starts, line_length + 1)
+        run_ends = run_ends % (line_length + 1)
+
+        outside = SolidFill._get_outside_runs(run_lines, run_starts, run_ends, padded.shape, connectivity)
+
+        # mark the start and end of each exterior run, so a running sum along each line is 1 inside them
+        exterior = np.zeros((len(lines), line_length + 1), dtype=np.int8)
+        exterior.reshape(-1)[run_lines[outside] * (line_length + 1) + run_starts[outside]] = 1
+        exterior.reshape(-1)[run_lines[outside] * (line_length + 1) + run_ends[outside]] = -1
+        return np.cumsum(exterior, axis=1, dtype=np.int8)[:, :line_length].view(bool).reshape(padded.shape)
+
+    @staticmethod
+    def get_sparse_shell(indices, shape, connectivity=26):
+        """
+        Finds the shell of the filled voxels like get_shell, but from the indices of the filled voxels alone, so that a
+        sparse grid never has to be expanded: the empty runs are the gaps between the filled voxels of each line, and each
+        filled voxel is looked up among the exterior runs next to it
+
+        Args:
+        - indices (np.ndarray): (n, 3) array of the indices of the filled voxels
+        - shape (tuple): shape of the grid
+        - connectivity (int): 26 or 6, the connectivity of the shell (see SHELL_CONNECTIVITIES)
+
+        Returns:
+        - np.ndarray: (n,) boolean array of whether each filled voxel is in the shell
+        """
+        leak_connectivity = 6 if connectivity == 26 else 26
+        # the grid is padded like in get_exterior, and each line gets a filled voxel before and after it, so that every
+        # gap between consecutive filled voxels of the same line is an empty run (positions are shifted by one to fit them)
+        padded_shape = tuple(int(size) + 2 for size in shape)
+        nx, ny, line_length = padded_shape
+        stride = line_length + 2
+        line_count = nx * ny
+        keys = ((indices[:, 0] + 1) * ny + indices[:, 1] + 1) * stride + indices[:, 2] + 2
+        line_keys = np.arange(line_count, dtype=np.int64) * stride
+        bounds = np.sort(np.concatenate([keys, line_keys, line_keys + line_length + 1]))
+        gaps = np.flatnonzero(np.diff(bounds) > 1)
+        run_lines, run_starts = np.divmod(bounds[gaps] + 1, stride)
+        run_ends = bounds[gaps + 1] - run_lines * stride - 1
+        run_starts -= 1
+        del bounds, gaps
+
+        outside = SolidFill._get_outside_runs(run_lines, run_starts, run_ends, padded_shape, leak_connectivity)
+        exterior_starts = (run_lines * stride + run_starts)[outside]
+        exterior_ends = (run_lines * stride + run_ends)[outside]
+        del run_lines, run_starts, run_ends, outside
+
+        # a filled voxel is in the shell if any of its neighbors (in the sense the exterior was flooded) is in an exterior
+        # run, which is the last exterior run starting at or before the neighbor if the neighbor comes before its end
+        offsets = np.argwhere(np.ones((3, 3, 3), dtype=bool)) - 1
+        steps = np.abs(offsets).sum(axis=1)
+        shell = np.zeros(len(indices), dtype=bool)
+        for offset in offsets[(steps > 0) & (steps <= (1 if leak_connectivity == 6 else 3))]:
+            neighbor_keys = keys + ((offset[0] * ny + offset[1]) * stride + offset[2]) - 1
+            runs = np.searchsorted(exterior_starts, neighbor_keys, side="right") - 1
+            shell |= (runs >= 0) & (neighbor_keys < exterior_ends[runs])
+        return shell
+
+    @staticmethod
+    def _get_outside_runs(run_lines, run_starts, run_ends, shape, connectivity):
+        """
+        Finds the runs of empty voxels connected to the outside of a padded grid
+
+        Args:
+        - run_lines (np.ndarray): (n,) array of the line (x * ny + y) of each run, sorted by line and then by start
+        - run_starts (np.ndarray): (n,) array of the position of each run's first voxel along its line
+        - run_ends (np.ndarray): (n,) array of the position after each run's last voxel
+        - shape (tuple): shape of the padded grid, whose lines run along the last axis
+        - connectivity (int): 6 to only move between voxels sharing a face, or 26 to also move between voxels sharing an edge
+        or a corner
+
+        Returns:
+        - np.ndarray: (n,) boolean array of whether each run is outside
+        """
+        # the runs of two neighboring lines are joined where they overlap (or touch diagonally, with 26-connectivity), and
+        # the first run is the padding line at the grid's corner, so the outside is the component labeled 0
+        pairs = [SolidFill._join_runs(run_lines, run_starts, run_ends, shape, offset, connectivity == 26)
+                 for offset in SolidFill.LINE_OFFSETS[connectivity]]
+        components = SolidFill._label_components(len(run_lines), np.concatenate([pair[0] for pair in pairs]),
+                                                 np.concatenate([pair[1] for pair in pairs]))
+        return components == 0
+
+    @staticmethod
+    def _join_runs(run_lines, run_starts, run_ends, shape, offset, diagonal):
+        """
+        Pairs up the overlapping runs of empty voxels of every line and its neighbor at an offset
+
+        Args:
+        - run_lines (np.ndarray): (n,) array of the line (x * ny + y) of each run, sorted
+        - run_starts (np.ndarray): (n,) array of the position of each run's first voxel along its line
+        - run_ends (np.ndarray): (n,) array of the position after each run's last voxel
+        - shape (tuple): shape of the grid, whose lines run along the last axis
+        - offset (tuple): (dx, dy) from each line to its neighbor
+        - diagonal (bool): whether runs touching diagonally (one ending right before the other starts) are joined too
+
+        Returns:
+        - np.ndarray: (m,) array of the index of the first run of each pair
+        - np.ndarray: (m,) array of the index of the second run of each pair
+        """
+        nx, ny, line_length = shape
+        x, y = np.divmod(run_lines, ny)
+        valid = np.flatnonzero((x + offset[0] >= 0) & (x + offset[0] < nx) &
+                               (y + offset[1] >= 0) & (y + offset[1] < ny))
+        # keys spaced further apart than any position, so each run's overlapping runs in the neighboring line are a range
+        stride = line_length + 2
+        neighbor_keys = (run_lines[valid] + offset[0] * ny + offset[1]) * stride
+        slack = int(diagonal)
+        first = np.searchsorted(run_lines * stride + run_ends, neighbor_keys + run_starts[valid] - slack, side="right")
+        last = np.searchsorted(run_lines * stride + run_starts, neighbor_keys + run_ends[valid] + slack, side="left")
+        counts = np.maximum(last - first, 0)
+        pair_starts = np.cumsum(counts) - counts
+        return np.repeat(valid, counts), np.arange(counts.sum()) - np.repeat(pair_starts - first, counts)
+
+    @staticmethod
+    def _label_components(node_count, first, second):
+        """
+        Labels the connected components of a graph by hooking the root of every edge's larger node onto the smaller one's
+        and then pointing every node at its root (every root that isn't hooked is a smaller neighbor of one that is, so
+        the roots at least halve every two rounds and there are O(log n) rounds)
+
+        Args:
+        - node_count (int): number of nodes
+        - first (np.ndarray): (m,) array of the first node of each edge
+        - second (np.ndarray): (m,) array of the second node of each edge
+
+        Returns:
+        - np.ndarray: (node_count,) array of the smallest node of each node's component
+        """
+        roots = np.arange(node_count)
+        while len(first):
+            first, second = roots[first], roots[second]
+            joined = first != second
+            first, second = first[joined], second[joined]
+            np.minimum.at(roots, np.maximum(first, second), np.minimum(first, second))
+            # the hooks only point at smaller nodes, so following them converges in O(log n) jumps
+            while True:
+                parents = roots[roots]
+                if np.array_equal(parents, roots):
+                    break
+                roots = parents
+        return roots
+
+    @staticmethod
+    def dilate(mask, connectivity):
+        """
+        Grows a mask by one voxel in every direction
+
+        Args:
+        - mask (np.ndarray): 3D boolean array
+        - connectivity (int): 6 to grow into the voxels sharing a face, or 26 to also grow into the voxels sharing an edge or
+        a corner
+
+        Returns:
+        - np.ndarray: 3D boolean array of the voxels in or next to the mask
+        """
+        dilated = mask.copy()
+        for axis in range(3):
+            # a 3x3x3 cube is a line along each axis in turn, so each axis grows what the previous axes grew
+            source = dilated if connectivity == 26 else mask
+            forward = [slice(None)] * 3
+            backward = [slice(None)] * 3
+            forward[axis], backward[axis] = slice(1, None), slice(None, -1)
+            dilated[tuple(forward)] |= source[tuple(backward)]
+            dilated[tuple(backward)] |= source[tuple(forward)]
+        return dilated
+
+    @staticmethod
+    def get_shell(filled, connectivity=26):
+        """
+        Finds the filled voxels on the outside of the model, which form a watertight shell: a 26-connected shell keeps the 
+        filled voxels with a face exposed to the exterior (the only ones visible from outside), which no path of voxels 
+        sharing faces can cross, and a thicker 6-connected shell keeps the filled voxels touching the exterior at all, 
+        which no path of voxels sharing faces, edges, or corners can cross
+
+        Args:
+        - filled (np.ndarray): 3D boolean array of the filled voxels
+        - connectivity (int): 26 or 6, the connectivity of the shell (see SHELL_CONNECTIVITIES)
+
+        Returns:
+        - np.ndarray: 3D boolean array of the shell voxels
+        """
+        # a path crossing the shell could only leak through the kind of gap the shell leaves, so the exterior is flooded 
+        # with the other connectivity (a thick shell's exterior also squeezes through diagonal gaps)
+        leak_connectivity = 6 if connectivity == 26 else 26
+        exterior = SolidFill.get_exterior(filled, leak_connectivity)
+        return SolidFill.dilate(exterior, leak_connectivity)[1:-1, 1:-1, 1:-1] & filled
+
+    @staticmethod
+    def get_nearest_filled(filled):
+        """
+        Finds the nearest (by Euclidean distance) filled voxel of every voxel with an exact, linear time distance transform
+        (Felzenszwalb and Huttenlocher's lower envelope of parabolas, one axis at a time)
+
+        Args:
+        - filled (np.ndarray): 3D boolean array with at least one filled voxel
+
+        Returns:
+        - np.ndarray: 3D array holding the flat index (into filled) of each voxel's nearest filled voxel
+        """
+        index_dtype = np.int32 if filled.size < 1 << 31 else np.int64
+        flat_indices = np.arange(filled.size, dtype=index_dtype).reshape(filled.shape)
+
+        # along the first axis the nearest filled voxel is simply the closest one before or after each voxel
+        n = filled.shape[0]
+        positions = np.arange(n, dtype=index_dtype).reshape(-1, 1, 1)
+        before = np.maximum.accumulate(np.where(filled, positions, -n), axis=0)
+        after = np.minimum.accumulate(np.where(filled, positions, 2 * n)[::-1], axis=0)[::-1]
+        nearest = np.where(positions - before <= after - positions, before, after)
+        found = (nearest >= 0) & (nearest < n)
+        # squared distances are integers well within float32's exact range for any grid that fits in memory
+        distances = np.where(found, (nearest - positions) ** 2, np.inf).astype(np.float32)
+        sources = np.where(found, np.take_along_axis(flat_indices, np.clip(nearest, 0, n - 1), axis=0), -1).astype(index_dtype)
+        del before, after, nearest, found
+
+        # along the other axes, combine the distances found so far
+        for axis in (1, 2):
+            moved_shape = np.moveaxis(distances, axis, 0).shape
+            line_distances = np.moveaxis(distances, axis, 0).reshape(moved_shape[0], -1)
+            line_sources = np.moveaxis(sources, axis, 0).reshape(moved_shape[0], -1)
+            for start in range(0, line_distances.shape[1], SolidFill.BLOCK_ROWS):
+                lines = slice(start, start + SolidFill.BLOCK_ROWS)
+                line_distances[:, lines], line_sources[:, lines] = \
+                    SolidFill._transform_lines(line_distances[:, lines], line_sources[:, lines])
+            distances = np.moveaxis(line_distances.reshape(moved_shape), 0, axis)
+            sources = np.moveaxis(line_sources.reshape(moved_shape), 0, axis)
+
+        return np.ascontiguousarray(sources)
+
+    @staticmethod
+    def _transform_lines(line_distances, line_sources):
+        """
+        Runs the 1D squared distance transform on many lines at once
+
+        Args:
+        - line_distances (np.ndarray): (n, L) array of squared distances so far, one line per column (inf = none found yet)
+        - line_sources (np.ndarray): (n, L) array of the flat index of the filled voxel each distance was measured to
+
+        Returns:
+        - np.ndarray: (n, L) array of squared distances after including this axis
+        - np.ndarray: (n, L) array of the flat index of each voxel's nearest filled voxel so far
+        """
+        f = line_distances.astype(np.float64)
+        n, num_lines = f.shape
+
+        # build the lower envelope of the parabolas (q - p)^2 + f[p] of every finite f[p] (the 2D arrays are indexed through
+        # their flat views, envelope slot j of line i being at j * num_lines + i)
+        flat_f = f.reshape(-1)
+        parabolas = np.zeros(n * num_lines, dtype=np.int32) # position of each parabola in the envelope
+        boundaries = np.full((n + 1) * num_lines, np.inf) # where each parabola starts being the lowest
+        heights = np.zeros(n * num_lines) # f at each parabola's position
+        last = np.arange(num_lines) - num_lines # flat index of the last parabola in each envelope
+        for q in range(n):
+            active = np.flatnonzero(np.isfinite(f[q]))
+            f_q = f[q, active] + q * q
+            intersections = np.full(len(active), -np.inf)
+            pending = np.flatnonzero(last[active] >= 0)
+            while len(pending):
+                slots = last[active[pending]]
+                p = parabolas[slots].astype(np.float64)
+                intersections[pending] = (f_q[pending] - (heights[slots] + p * p)) / (2 * (q - p))
+                # drop the last parabola if the new one is lower everywhere it was lowest
+                hidden = intersections[pending] <= boundaries[slots]
+                pending = pending[hidden]
+                last[active[pending]] -= num_lines
+                pending = pending[last[active[pending]] >= 0]
+            slots = last[active] + num_lines
+            last[active] = slots
+            parabolas[slots] = q
+            heights[slots] = flat_f[q * num_lines + active]
+            boundaries[slots] = intersections
+            boundaries[slots + num_lines] = np.inf
+        k = (last + num_lines) // num_lines - 1 # index of the last parabola in each envelope
+
+        # parabola j (j >= 1) is the lowest from the first position above boundaries[j], so the parabola at each position is
+        # the number of parabolas that have started by then (lines without parabolas keep inf and -1 since f is all inf)
+        line_ids = np.arange(num_lines, dtype=np.int32)
+        slots = np.arange(1, n).reshape(-1, 1)
+        with np.errstate(invalid="ignore"):
+            starts = np.clip(np.floor(boundaries[num_lines:n * num_lines].reshape(n - 1, num_lines)) + 1, 0, n)
+        starts = (starts.astype(np.int64) * num_lines + line_ids)[(slots <= k) & (starts < n)]
+        current = np.cumsum(np.bincount(starts, minlength=n * num_lines).reshape(n, num_lines), axis=0, dtype=np.int32)
+        flat_p = parabolas[current * num_lines + line_ids] * num_lines + line_ids
+        q = np.arange(n).reshape(-1, 1)
+
+        result_distances = ((q - flat_p // num_lines) ** 2 + flat_f[flat_p]).astype(line_distances.dtype)
+        result_sources = line_sources.reshape(-1)[flat_p]
+        return result_distances, result_sources
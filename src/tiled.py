@@ -0,0 +1,327 @@
+import os
+import sys
+import copy
+import mmap
+import tempfile
+import numpy as np
+from input import ObjReader
+from chunked_grid import ChunkedGrid, argwhere
+from octree import SparseVoxelOctree
+from render import MinecraftWorldEditor
+from voxelize import VoxelizerBase, VoxelizerMinecraft, VoxelizerWithoutMinecraft
+
+try:
+    import resource
+except ImportError: # not available on Windows
+    resource = None
+
+class MeshArrays:
+    """Parsed model arrays (or part of them), with the same attributes as a FileReader"""
+
+    def __init__(self, vertices, colors, faces):
+        """
+        Initializes MeshArrays
+
+        Args:
+        - vertices (np.ndarray): (V, 3) array of vertex positions
+        - colors (np.ndarray): (V, 3) array of vertex colors
+        - faces (np.ndarray): (F, 3) array of vertex indices of each triangle
+        """
+        self.vertices = vertices
+        self.colors = colors
+        self.faces = faces
+
+class TiledVoxelizer:
+    """
+    Voxelizes models too large for memory one tile of the grid at a time: the model is parsed to disk, its triangles are
+    binned into tiles on disk, and each tile is voxelized and written out before moving on to the next
+    """
+
+    VOXEL_BYTES = 8 # bytes used per voxel of a tile (presence, color, and block grids, and the voxelizer's own presence grid)
+    # peak bytes used per unit of each batch, measured, for sizing the batches to the half of the budget the grids don't use
+    CHAR_BYTES = 24 # per character of OBJ text parsed at a time (the split lines and tokens as Python strings)
+    FACE_BYTES = 384 # per triangle (or vertex) read from disk at a time (its vertices, bounding tiles, and temporaries)
+    ENTRY_BYTES = 256 # per triangle-tile pair expanded at a time when binning (its tile, and the sort by tile)
+    CANDIDATE_BYTES = {"sat": 512, "raster": 1536} # per candidate voxel (or raster column) of the voxelizer's batches
+    PAIR_BYTES = 64 # per color and palette color compared at a time when matching blocks (their differences and distances)
+    TRIANGLE_BYTES = 512 # per triangle of a tile (its vertices, bounding boxes, and entries in the voxelizer's chunk bins)
+
+    def __init__(self, model_path, voxel_size, max_bytes, use_binary=True, workers=1, sparse=False, algorithm="sat", color_mode="face", dither="none"):
+        """
+        Initializes TiledVoxelizer
+
+        Args:
+        - model_path (str): path to 3D model
+        - voxel_size (float): sidelength of each voxel
+        - max_bytes (int): memory budget which the tile size and every batch size are chosen from
+        - use_binary (bool): whether to load the model from (or parse it into) a binary .m2m file next to it
+        - workers (int): number of processes to voxelize each tile with
+        - sparse (bool): whether to store each tile's grids as ChunkedGrids
+        - algorithm (str): "sat" or "raster" (see VoxelizerBase)
+        - color_mode (str): "face" or "barycentric" (see VoxelizerBase)
+        - dither (str): how each tile's colors are matched to minecraft blocks (see Dither.MODES)
+        """
+        self.model_path = model_path
+        self.voxel_size = voxel_size
+        self.max_bytes = max_bytes
+        self.use_binary = use_binary
+        self.workers = workers
+        self.sparse = sparse
+        self.algorithm = algorithm
+        self.color_mode = color_mode
+        self.dither = dither
+        self.stats = dict.fromkeys(VoxelizerBase.STAT_NAMES, 0)
+        # a tile's grids take a third of the budget (see get_tile_size), and every stage works in batches sized to a sixth 
+        # of it, so that the tile's triangles and the batch being tested fit beside them along with the memory the 
+        # allocator holds on to between batches
+        self.batch_bytes = max_bytes // 6
+        self.parse_chunk_size = max(self.batch_bytes // self.CHAR_BYTES, 1 << 12)
+        self.face_batch = max(self.batch_bytes // self.FACE_BYTES, 1)
+        self.entry_batch = max(self.batch_bytes // self.ENTRY_BYTES, 1)
+        self.candidate_batch = max(self.batch_bytes // self.CANDIDATE_BYTES[algorithm], 1)
+        self.tile_triangles = max(self.batch_bytes // self.TRIANGLE_BYTES, 1) # tiles with more triangles are split
+
+    def get_tile_size(self):
+        """
+        Chooses the tile size from the memory budget, leaving two thirds of it for the triangles and batches being tested
+
+        Returns:
+        - int: sidelength of each tile in voxels (a multiple of 16, so tiles line up with chunks and minecraft sections)
+        """
+        side = int((self.max_bytes / 3 / self.VOXEL_BYTES) ** (1 / 3))
+        return max(side >> 4, 1) << 4
+
+    @staticmethod
+    def get_peak_memory():
+        """
+        Gets the peak memory used by this process so far
+
+        Returns:
+        - int: peak resident memory in bytes (0 if it can't be measured on this platform)
+        """
+        if resource is None:
+            return 0
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024 # macOS reports bytes, Linux reports kilobytes
+
+    @staticmethod
+    def release_pages(*arrays):
+        """
+        Lets the OS drop the pages of memory-mapped arrays that have been read (they're read from disk again if needed), 
+        so that the parts of the model already used don't count towards the memory used
+
+        Args:
+        - arrays (np.ndarray): arrays, of which the memory-mapped ones (ex. from np.load with mmap_mode) are released
+        """
+        for array in arrays:
+            mapping = getattr(array, "_mmap", None)
+            if mapping is not None and hasattr(mmap, "MADV_DONTNEED"): # not available on Windows
+                mapping.madvise(mmap.MADV_DONTNEED)
+
+    def voxelize(self, color_lookup=None, world_path=None, build_location=None, output_dir=None):
+        """
+        Voxelizes the model tile by tile, either building each tile in minecraft or saving it as an octree file
+
+        Args:
+        - color_lookup (ColorLookup): for matching minecraft blocks (needed when building in minecraft)
+        - world_path (str): path to the minecraft world to build in (None = save octree files instead)
+        - build_location (list): minecraft world coordinates at which to build the model
+        - output_dir (str): directory to save each tile's octree to (ex. tile_0_0_0.svo, or tile_0_0_0_1_0_0.svo for one of the 
+        smaller tiles a tile was split into), when not building in minecraft
+        """
+        base_memory = self.get_peak_memory() # Python and the libraries, which the budget doesn't cover
+        if color_lookup is not None and color_lookup.lut is None:
+            # the exact search compares a batch of colors against the whole palette at once
+            color_lookup = copy.copy(color_lookup)
+            color_lookup.CHUNK_SIZE = max(self.batch_bytes // (self.PAIR_BYTES * len(color_lookup.palette)), 1)
+        with tempfile.TemporaryDirectory(prefix="mesh2minecraft_") as work_dir:
+            model = ObjReader(self.model_path, self.use_binary)
+            model.read_file_out_of_core(work_dir, self.parse_chunk_size)
+            if len(model.faces) == 0:
+                print("model has no faces")
+                return
+
+            grid_min_corner, grid_max_corner = self.get_bounding_voxels(model.vertices)
+            tile_size = self.get_tile_size()
+            grid_box = (np.zeros(3, dtype=np.int64), np.subtract(grid_max_corner, grid_min_corner), "tile")
+            tiles = self._bin_triangles(model, grid_min_corner, grid_box, tile_size, work_dir)
+            print(f"binned {len(model.faces)} triangles into {len(tiles)} tiles of {tile_size}x{tile_size}x{tile_size} voxels")
+
+            editor = MinecraftWorldEditor(world_path) if world_path else None
+            if output_dir:
+                os.makedirs(output_dir, exist_ok=True)
+            voxel_count = 0
+            # a stack of the tiles left, in order, where tiles with too many triangles to voxelize within the budget are 
+            # replaced by the (up to 8) smaller tiles they're split into
+            pending = [(self.get_tile_box(grid_box, tile, tile_size), tile_size, path) for tile, path in sorted(tiles.items(), reverse=True)]
+            while pending:
+                box, size, path = pending.pop()
+                face_ids = np.fromfile(path, dtype=np.int64)
+                if len(face_ids) > self.tile_triangles and size > ChunkedGrid.CHUNK_SIZE:
+                    del face_ids
+                    sub_size = -(-size // 2 // ChunkedGrid.CHUNK_SIZE) * ChunkedGrid.CHUNK_SIZE # half, rounded up to whole chunks
+                    sub_tiles = self._bin_triangles(model, grid_min_corner, box, sub_size, work_dir, path)
+                    os.remove(path)
+                    pending += [(self.get_tile_box(box, tile, sub_size), sub_size, sub_path) for tile, sub_path in sorted(sub_tiles.items(), reverse=True)]
+                    continue
+
+                tile_min_offset, tile_max_offset, name = box
+                tile_min_corner = (tile_min_offset + grid_min_corner).tolist()
+                tile_max_corner = (tile_max_offset + grid_min_corner).tolist()
+                tile_model = MeshArrays(model.vertices, model.colors, np.asarray(model.faces[face_ids]))
+                bounds = (tile_min_corner, tile_max_corner)
+                if editor:
+                    voxelizer = VoxelizerMinecraft(tile_model, self.voxel_size, color_lookup, self.workers, self.sparse, self.algorithm, bounds, self.color_mode)
+                else:
+                    voxelizer = VoxelizerWithoutMinecraft(tile_model, self.voxel_size, self.workers, self.sparse, self.algorithm, bounds, self.color_mode)
+                voxelizer.BATCH_SIZE = self.candidate_batch # in place of the default, which is sized for voxelizing in memory
+                voxelizer.voxelize()
+                if editor:
+                    voxelizer.dither(self.dither)
+                for stat in self.stats:
+                    self.stats[stat] += voxelizer.stats[stat]
+
+                tile_voxels = len(argwhere(voxelizer.voxel_grid))
+                voxel_count += tile_voxels
+                if tile_voxels and editor:
+                    offset = [location + int(offset) for location, offset in zip(build_location, tile_min_offset)]
+                    editor.build_structure(voxelizer.block_grid, voxelizer.block_palette, offset)
+                elif tile_voxels:
+                    SparseVoxelOctree.from_grids(voxelizer, self.voxel_size).save(os.path.join(output_dir, f"{name}.svo"))
+                print(f"{name}: {len(face_ids)} triangles, {tile_voxels} voxels, peak memory {self.get_peak_memory() / (1 << 20):.0f} MB")
+                del voxelizer, tile_model, face_ids
+                self.release_pages(model.vertices, model.colors, model.faces)
+
+        print(f"{voxel_count} voxels, {self.get_memory_report(base_memory)}")
+
+    def get_memory_report(self, base_memory):
+        """
+        Compares the memory used while voxelizing to the budget
+
+        Args:
+        - base_memory (int): peak resident memory in bytes before voxelizing (Python and the libraries)
+
+        Returns:
+        - str: the peak memory, how much of it was used while voxelizing, and whether that was within the budget
+        """
+        peak = self.get_peak_memory()
+        if not peak:
+            return "peak memory can't be measured on this platform"
+        used, budget = (peak - base_memory) / (1 << 20), self.max_bytes / (1 << 20)
+        verdict = f"within the {budget:.0f} MB budget" if used <= budget else f"over the {budget:.0f} MB budget by {used - budget:.0f} MB"
+        return f"peak memory {peak / (1 << 20):.0f} MB: {used:.0f} MB used while voxelizing (on top of {base_memory / (1 << 20):.0f} MB before), {verdict}"
+
+    def get_bounding_voxels(self, vertices):
+        """
+        Gets the voxels that overlap with the bounding box of the vertices, reading them in batches
+
+        Args:
+        - vertices (np.ndarray): (V, 3) array (usually memory-mapped) of vertex positions
+
+        Returns:
+        - min_corner (list): position of the voxel in the minimum corner of bounding voxel box
+        - max_corner (list): position of the voxel in the maximum corner of bounding voxel box
+        """
+        min_coord = np.full(3, np.inf)
+        max_coord = np.full(3, -np.inf)
+        for start in range(0, len(vertices), self.face_batch):
+            batch = np.asarray(vertices[start:start + self.face_batch])
+            min_coord = np.minimum(min_coord, batch.min(axis=0))
+            max_coord = np.maximum(max_coord, batch.max(axis=0))
+            self.release_pages(vertices)
+
+        # same rounding as VoxelizerBase.get_bounding_voxels
+        min_corner = [int(round(min_coord[i] / self.voxel_size)) for i in range(3)]
+        max_corner = [int(round(max_coord[i] / self.voxel_size)) for i in range(3)]
+        return min_corner, max_corner
+
+    @staticmethod
+    def get_tile_box(box, tile, tile_size):
+        """
+        Gets the voxels covered by one of the tiles a box is split into
+
+        Args:
+        - box (tuple): minimum and maximum voxels (relative to the grid's minimum corner) and name of the box
+        - tile (tuple): position of the tile within the box, in tiles
+        - tile_size (int): sidelength of each tile in voxels
+
+        Returns:
+        - tuple: minimum and maximum voxels and name of the tile (the box's name followed by the tile's position), where the 
+        tiles at the box's maximum sides are cut off by it
+        """
+        box_min, box_max, name = box
+        tile_min = box_min + np.array(tile) * tile_size
+        return tile_min, np.minimum(tile_min + tile_size - 1, box_max), "{}_{}_{}_{}".format(name, *tile)
+
+    def _bin_triangles(self, model, grid_min_corner, box, tile_size, work_dir, face_path=None):
+        """
+        Appends the index of each triangle to a file for every tile of a box its bounding box overlaps, in batches, so each 
+        tile's file lists its triangles in their original order
+
+        Args:
+        - model (ObjReader): model whose arrays are (usually) memory-mapped
+        - grid_min_corner (list): position of the voxel in the minimum corner of the whole grid
+        - box (tuple): minimum and maximum voxels (relative to grid_min_corner) and name of the box to split into tiles 
+        (the whole grid, or a tile being split into smaller tiles)
+        - tile_size (int): sidelength of each tile in voxels
+        - work_dir (str): directory to write the tile files to
+        - face_path (str): file listing the indices of the triangles to bin, ex. a tile's (None = every triangle)
+
+        Returns:
+        - dict: path of the file of each tile (keyed by its position within the box, in tiles)
+        """
+        box_min, box_max, _ = box
+        tiles = {}
+        face_count = len(model.faces) if face_path is None else os.path.getsize(face_path) // 8
+        for start in range(0, face_count, self.face_batch):
+            if face_path is None:
+                face_ids = np.arange(start, min(start + self.face_batch, face_count))
+            else:
+                face_ids = np.fromfile(face_path, dtype=np.int64, count=self.face_batch, offset=8 * start)
+            triangles = np.asarray(model.vertices[np.asarray(model.faces[face_ids])])
+            # bounding voxels of every triangle (same rounding as VoxelizerBase.voxelize), limited to the box
+            min_voxels = np.maximum(np.round(triangles.min(axis=1) / self.voxel_size).astype(np.int64) - grid_min_corner, box_min)
+            max_voxels = np.minimum(np.round(triangles.max(axis=1) / self.voxel_size).astype(np.int64) - grid_min_corner, box_max)
+            min_tiles = (min_voxels - box_min) // tile_size
+            tile_dims = (max_voxels - box_min) // tile_size - min_tiles + 1
+            del triangles, min_voxels, max_voxels
+            self.release_pages(model.vertices, model.faces)
+            # expand the triangles into (triangle, tile) entries a few at a time, since large triangles have many tiles
+            for a, b in VoxelizerBase._get_batches(tile_dims.prod(axis=1), self.entry_batch):
+                self._write_entries(tiles, box, face_ids[a:b], min_tiles[a:b], tile_dims[a:b], tile_size, work_dir)
+        return tiles
+
+    def _write_entries(self, tiles, box, face_ids, min_tiles, tile_dims, tile_size, work_dir):
+        """
+        Appends the index of each of a batch of triangles to the file of every tile its bounding box overlaps
+
+        Args:
+        - tiles (dict): path of the file of each tile (keyed by its position within the box), which new tiles are added to
+        - box (tuple): minimum and maximum voxels and name of the box being split into tiles
+        - face_ids (np.ndarray): (N,) index of each triangle in the model
+        - min_tiles (np.ndarray): (N, 3) array of the first tile each triangle's bounding box overlaps
+        - tile_dims (np.ndarray): (N, 3) array of the number of tiles each triangle's bounding box overlaps along each axis
+        - tile_size (int): sidelength of each tile in voxels
+        - work_dir (str): directory to write the tile files to
+        """
+        counts = tile_dims.prod(axis=1)
+        entry_faces = np.repeat(np.arange(len(tile_dims)), counts)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        dims = tile_dims[entry_faces]
+        entry_tiles = min_tiles[entry_faces] + np.stack((
+            offsets // (dims[:, 1] * dims[:, 2]),
+            (offsets // dims[:, 2]) % dims[:, 1],
+            offsets % dims[:, 2]), axis=1)
+        del offsets, dims
+
+        unique_tiles, inverse = np.unique(entry_tiles, axis=0, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        # stable sort keeps each tile's triangles in order
+        order = np.argsort(inverse, kind="stable")
+        boundaries = np.cumsum(np.bincount(inverse, minlength=len(unique_tiles)))[:-1]
+        for tile, entries in zip(unique_tiles.tolist(), np.split(order, boundaries)):
+            tile = tuple(tile)
+            if tile not in tiles:
+                tiles[tile] = os.path.join(work_dir, f"{self.get_tile_box(box, tile, tile_size)[2]}.bin")
+            with open(tiles[tile], "ab") as f:
+                f.write(face_ids[entry_faces[entries]].astype(np.int64).tobytes())
@@ -0,0 +1,158 @@
+import os
+import json
+import hashlib
+import numpy as np
+from chunked_grid import ChunkedGrid, argwhere
+
+class CachedVoxels:
+    """Voxelization results loaded from the cache, with the same grid attributes as a voxelizer"""
+
+    def __init__(self, voxel_grid, color_grid, block_grid, block_palette, grid_min_corner):
+        """
+        Initializes CachedVoxels
+
+        Args:
+        - voxel_grid (np.ndarray or ChunkedGrid): bool for each voxel dictating its presence
+        - color_grid (np.ndarray or ChunkedGrid): RGB value for each voxel
+        - block_grid (np.ndarray or ChunkedGrid): index into block_palette for each voxel
+        - block_palette (list): minecraft block names which block_grid indexes into (0 = no block)
+        - grid_min_corner (list): position of the voxel in the minimum corner of the grid
+        """
+        self.voxel_grid = voxel_grid
+        self.color_grid = color_grid
+        self.block_grid = block_grid
+        self.block_palette = block_palette
+        self.grid_min_corner = grid_min_corner
+
+class VoxelCache:
+    """Content-addressed cache of voxelization results on disk, evicting the least recently used entries when too large"""
+
+    VERSION = 3 # bumped whenever the voxelization results or their format change, so older entries are never used
+    HASH_CHUNK_SIZE = 1 << 20 # number of bytes of the model file hashed at a time
+
+    def __init__(self, cache_dir, max_bytes):
+        """
+        Initializes VoxelCache
+
+        Args:
+        - cache_dir (str): directory to store the cached results in
+        - max_bytes (int): total size the cache is trimmed down to after storing results
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+    def get_key(self, model_path, settings):
+        """
+        Hashes the contents of the model file along with every setting that affects the voxelization results
+
+        Args:
+        - model_path (str): path to the model file
+        - settings (dict): JSON serializable settings (ex. voxel size, algorithm, and palette)
+
+        Returns:
+        - str: hex digest identifying the results
+        """
+        digest = hashlib.sha256()
+        with open(model_path, "rb") as f:
+            for chunk in iter(lambda: f.read(self.HASH_CHUNK_SIZE), b""):
+                digest.update(chunk)
+        digest.update(json.dumps({"version": self.VERSION, **settings}, sort_keys=True).encode())
+        return digest.hexdigest()
+
+    def get_path(self, key):
+        """
+        Gets the path of a cache entry
+
+        Args:
+        - key (str): hex digest from get_key
+
+        Returns:
+        - str: path to the entry's .npz file
+        """
+        return os.path.join(self.cache_dir, f"voxels_{key}.npz")
+
+    def load(self, key, sparse=False):
+        """
+        Loads cached results, marking them as recently used
+
+        Args:
+        - key (str): hex digest from get_key
+        - sparse (bool): whether to load the grids as ChunkedGrids rather than dense arrays
+
+        Returns:
+        - CachedVoxels: the cached results (None if they aren't cached)
+        """
+        path = self.get_path(key)
+        if not os.path.exists(path):
+            return None
+
+        with np.load(path) as data:
+            shape = [int(n) for n in data["shape"]]
+            x, y, z = data["indices"].astype(np.int64).T
+            colors, blocks = data["colors"], data["blocks"]
+            block_palette = [str(name) for name in data["block_palette"]]
+            grid_min_corner = [int(n) for n in data["grid_min_corner"]]
+        os.utime(path)
+
+        if sparse:
+            voxel_grid = ChunkedGrid(shape, bool)
+            color_grid = ChunkedGrid(shape + [3,], np.uint8)
+            block_grid = ChunkedGrid(shape, blocks.dtype)
+        else:
+            voxel_grid = np.zeros(shape, dtype=bool)
+            color_grid = np.zeros(shape + [3,], dtype=np.uint8)
+            block_grid = np.zeros(shape, dtype=blocks.dtype)
+        voxel_grid[x, y, z] = True
+        color_grid[x, y, z] = colors
+        block_grid[x, y, z] = blocks
+        return CachedVoxels(voxel_grid, color_grid, block_grid, block_palette, grid_min_corner)
+
+    def save(self, key, voxelizer):
+        """
+        Stores a voxelizer's results (only the present voxels, compressed) and evicts old entries if the cache is too large
+
+        Args:
+        - key (str): hex digest from get_key
+        - voxelizer (VoxelizerBase): voxelizer whose grids have been populated
+        """
+        indices = argwhere(voxelizer.voxel_grid)
+        x, y, z = indices.T
+        shape = voxelizer.voxel_grid.shape
+        index_dtype = np.uint16 if max(shape) <= 1 << 16 else np.uint32
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self.get_path(key)
+        # write to a temporary file first so that an interrupted run never leaves a partial entry behind
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as f:
+            np.savez_compressed(
+                f,
+                shape=np.array(shape[:3]),
+                indices=indices.astype(index_dtype),
+                colors=voxelizer.color_grid[x, y, z],
+                blocks=voxelizer.block_grid[x, y, z],
+                block_palette=np.array(voxelizer.block_palette),
+                grid_min_corner=np.array(voxelizer.grid_min_corner))
+        os.replace(temp_path, path)
+        self.evict(keep=path)
+
+    def evict(self, keep=None):
+        """
+        Deletes the least recently used entries until the cache fits within max_bytes
+
+        Args:
+        - keep (str): path of an entry to never delete (ex. the one just stored)
+        """
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.startswith("voxels_") and name.endswith(".npz"):
+                stat = os.stat(os.path.join(self.cache_dir, name))
+                entries.append((stat.st_mtime, stat.st_size, os.path.join(self.cache_dir, name)))
+
+        total_bytes = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_bytes <= self.max_bytes:
+                break
+            if path != keep:
+                os.remove(path)
+                total_bytes -= size
@@ -11,6 +11,8 @@
 # - 
 # """
 
+import numpy as np
+
 class TriangleVoxelIntersection:
     """Class for detecting intersections between triangles and voxels"""
 
@@ -172,4 +174,228 @@ class TriangleVoxelIntersection:
         Returns:
         - bool: True if axis is separating axis, False otherwise
         """
-        return max(-max(p0, p1, p2), min(p0, p1, p2)) > r 
\ No newline at end of file
+        return max(-max(p0, p1, p2), min(p0, p1, p2)) > r 
+
+class BatchTriangleVoxelIntersection:
+    """Class for detecting intersections between many triangle-voxel pairs at once using NumPy"""
+
+    # axes in the order they're checked: the cross products of the x, y, and z axes with each edge, the three face normals,
+    # and the triangle's plane normal
+    AXIS_NAMES = ("x*e0", "x*e1", "x*e2", "y*e0", "y*e1", "y*e2", "z*e0", "z*e1", "z*e2", "x", "y", "z", "plane")
+
+    def __init__(self, triangles, voxel_centers, voxel_size):
+        """
+        Initializes BatchTriangleVoxelIntersection
+
+        Args:
+        - triangles (np.ndarray): (N, 3, 3) array where row i holds the three vertices of the i-th triangle
+        - voxel_centers (np.ndarray): (N, 3) array where row i is the center of the voxel tested against triangle i
+        - voxel_size (float): sidelength of voxel
+        """
+        self.triangles = np.asarray(triangles, dtype=np.float64)
+        self.voxel_centers = np.asarray(voxel_centers, dtype=np.float64)
+        self.voxel_size = voxel_size
+
+    def contains_vertex(self):
+        """
+        Performs only the early exit of the test, which is much cheaper than the separating axes
+
+        Returns:
+        - np.ndarray: (N,) bool array, True where one of the triangle's points is in its voxel (so they intersect)
+        """
+        translated = self.triangles - self.voxel_centers[:, np.newaxis, :]
+        return (np.abs(translated) <= self.voxel_size).all(axis=2).any(axis=1)
+
+    def get_closest_barycentrics(self):
+        """
+        Finds the point on each triangle closest to its voxel's center, as barycentric coordinates (Ericson's closest point 
+        on triangle, checking the vertex, edge, and face regions of each triangle at once)
+
+        Returns:
+        - np.ndarray: (N, 3) array of the weights of each triangle's three vertices (degenerate triangles get equal weights)
+        """
+        a, b, c = self.triangles[:, 0], self.triangles[:, 1], self.triangles[:, 2]
+        p = self.voxel_centers
+        ab, ac = b - a, c - a
+        d1, d2 = np.einsum("ij,ij->i", ab, p - a), np.einsum("ij,ij->i", ac, p - a)
+        d3, d4 = np.einsum("ij,ij->i", ab, p - b), np.einsum("ij,ij->i", ac, p - b)
+        d5, d6 = np.einsum("ij,ij->i", ab, p - c), np.einsum("ij,ij->i", ac, p - c)
+        va, vb, vc = d3 * d6 - d5 * d4, d5 * d2 - d1 * d6, d1 * d4 - d3 * d2
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ab_weight = d1 / (d1 - d3) # weight of b along edge ab
+            ac_weight = d2 / (d2 - d6) # weight of c along edge ac
+            bc_weight = (d4 - d3) / ((d4 - d3) + (d5 - d6)) # weight of c along edge bc
+            denominator = va + vb + vc
+            v, w = vb / denominator, vc / denominator
+
+        ones, zeros = np.ones(len(p)), np.zeros(len(p))
+        # the first region containing the point wins, in the same order as Ericson's early returns
+        conditions = [
+            (d1 <= 0) & (d2 <= 0), # vertex a
+            (d3 >= 0) & (d4 <= d3), # vertex b
+            (vc <= 0) & (d1 >= 0) & (d3 <= 0), # edge ab
+            (d6 >= 0) & (d5 <= d6), # vertex c
+            (vb <= 0) & (d2 >= 0) & (d6 <= 0), # edge ac
+            (va <= 0) & (d4 - d3 >= 0) & (d5 - d6 >= 0)] # edge bc
+        weights = [(ones, zeros, zeros), (zeros, ones, zeros), (1 - ab_weight, ab_weight, zeros), (zeros, zeros, ones), 
+                   (1 - ac_weight, zeros, ac_weight), (zeros, 1 - bc_weight, bc_weight)]
+        barycentrics = np.stack([np.select(conditions, [weight[i] for weight in weights], default) 
+                                 for i, default in enumerate((1 - v - w, v, w))], axis=1)
+        return np.where(np.isfinite(barycentrics).all(axis=1, keepdims=True), barycentrics, 1 / 3)
+
+    def intersects(self, axis_counts=None):
+        """
+        Performs the same separating axis test as TriangleVoxelIntersection.intersects for every pair, 
+        with each axis evaluated as a whole-array operation
+
+        Args:
+        - axis_counts (np.ndarray): if given, (13,) int array to add the number of pairs the test exits on at each axis of 
+        AXIS_NAMES to (i.e. the first axis separating them, after the early exit), for profiling
+
+        Returns:
+        - np.ndarray: (N,) bool array, True where the triangle intersects with its voxel
+        """
+        # translate triangles
+        translated = self.triangles - self.voxel_centers[:, np.newaxis, :]
+
+        # a triangle's point being in the voxel means there must be an intersection (same as contains_vertex)
+        point_in_voxel = (np.abs(translated) <= self.voxel_size).all(axis=2).any(axis=1)
+
+        separated = np.zeros(len(translated), dtype=bool)
+        for i, axis_separated in enumerate(self._get_separating_axes(translated, self.voxel_size)):
+            if axis_counts is not None:
+                axis_counts[i] += np.count_nonzero(axis_separated & ~separated & ~point_in_voxel)
+            separated |= axis_separated
+
+        return point_in_voxel | ~separated
+
+    @staticmethod
+    def _get_separating_axes(translated, s):
+        """
+        Checks each axis of the test in the same order as TriangleVoxelIntersection.intersects (see AXIS_NAMES)
+
+        Args:
+        - translated (np.ndarray): (N, 3, 3) array of triangle vertices relative to their voxel's center
+        - s (float): sidelength of voxel
+
+        Returns:
+        - generator: (N,) bool array for each axis, True where it's a separating axis
+        """
+        v0_x, v0_y, v0_z = translated[:, 0].T
+        v1_x, v1_y, v1_z = translated[:, 1].T
+        v2_x, v2_y, v2_z = translated[:, 2].T
+
+        # get triangle edges
+        e0_x, e0_y, e0_z = v1_x - v0_x, v1_y - v0_y, v1_z - v0_z
+        e1_x, e1_y, e1_z = v2_x - v1_x, v2_y - v1_y, v2_z - v1_z
+        e2_x, e2_y, e2_z = v0_x - v2_x, v0_y - v2_y, v0_z - v2_z
+
+        abs_e0_x, abs_e0_y, abs_e0_z = np.abs(e0_x), np.abs(e0_y), np.abs(e0_z)
+        abs_e1_x, abs_e1_y, abs_e1_z = np.abs(e1_x), np.abs(e1_y), np.abs(e1_z)
+        abs_e2_x, abs_e2_y, abs_e2_z = np.abs(e2_x), np.abs(e2_y), np.abs(e2_z)
+
+        # the nine edge cross product axes, with projections and projection radii matching the scalar test
+        is_separating_axis = BatchTriangleVoxelIntersection._is_separating_axis
+        yield is_separating_axis(
+            v0_y * e0_y - v0_z * e0_z, v1_y * e0_y - v1_z * e0_z, v2_y * e0_y - v2_z * e0_z, s * (abs_e0_z + abs_e0_y))
+        yield is_separating_axis(
+            v0_z * e1_y - v0_y * e1_z, v1_z * e1_y - v1_y * e1_z, v2_z * e1_y - v2_y * e1_z, s * (abs_e1_z + abs_e1_y))
+        yield is_separating_axis(
+            v0_z * e2_y - v0_y * e2_z, v1_z * e2_y - v1_y * e2_z, v2_z * e2_y - v2_y * e2_z, s * (abs_e2_z + abs_e2_y))
+        yield is_separating_axis(
+            v0_x * e0_z - v0_z * e0_x, v1_x * e0_z - v1_z * e0_x, v2_x * e0_z - v2_z * e0_x, s * (abs_e0_z + abs_e0_x))
+        yield is_separating_axis(
+            v0_x * e1_z - v0_z * e1_x, v1_x * e1_z - v1_z * e1_x, v2_x * e1_z - v2_z * e1_x, s * (abs_e1_z + abs_e1_x))
+        yield is_separating_axis(
+            v0_x * e2_z - v0_z * e2_x, v1_x * e2_z - v1_z * e2_x, v2_x * e2_z - v2_z * e2_x, s * (abs_e2_z + abs_e2_x))
+        yield is_separating_axis(
+            v0_y * e0_x - v0_x * e0_y, v1_y * e0_x - v1_x * e0_y, v2_y * e0_x - v2_x * e0_y, s * (abs_e0_y + abs_e0_x))
+        yield is_separating_axis(
+            v0_y * e1_x - v0_x * e1_y, v1_y * e1_x - v1_x * e1_y, v2_y * e1_x - v2_x * e1_y, s * (abs_e1_y + abs_e1_x))
+        yield is_separating_axis(
+            v0_y * e2_x - v0_x * e2_y, v1_y * e2_x - v1_x * e2_y, v2_y * e2_x - v2_x * e2_y, s * (abs_e2_y + abs_e2_x))
+
+        # the three face normal axes (i.e. triangle's bounding box doesn't overlap with voxel)
+        highs, lows = translated.max(axis=1), translated.min(axis=1)
+        for i in range(3):
+            yield (highs[:, i] < -s) | (lows[:, i] > s)
+
+        # the triangle's plane normal axis
+        n_x = e0_y * e1_z - e0_z * e1_y
+        n_y = e0_x * e1_z - e0_z * e1_x
+        n_z = e0_x * e1_y - e0_y * e1_x
+        plane_distance = n_x * v0_x + n_y * v0_y + n_z * v0_z
+        yield plane_distance > s * (np.abs(n_x) + np.abs(n_y) + np.abs(n_z))
+
+    @staticmethod
+    def get_center_constraints(triangles, voxel_size):
+        """
+        Expresses every axis checked by intersects (other than the early exit) as a constraint on the voxel's center, 
+        since each one passes exactly when low <= dot(axis, voxel_center) <= high
+
+        Args:
+        - triangles (np.ndarray): (N, 3, 3) array of triangle vertices
+        - voxel_size (float): sidelength of voxel
+
+        Returns:
+        - axes (np.ndarray): (N, 13, 3) array of axes
+        - lows (np.ndarray): (N, 13) array of lower bounds (may be -inf)
+        - highs (np.ndarray): (N, 13) array of upper bounds (may be inf)
+        """
+        s = voxel_size
+        triangles = np.asarray(triangles, dtype=np.float64)
+        v0, v1, v2 = triangles[:, 0], triangles[:, 1], triangles[:, 2]
+        e0, e1, e2 = v1 - v0, v2 - v1, v0 - v2
+        zeros = np.zeros(len(triangles))
+
+        # the nine edge cross product axes, written exactly as projected in intersects
+        edge_axes = [np.stack((zeros, e0[:, 1], -e0[:, 2]), axis=1)]
+        edge_axes += [np.stack((zeros, -e[:, 2], e[:, 1]), axis=1) for e in (e1, e2)]
+        edge_axes += [np.stack((e[:, 2], zeros, -e[:, 0]), axis=1) for e in (e0, e1, e2)]
+        edge_axes += [np.stack((-e[:, 1], e[:, 0], zeros), axis=1) for e in (e0, e1, e2)]
+        edge_radii = [s * (np.abs(e[:, 2]) + np.abs(e[:, 1])) for e in (e0, e1, e2)]
+        edge_radii += [s * (np.abs(e[:, 2]) + np.abs(e[:, 0])) for e in (e0, e1, e2)]
+        edge_radii += [s * (np.abs(e[:, 1]) + np.abs(e[:, 0])) for e in (e0, e1, e2)]
+
+        axes, lows, highs = [], [], []
+        for axis, r in zip(edge_axes, edge_radii):
+            projections = np.einsum("nij,nj->ni", triangles, axis)
+            axes.append(axis)
+            lows.append(projections.min(axis=1) - r)
+            highs.append(projections.max(axis=1) + r)
+
+        # the three face normal axes
+        for i in range(3):
+            axis = np.zeros((len(triangles), 3))
+            axis[:, i] = 1
+            axes.append(axis)
+            lows.append(triangles[:, :, i].min(axis=1) - s)
+            highs.append(triangles[:, :, i].max(axis=1) + s)
+
+        # the triangle's plane normal axis (which intersects only checks on one side)
+        plane_normal = np.stack((
+            e0[:, 1] * e1[:, 2] - e0[:, 2] * e1[:, 1],
+            e0[:, 0] * e1[:, 2] - e0[:, 2] * e1[:, 0],
+            e0[:, 0] * e1[:, 1] - e0[:, 1] * e1[:, 0]), axis=1)
+        axes.append(plane_normal)
+        lows.append(np.einsum("ni,ni->n", plane_normal, v0) - s * np.abs(plane_normal).sum(axis=1))
+        highs.append(np.full(len(triangles), np.inf))
+
+        return np.stack(axes, axis=1), np.stack(lows, axis=1), np.stack(highs, axis=1)
+
+    @staticmethod
+    def _is_separating_axis(p0, p1, p2, r):
+        """
+        Checks whether axis is separating axis for each pair
+
+        Args:
+        - p0 (np.ndarray): distances from v0 projections to origin
+        - p1 (np.ndarray): distances from v1 projections to origin
+        - p2 (np.ndarray): distances from v2 projections to origin
+        - r (np.ndarray): projection radii
+
+        Returns:
+        - np.ndarray: bool array, True where axis is separating axis
+        """
+        return np.maximum(-np.maximum(np.maximum(p0, p1), p2), np.minimum(np.minimum(p0, p1), p2)) > r
@@ -1,116 +1,652 @@
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from chunked_grid import ChunkedGrid, argwhere
+from dither import Dither
+from solid_fill import SolidFill
+from lod import build_pyramid
 from average_block_colors import color_block_pairs
-from voxel_triangle_intersection import TriangleVoxelIntersection
+from voxel_triangle_intersection import BatchTriangleVoxelIntersection
 
 class VoxelizerBase:
     """Base class for voxelizer"""
 
-    def __init__(self, model, voxel_size):
+    BATCH_SIZE = 1 << 18 # approximate number of candidate voxels (or raster columns) tested per batch
+    ALGORITHMS = ("sat", "raster")
+    COLOR_MODES = ("face", "barycentric")
+    STAT_NAMES = ("candidates", "skipped", "trivial", "tested") # see voxelize and stats
+
+    def __init__(self, model, voxel_size, workers=1, sparse=False, algorithm="sat", bounds=None, color_mode="face"):
         """
         Initializes VoxelizerBase
 
         Args:
-        - model (ObjReader): contains parsed data from input file (vertices, faces, colors)
+        - model (ObjReader): contains parsed NumPy arrays from input file (vertices, faces, colors)
         - voxel_size (float): the desired sidelength for the voxels (lower = higher detail)
+        - workers (int): number of processes to voxelize with (1 = no process pool)
+        - sparse (bool): whether to store the grids as ChunkedGrids (only allocating chunks containing voxels)
+        - algorithm (str): "sat" to test every voxel in each triangle's bounding box, or "raster" to only test the voxels near 
+        each triangle's plane (same results)
+        - bounds (tuple): minimum and maximum corner voxels to limit the grid to, ex. one tile of a larger model (None = the 
+        model's bounding voxels)
+        - color_mode (str): "face" to color each voxel with the average vertex color of the first triangle intersecting it, 
+        or "barycentric" to average the colors interpolated at the point closest to the voxel's center on every triangle 
+        intersecting it
         """
         self.vertices = model.vertices
         self.faces = model.faces
         self.colors = model.colors
         self.voxel_size = voxel_size
+        self.workers = workers
+        self.sparse = sparse
+        self.algorithm = algorithm
+        self.bounds = bounds
+        self.color_mode = color_mode
         self.grid_min_corner = None
         self.grid_max_corner = None
         self.voxel_grid = None
         self.color_grid = None
         self.block_grid = None
+        self.block_palette = ["air"] # minecraft block names which block_grid indexes into (0 = no block)
+        # counts from the last voxelization: candidate triangle-voxel pairs, pairs skipped since their voxel was already 
+        # present, voxels hit by a triangle's vertex without the full test, and full intersection tests performed
+        self.stats = dict.fromkeys(self.STAT_NAMES, 0)
 
     def grid_init(self):
-        """Calculates grid dimensions and initializes grids for the voxels, voxel colors, and minecraft block names"""
-        self.grid_min_corner, self.grid_max_corner = self.get_bounding_voxels(self.vertices) 
+        """Calculates grid dimensions and initializes grids for the voxels, voxel colors, and minecraft block palette indices"""
+        if self.bounds is not None:
+            self.grid_min_corner, self.grid_max_corner = [list(corner) for corner in self.bounds]
+        else:
+            self.grid_min_corner, self.grid_max_corner = self.get_bounding_voxels(self.vertices) 
         grid_size = [self.grid_max_corner[i] - self.grid_min_corner[i] + 1 for i in range(3)] 
 
-        self.voxel_grid = np.zeros(grid_size, dtype=bool) # stores bool indicating whether voxel present
-        self.color_grid = np.zeros(grid_size + [3,], dtype=np.uint8) # RGB value for each voxel
-        self.block_grid = np.empty(grid_size, dtype=object) # minecraft block name for each voxel
+        block_dtype = np.uint8 if len(self.block_palette) <= 256 else np.uint16
+
+        if self.sparse:
+            self.voxel_grid = ChunkedGrid(grid_size, bool)
+            self.color_grid = ChunkedGrid(grid_size + [3,], np.uint8)
+            self.block_grid = ChunkedGrid(grid_size, block_dtype)
+        else:
+            self.voxel_grid = np.zeros(grid_size, dtype=bool) # stores bool indicating whether voxel present
+            self.color_grid = np.zeros(grid_size + [3,], dtype=np.uint8) # RGB value for each voxel
+            self.block_grid = np.zeros(grid_size, dtype=block_dtype) # index into block_palette for each voxel
 
     def get_face_colors(self):
         """
         Gets each triangle's color by finding the average of each of the three vertices
         
         Returns:
-        - face_colors (list): list of lists where each nested list is a triangle's RGB color
-        """
-        face_colors = []
-        for face in self.faces:
-            c1, c2, c3 = [self.colors[i] for i in face]
-            face_color = [round((sum(channel) * 255) / 3) for channel in zip(c1, c2, c3)]
-            face_colors.append(face_color)
-        return face_colors
+        - face_colors (np.ndarray): (F, 3) array where each row is a triangle's RGB color
+        """
+        c1, c2, c3 = self.colors[self.faces].astype(np.float64).transpose(1, 0, 2)
+        return np.round(((c1 + c2 + c3) * 255) / 3).astype(np.uint8)
     
     def get_bounding_voxels(self, vertices):
         """
         Gets the voxels that overlap with the bounding box of the vertices
 
         Args:
-        - vertices (list): list of lists where each nested list is the the XYZ values for a vertex
+        - vertices (np.ndarray): (V, 3) array where each row is the XYZ values for a vertex
 
         Returns:
         - min_corner (list): position of the voxel in the minimum corner of bounding voxel box
         - max_corner (list): position of the voxel in the maximum corner of bounding voxel box
         """
         # finds bounding box coordinates for the given vertices 
-        min_coord = max_coord = vertices[0]
-        for vertex in vertices[1:]:
-            min_coord = [min(min_coord[i], vertex[i]) for i in range(len(min_coord))]
-            max_coord = [max(max_coord[i], vertex[i]) for i in range(len(max_coord))]
+        min_coord = np.min(vertices, axis=0)
+        max_coord = np.max(vertices, axis=0)
 
         # converts the coordinates to voxels
-        min_corner = [round(min_coord[i] / self.voxel_size) for i in range(3)]
-        max_corner = [round(max_coord[i] / self.voxel_size) for i in range(3)]
+        min_corner = [int(round(min_coord[i] / self.voxel_size)) for i in range(3)]
+        max_corner = [int(round(max_coord[i] / self.voxel_size)) for i in range(3)]
 
         return min_corner, max_corner
     
-    def voxelize(self):
-        """Iterates over triangles and performs voxel-triangle intersects tests to determine where voxels are present"""
+    def voxelize(self, axis_counts=None):
+        """
+        Performs voxel-triangle intersection tests in NumPy batches (optionally across processes) to determine where voxels are present
+
+        Args:
+        - axis_counts (np.ndarray): if given, (13,) int array to add the number of pairs rejected by each separating axis to 
+        (see BatchTriangleVoxelIntersection.AXIS_NAMES), for profiling
+        """
         self.grid_init()
-        face_colors = self.get_face_colors()
-        half_voxel_size = self.voxel_size / 2
-
-        # for each triangle (face)
-        for fi, face in enumerate(self.faces):
-            triangle = [self.vertices[i] for i in face]
-            min_corner, max_corner = self.get_bounding_voxels(triangle)
-
-            # for each voxel that overlaps with the triangle's bounding box
-            for x in range(min_corner[0], max_corner[0] + 1):
-                for y in range(min_corner[1], max_corner[1] + 1):
-                    for z in range(min_corner[2], max_corner[2] + 1):
-
-                        # find voxel's grid indices
-                        x_index = x - self.grid_min_corner[0]
-                        y_index = y - self.grid_min_corner[1]
-                        z_index = z - self.grid_min_corner[2]
-
-                        # ignore voxels that have already been identified as present
-                        if self.voxel_grid[x_index, y_index, z_index]: continue
-
-                        voxel_center = [
-                            x * self.voxel_size + half_voxel_size, 
-                            y * self.voxel_size + half_voxel_size, 
-                            z * self.voxel_size + half_voxel_size]
-                        intersection_test = TriangleVoxelIntersection(triangle, voxel_center, self.voxel_size)
-                        if intersection_test.intersects(): # if triangle intersects with voxel
-                            # the voxel is present, so populate the grids
-                            self._populate_grids(x_index, y_index, z_index, face_colors[fi]) 
-    
+        self.stats = dict.fromkeys(self.STAT_NAMES, 0)
+        if len(self.faces) == 0:
+            return
+
+        triangles = self.vertices[self.faces]
+        face_colors = self.get_face_colors() if self.color_mode == "face" else None
+
+        # bounding voxels of every triangle (same rounding as get_bounding_voxels)
+        min_corners = np.round(triangles.min(axis=1) / self.voxel_size).astype(np.int64)
+        max_corners = np.round(triangles.max(axis=1) / self.voxel_size).astype(np.int64)
+        # limit the bounding boxes to the grid (they only extend past it when the grid is limited to bounds)
+        min_corners = np.maximum(min_corners, self.grid_min_corner)
+        max_corners = np.minimum(max_corners, self.grid_max_corner)
+        inside = np.flatnonzero((min_corners <= max_corners).all(axis=1))
+
+        # bin the triangles by the chunks their bounding boxes overlap, so each voxel's triangles are tested together
+        entry_faces, entry_min_corners, entry_box_dims = self._bin_triangles(
+            min_corners[inside], max_corners[inside], self.grid_min_corner)
+        entry_faces = inside[entry_faces]
+        entry_triangles = triangles[entry_faces]
+        # every triangle intersecting a voxel contributes to its color when interpolating, so each needs its vertex colors
+        entry_colors = None if face_colors is not None else self.colors[self.faces[entry_faces]].astype(np.float64)
+        hit_args = (self.voxel_size, self.grid_min_corner, self.voxel_grid.shape, self.BATCH_SIZE, self.sparse, self.algorithm, 
+                    axis_counts is not None)
+
+        if self.workers > 1:
+            # split the binned triangles into contiguous shards (a few per worker to balance the load)
+            work_counts = self._get_work_counts(entry_triangles, entry_box_dims, self.algorithm)
+            shard_size = -(-int(work_counts.sum()) // (self.workers * 4))
+            shards = self._get_batches(work_counts, shard_size)
+            with ProcessPoolExecutor(self.workers) as executor:
+                results = list(executor.map(self._find_hits, *zip(*[
+                    (entry_triangles[a:b], entry_min_corners[a:b], entry_box_dims[a:b], *hit_args, 
+                     None if entry_colors is None else entry_colors[a:b]) for a, b in shards])))
+        else:
+            shards = [(0, len(entry_faces))]
+            results = [self._find_hits(entry_triangles, entry_min_corners, entry_box_dims, *hit_args, entry_colors)]
+
+        if entry_colors is not None:
+            self._populate_averaged_colors(results, axis_counts)
+            return
+
+        # merge the shards in order, since a chunk split between shards has its earlier triangles in the earlier shard, so
+        # voxels keep the color of the first triangle intersecting them
+        for (start, _), (indices, entry_ids, stats) in zip(shards, results):
+            x_index, y_index, z_index = indices.T
+            absent = ~self.voxel_grid[x_index, y_index, z_index]
+            self._populate_grids(
+                x_index[absent], y_index[absent], z_index[absent], face_colors[entry_faces[entry_ids[absent] + start]])
+            for name in self.STAT_NAMES:
+                self.stats[name] += stats[name]
+            if axis_counts is not None:
+                axis_counts += stats["axes"]
+
+    def _populate_averaged_colors(self, results, axis_counts=None):
+        """
+        Merges the shards' summed colors of each voxel (a voxel may be hit by triangles in several shards) and populates 
+        the grids with the averages
+
+        Args:
+        - results (list): indices, color sums, and stats returned by _find_hits for each shard
+        - axis_counts (np.ndarray): if given, (13,) int array to add the number of pairs rejected by each separating axis to
+        """
+        indices = np.concatenate([indices for indices, _, _ in results])
+        sums = np.concatenate([sums for _, sums, _ in results])
+        for _, _, stats in results:
+            for name in self.STAT_NAMES:
+                self.stats[name] += stats[name]
+            if axis_counts is not None:
+                axis_counts += stats["axes"]
+        if not len(indices):
+            return
+
+        keys, inverse = np.unique(np.ravel_multi_index(indices.T, self.voxel_grid.shape), return_inverse=True)
+        inverse = inverse.reshape(-1)
+        sums = np.stack([np.bincount(inverse, sums[:, i], len(keys)) for i in range(4)], axis=1)
+        voxel_colors = np.round(sums[:, :3] * 255 / sums[:, 3:]).astype(np.uint8)
+        x_index, y_index, z_index = np.unravel_index(keys, self.voxel_grid.shape)
+        self._populate_grids(x_index, y_index, z_index, voxel_colors)
+
+    @staticmethod
+    def _bin_triangles(min_corners, max_corners, grid_min_corner):
+        """
+        Bins the triangles into a spatial hash of the grid's chunks (see ChunkedGrid), with one entry for each chunk that a 
+        triangle's bounding box overlaps, holding the part of the bounding box within that chunk
+
+        Args:
+        - min_corners (np.ndarray): (F, 3) array of each triangle's minimum bounding voxel
+        - max_corners (np.ndarray): (F, 3) array of each triangle's maximum bounding voxel
+        - grid_min_corner (list): position of the voxel in the minimum corner of the grid
+
+        Returns:
+        - entry_faces (np.ndarray): (E,) index of each entry's triangle, ordered by chunk and then by triangle
+        - entry_min_corners (np.ndarray): (E, 3) array of each entry's minimum bounding voxel
+        - entry_box_dims (np.ndarray): (E, 3) array of each entry's bounding voxel box dimensions
+        """
+        bits = ChunkedGrid.CHUNK_BITS
+        min_chunks = (min_corners - grid_min_corner) >> bits
+        chunk_dims = ((max_corners - grid_min_corner) >> bits) - min_chunks + 1
+        counts = chunk_dims.prod(axis=1)
+
+        entry_faces = np.repeat(np.arange(len(min_corners)), counts)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        dims = chunk_dims[entry_faces]
+        chunks = min_chunks[entry_faces] + np.stack((
+            offsets // (dims[:, 1] * dims[:, 2]),
+            (offsets // dims[:, 2]) % dims[:, 1],
+            offsets % dims[:, 2]), axis=1)
+
+        # clip the bounding boxes to their chunks
+        chunk_min_corners = (chunks << bits) + grid_min_corner
+        entry_min_corners = np.maximum(min_corners[entry_faces], chunk_min_corners)
+        entry_max_corners = np.minimum(max_corners[entry_faces], chunk_min_corners + (1 << bits) - 1)
+
+        # stable sort by chunk keeps each chunk's triangles in order
+        order = np.lexsort((entry_faces, chunks[:, 2], chunks[:, 1], chunks[:, 0]))
+        return entry_faces[order], entry_min_corners[order], (entry_max_corners - entry_min_corners + 1)[order]
+
+    @staticmethod
+    def _get_batches(work_counts, batch_size):
+        """
+        Splits the triangles into consecutive batches holding roughly batch_size candidate voxels (or raster columns) each
+
+        Args:
+        - work_counts (np.ndarray): number of candidate voxels (or raster columns) for each triangle
+        - batch_size (int): approximate number of candidate voxels (or raster columns) per batch
+
+        Returns:
+        - list: (start, stop) triangle index pairs for each batch
+        """
+        batch_ids = (np.cumsum(work_counts) - 1) // batch_size
+        starts = [0] + [int(i) for i in np.flatnonzero(np.diff(batch_ids)) + 1]
+        stops = starts[1:] + [len(work_counts)]
+        return list(zip(starts, stops))
+
+    @staticmethod
+    def _get_dominant_axes(triangles):
+        """
+        Gets the axis along which each triangle's normal is largest
+
+        Args:
+        - triangles (np.ndarray): (N, 3, 3) array of triangle vertices
+
+        Returns:
+        - np.ndarray: (N,) array of axes (0 = x, 1 = y, 2 = z)
+        """
+        normals = np.cross(triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0])
+        return np.abs(normals).argmax(axis=1)
+
+    @staticmethod
+    def _get_work_counts(triangles, box_dims, algorithm):
+        """
+        Gets how much work each triangle takes, for splitting the triangles into batches
+
+        Args:
+        - triangles (np.ndarray): (N, 3, 3) array of triangle vertices
+        - box_dims (np.ndarray): (N, 3) array of each triangle's bounding voxel box dimensions
+        - algorithm (str): "sat" or "raster"
+
+        Returns:
+        - np.ndarray: (N,) number of candidate voxels ("sat") or raster columns ("raster") of each triangle
+        """
+        counts = box_dims.prod(axis=1)
+        if algorithm == "raster":
+            counts //= box_dims[np.arange(len(box_dims)), VoxelizerBase._get_dominant_axes(triangles)]
+        return counts
+
+    @staticmethod
+    def _get_box_candidates(min_corners, box_dims):
+        """
+        Enumerates every voxel in each triangle's bounding box
+
+        Args:
+        - min_corners (np.ndarray): (N, 3) array of each triangle's minimum bounding voxel
+        - box_dims (np.ndarray): (N, 3) array of each triangle's bounding voxel box dimensions
+
+        Returns:
+        - face_ids (np.ndarray): (M,) index of the triangle each candidate belongs to (in ascending order)
+        - voxels (np.ndarray): (M, 3) position of each candidate voxel
+        """
+        counts = box_dims.prod(axis=1)
+        face_ids = np.repeat(np.arange(len(box_dims)), counts)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        dims = box_dims[face_ids]
+        voxels = min_corners[face_ids] + np.stack((
+            offsets // (dims[:, 1] * dims[:, 2]),
+            (offsets // dims[:, 2]) % dims[:, 1],
+            offsets % dims[:, 2]), axis=1)
+        return face_ids, voxels
+
+    @staticmethod
+    def _get_raster_candidates(triangles, min_corners, box_dims, voxel_size):
+        """
+        Scan-converts each triangle onto the plane perpendicular to its dominant axis, and keeps only the voxels of each 
+        resulting column whose centers can pass every axis of the intersection test (a superset of the intersecting voxels)
+
+        Args:
+        - triangles (np.ndarray): (N, 3, 3) array of triangle vertices
+        - min_corners (np.ndarray): (N, 3) array of each triangle's minimum bounding voxel
+        - box_dims (np.ndarray): (N, 3) array of each triangle's bounding voxel box dimensions
+        - voxel_size (float): sidelength of each voxel
+
+        Returns:
+        - face_ids (np.ndarray): (M,) index of the triangle each candidate belongs to (in ascending order)
+        - voxels (np.ndarray): (M, 3) position of each candidate voxel
+        """
+        s = voxel_size
+        w_axes = VoxelizerBase._get_dominant_axes(triangles)
+        u_axes, v_axes = (w_axes + 1) % 3, (w_axes + 2) % 3
+        triangle_ids = np.arange(len(triangles))
+
+        # enumerate the columns (along the dominant axis) in each triangle's bounding box
+        column_dims = np.stack((box_dims[triangle_ids, u_axes], box_dims[triangle_ids, v_axes]), axis=1)
+        counts = column_dims.prod(axis=1)
+        face_ids = np.repeat(triangle_ids, counts)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        column_ids = np.arange(len(face_ids))
+        fu, fv, fw = u_axes[face_ids], v_axes[face_ids], w_axes[face_ids]
+        column_u = min_corners[face_ids, fu] + offsets // column_dims[face_ids, 1]
+        column_v = min_corners[face_ids, fv] + offsets % column_dims[face_ids, 1]
+        center_u, center_v = column_u * s + s / 2, column_v * s + s / 2
+
+        # intersect the ranges of voxel centers along each column allowed by every axis of the test, with a tolerance 
+        # covering the rounding differences between this and the test itself
+        axes, lows, highs = BatchTriangleVoxelIntersection.get_center_constraints(triangles, s)
+        magnitudes = (np.abs(triangles).max(axis=(1, 2)) + 2 * s)[face_ids]
+        low_w = np.full(len(face_ids), -np.inf)
+        high_w = np.full(len(face_ids), np.inf)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            for k in range(axes.shape[1]):
+                axis = axes[face_ids, k]
+                a_u, a_v, a_w = axis[column_ids, fu], axis[column_ids, fv], axis[column_ids, fw]
+                tolerance = 1e-9 * np.abs(axis).sum(axis=1) * magnitudes
+                offset = a_u * center_u + a_v * center_v
+                low = lows[face_ids, k] - tolerance - offset
+                high = highs[face_ids, k] + tolerance - offset
+                passes = (low <= 0) & (0 <= high) # whether the column passes an axis perpendicular to it
+                low_w = np.maximum(low_w, np.where(a_w > 0, low / a_w, np.where(a_w < 0, high / a_w, np.where(passes, -np.inf, np.inf))))
+                high_w = np.minimum(high_w, np.where(a_w > 0, high / a_w, np.where(a_w < 0, low / a_w, np.where(passes, np.inf, -np.inf))))
+
+        # the test's early exit also accepts any voxel containing one of the triangle's vertices
+        for i in range(3):
+            vertex = triangles[face_ids, i]
+            near = (np.abs(vertex[column_ids, fu] - center_u) <= s * (1 + 1e-9) + 1e-9 * magnitudes) & \
+                (np.abs(vertex[column_ids, fv] - center_v) <= s * (1 + 1e-9) + 1e-9 * magnitudes)
+            low_w = np.where(near, np.minimum(low_w, vertex[column_ids, fw] - s), low_w)
+            high_w = np.where(near, np.maximum(high_w, vertex[column_ids, fw] + s), high_w)
+
+        # convert the range of centers to voxels (padded by a voxel for rounding), limited to the bounding box
+        box_first = min_corners[face_ids, fw]
+        box_last = box_first + box_dims[face_ids, fw] - 1
+        with np.errstate(invalid="ignore"):
+            first = np.maximum(np.ceil((low_w - s / 2) / s) - 1, box_first)
+            last = np.minimum(np.floor((high_w - s / 2) / s) + 1, box_last)
+        valid = last >= first
+        first = np.where(valid, first, 0).astype(np.int64)
+        counts = np.where(valid, last - first + 1, 0).astype(np.int64)
+
+        candidate_columns = np.repeat(column_ids, counts)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        candidate_ids = np.arange(len(candidate_columns))
+        voxels = np.empty((len(candidate_columns), 3), dtype=np.int64)
+        voxels[candidate_ids, fu[candidate_columns]] = column_u[candidate_columns]
+        voxels[candidate_ids, fv[candidate_columns]] = column_v[candidate_columns]
+        voxels[candidate_ids, fw[candidate_columns]] = first[candidate_columns] + offsets
+        return face_ids[candidate_columns], voxels
+
+    @staticmethod
+    def _find_hits(triangles, min_corners, box_dims, voxel_size, grid_min_corner, grid_shape, batch_size, sparse, algorithm, count_axes=False, 
+                   triangle_colors=None):
+        """
+        Tests triangles against their candidate voxels (runs in worker processes too)
+
+        Args:
+        - triangles (np.ndarray): (N, 3, 3) array of triangle vertices
+        - min_corners (np.ndarray): (N, 3) array of each triangle's minimum bounding voxel
+        - box_dims (np.ndarray): (N, 3) array of each triangle's bounding voxel box dimensions
+        - voxel_size (float): sidelength of each voxel
+        - grid_min_corner (list): position of the voxel in the minimum corner of the grid
+        - grid_shape (tuple): dimensions of the voxel grid
+        - batch_size (int): approximate number of candidate voxels (or raster columns) tested at once
+        - sparse (bool): whether to track present voxels in a ChunkedGrid rather than a dense array
+        - algorithm (str): "sat" to test each triangle's whole bounding box, or "raster" to only test voxels near its plane
+        - count_axes (bool): whether to also count the pairs rejected by each separating axis (as stats["axes"])
+        - triangle_colors (np.ndarray): (N, 3, 3) array of each triangle's vertex colors, to find every triangle intersecting 
+        each voxel and sum their interpolated colors instead of finding the first one (None = first triangle)
+
+        Returns:
+        - indices (np.ndarray): (M, 3) grid indices of each present voxel (no duplicates)
+        - face_ids (np.ndarray): (M,) index into triangles of the first triangle intersecting each voxel, or if triangle_colors 
+        is given, (M, 4) array of the sum of each voxel's interpolated colors (RGB) and the number of triangles intersecting it
+        - stats (dict): number of candidate pairs, pairs skipped, trivial hits, and full intersection tests (see STAT_NAMES)
+        """
+        # partial grid covering only these triangles (no pairs are skipped when every triangle's color is needed)
+        find_all = triangle_colors is not None
+        voxel_grid = None if find_all else ChunkedGrid(grid_shape, bool) if sparse else np.zeros(grid_shape, dtype=bool)
+        all_indices, all_face_ids = [np.empty((0, 3), dtype=np.int64)], [np.empty((0, 3)) if find_all else np.empty(0, dtype=np.int64)]
+        stats = dict.fromkeys(VoxelizerBase.STAT_NAMES, 0)
+        if count_axes:
+            stats["axes"] = np.zeros(len(BatchTriangleVoxelIntersection.AXIS_NAMES), dtype=np.int64)
+        small = np.ptp(triangles, axis=1).max(axis=1) <= voxel_size
+
+        work_counts = VoxelizerBase._get_work_counts(triangles, box_dims, algorithm)
+        for start, stop in VoxelizerBase._get_batches(work_counts, batch_size):
+            # enumerate each triangle's candidate voxels, ordered by triangle
+            if algorithm == "raster":
+                face_ids, voxels = VoxelizerBase._get_raster_candidates(
+                    triangles[start:stop], min_corners[start:stop], box_dims[start:stop], voxel_size)
+            else:
+                face_ids, voxels = VoxelizerBase._get_box_candidates(min_corners[start:stop], box_dims[start:stop])
+            face_ids += start
+            indices = voxels - grid_min_corner
+            if find_all:
+                stats["candidates"] += len(face_ids)
+                indices, colors = VoxelizerBase._find_all_hits(
+                    triangles, small, face_ids, voxels, indices, voxel_size, triangle_colors, stats)
+                all_indices.append(indices)
+                all_face_ids.append(colors)
+                continue
+
+            # ignore voxels that have already been identified as present (by earlier triangles of the same chunk)
+            absent = ~voxel_grid[indices[:, 0], indices[:, 1], indices[:, 2]]
+            stats["candidates"] += len(absent)
+            stats["skipped"] += len(absent) - int(np.count_nonzero(absent))
+            face_ids, voxels, indices = face_ids[absent], voxels[absent], indices[absent]
+
+            indices, face_ids = VoxelizerBase._find_first_hits(triangles, small, face_ids, voxels, indices, voxel_size, grid_shape, stats)
+            voxel_grid[indices[:, 0], indices[:, 1], indices[:, 2]] = True
+            all_indices.append(indices)
+            all_face_ids.append(face_ids)
+
+        if not find_all:
+            return np.concatenate(all_indices), np.concatenate(all_face_ids), stats
+
+        # sum the colors of each voxel's pairs
+        indices = np.concatenate(all_indices)
+        keys, inverse = np.unique(np.ravel_multi_index(indices.T, grid_shape), return_inverse=True)
+        inverse = inverse.reshape(-1)
+        colors = np.concatenate(all_face_ids)
+        sums = np.stack([np.bincount(inverse, colors[:, i], len(keys)) for i in range(3)] + [np.bincount(inverse, minlength=len(keys))], axis=1)
+        return np.stack(np.unravel_index(keys, grid_shape), axis=1), sums, stats
+
+    @staticmethod
+    def _find_all_hits(triangles, small, face_ids, voxels, indices, voxel_size, triangle_colors, stats):
+        """
+        Finds every candidate pair whose triangle intersects its voxel, and the color of the point on the triangle closest to 
+        the voxel's center, interpolated from the triangle's vertex colors
+
+        Args:
+        - triangles (np.ndarray): (N, 3, 3) array of triangle vertices
+        - small (np.ndarray): (N,) bool array, True for triangles no bigger than a voxel (whose vertices are checked first)
+        - face_ids (np.ndarray): (M,) index into triangles of each candidate pair's triangle
+        - voxels (np.ndarray): (M, 3) position of each candidate pair's voxel
+        - indices (np.ndarray): (M, 3) grid indices of each candidate pair's voxel
+        - voxel_size (float): sidelength of each voxel
+        - triangle_colors (np.ndarray): (N, 3, 3) array of each triangle's vertex colors
+        - stats (dict): counts to add the number of trivial hits (pairs resolved by the triangle's vertex alone) and full 
+        intersection tests to (and the pairs rejected by each separating axis, if it has "axes")
+
+        Returns:
+        - indices (np.ndarray): (K, 3) grid indices of each intersecting pair's voxel (a voxel appears once per triangle)
+        - colors (np.ndarray): (K, 3) array of each intersecting pair's interpolated color
+        """
+        voxel_centers = voxels * voxel_size + voxel_size / 2
+
+        # a small triangle's vertex in the voxel is a hit without the full test
+        checked = np.flatnonzero(small[face_ids])
+        hit = np.zeros(len(face_ids), dtype=bool)
+        hit[checked] = BatchTriangleVoxelIntersection(
+            triangles[face_ids[checked]], voxel_centers[checked], voxel_size).contains_vertex()
+        stats["trivial"] += int(np.count_nonzero(hit))
+        tested = np.flatnonzero(~hit)
+        hit[tested] = BatchTriangleVoxelIntersection(
+            triangles[face_ids[tested]], voxel_centers[tested], voxel_size).intersects(stats.get("axes"))
+        stats["tested"] += len(tested)
+
+        hits = np.flatnonzero(hit)
+        barycentrics = BatchTriangleVoxelIntersection(
+            triangles[face_ids[hits]], voxel_centers[hits], voxel_size).get_closest_barycentrics()
+        colors = np.einsum("ij,ijk->ik", barycentrics, triangle_colors[face_ids[hits]])
+        return indices[hits], colors
+
+    @staticmethod
+    def _find_first_hits(triangles, small, face_ids, voxels, indices, voxel_size, grid_shape, stats):
+        """
+        Finds the first triangle intersecting each candidate voxel, going through each voxel's triangles in order and 
+        stopping at the first hit (resolving voxels which contain a triangle's vertex without the full test)
+
+        Args:
+        - triangles (np.ndarray): (N, 3, 3) array of triangle vertices
+        - small (np.ndarray): (N,) bool array, True for triangles no bigger than a voxel (whose vertices are checked first)
+        - face_ids (np.ndarray): (M,) index into triangles of each candidate pair's triangle, in ascending order
+        - voxels (np.ndarray): (M, 3) position of each candidate pair's voxel
+        - indices (np.ndarray): (M, 3) grid indices of each candidate pair's voxel
+        - voxel_size (float): sidelength of each voxel
+        - grid_shape (tuple): dimensions of the voxel grid
+        - stats (dict): counts to add the number of trivial hits (voxels resolved by their first triangle's vertex alone)
+        and full intersection tests to (and the pairs rejected by each separating axis, if it has "axes")
+
+        Returns:
+        - indices (np.ndarray): (K, 3) grid indices of each present voxel (no duplicates)
+        - face_ids (np.ndarray): (K,) index into triangles of the first triangle intersecting each voxel
+        """
+        if not len(face_ids):
+            return indices, face_ids
+
+        # group the pairs by voxel (the stable sort keeps each voxel's triangles in order)
+        keys = np.ravel_multi_index(indices.T, grid_shape)
+        order = np.argsort(keys, kind="stable")
+        face_ids, voxels, indices = face_ids[order], voxels[order], indices[order]
+        group_starts = np.flatnonzero(np.diff(keys[order], prepend=-1))
+        group_sizes = np.diff(np.append(group_starts, len(face_ids)))
+        groups = np.repeat(np.arange(len(group_starts)), group_sizes)
+        ranks = np.arange(len(face_ids)) - group_starts[groups] # position of each pair within its voxel's triangles
+        voxel_centers = voxels * voxel_size + voxel_size / 2
+
+        # a small triangle usually has a vertex in its candidate voxels, which is a hit without the full test
+        checked = np.flatnonzero(small[face_ids])
+        contained = np.zeros(len(face_ids), dtype=bool)
+        contained[checked] = BatchTriangleVoxelIntersection(
+            triangles[face_ids[checked]], voxel_centers[checked], voxel_size).contains_vertex()
+
+        # a voxel's first triangle containing a vertex is a hit, so only the triangles before it need the full test
+        limits = np.minimum.reduceat(np.where(contained, ranks, len(face_ids)), group_starts)
+        hit_ranks = np.where(limits < group_sizes, limits, -1)
+        stats["trivial"] += int(np.count_nonzero(contained[group_starts]))
+
+        # test each voxel's triangles in rounds of doubling size until it's hit or runs out of triangles
+        pending = np.flatnonzero(ranks < limits[groups])
+        high = 1
+        while len(pending):
+            in_round = ranks[pending] < high
+            tested, pending = pending[in_round], pending[~in_round]
+            hits = tested[BatchTriangleVoxelIntersection(
+                triangles[face_ids[tested]], voxel_centers[tested], voxel_size).intersects(stats.get("axes"))]
+            stats["tested"] += len(tested)
+            # pairs are ordered by voxel and then triangle, so each voxel's first hit in this round is its earliest
+            hit_groups, first_hits = np.unique(groups[hits], return_index=True)
+            hit_ranks[hit_groups] = ranks[hits[first_hits]]
+            resolved = np.zeros(len(group_starts), dtype=bool)
+            resolved[hit_groups] = True
+            pending = pending[~resolved[groups[pending]]]
+            high = 2 * high + 1
+
+        found = hit_ranks >= 0
+        first_pairs = group_starts[found] + hit_ranks[found]
+        return indices[first_pairs], face_ids[first_pairs]
+
+    def fill_interior(self):
+        """
+        Fills the voxels enclosed by the voxelized surface, giving each the color of its nearest surface voxel
+
+        Returns:
+        - int: number of voxels filled
+
+        Raises:
+        - ValueError: if the grids are sparse (filling works on a dense grid, and a filled model isn't sparse anyway)
+        """
+        if self.sparse:
+            raise ValueError("Filling the interior needs dense grids")
+        if self.voxel_grid is None:
+            return 0
+        surface = self.voxel_grid
+        interior = SolidFill.get_interior(surface)
+        if not interior.any():
+            return 0
+
+        # every interior voxel's nearest surface voxel borders the interior, so only its bounding box (plus a voxel) is needed
+        interior_indices = np.nonzero(interior)
+        box_min = [max(int(indices.min()) - 1, 0) for indices in interior_indices]
+        box = tuple(slice(low, int(indices.max()) + 2) for low, indices in zip(box_min, interior_indices))
+        nearest_surface = SolidFill.get_nearest_filled(surface[box])[interior[box]]
+        del surface
+        surface_indices = np.unravel_index(nearest_surface, interior[box].shape)
+        surface_indices = tuple(indices + low for indices, low in zip(surface_indices, box_min))
+        self._copy_voxels(interior_indices, surface_indices)
+        return len(interior_indices[0])
+
+    def hollow(self, connectivity=26):
+        """
+        Removes the voxels which can't be seen from outside the model (the inner layers of thick surfaces and anything
+        filled), thinning it to a watertight shell (see SolidFill.get_shell)
+
+        Args:
+        - connectivity (int): 26 for the thinnest shell (voxels with a face exposed to the outside), or 6 for a shell whose
+        voxels touch by faces (also keeping voxels which only touch the outside by an edge or corner)
+
+        Returns:
+        - int: number of voxels removed
+        """
+        if self.voxel_grid is None:
+            return 0
+        if self.sparse:
+            # a sparse grid is hollowed from its voxels' indices, without expanding it
+            present = argwhere(self.voxel_grid)
+            hidden = tuple(present[~SolidFill.get_sparse_shell(present, self.voxel_grid.shape, connectivity)].T)
+        else:
+            present = self.voxel_grid
+            hidden = np.nonzero(present & ~SolidFill.get_shell(present, connectivity))
+        del present
+        self.voxel_grid[hidden] = False
+        self.color_grid[hidden] = 0
+        self.block_grid[hidden] = 0
+        return len(hidden[0])
+
+    def get_lods(self, levels):
+        """
+        Builds coarser levels of detail from this voxelization, each halving the resolution (2x2x2 voxels become one)
+
+        Args:
+        - levels (int): number of coarser levels to build
+
+        Returns:
+        - list: VoxelLevels from the finest (this voxelization) to the coarsest
+        """
+        return build_pyramid(self, self.voxel_size, levels)
+
+    def _copy_voxels(self, destination_indices, source_indices):
+        """
+        Copies the voxelization results of present voxels to other voxels, making those present too
+
+        Args:
+        - destination_indices (tuple): x, y, and z index arrays of the voxels to fill
+        - source_indices (tuple): x, y, and z index arrays of the voxels to copy from
+        """
+        self.voxel_grid[destination_indices] = True
+        # the remaining grids are copied in subclass
+
     def _populate_grids(self, x_index, y_index, z_index, voxel_color):
         """
-        Populates the grids which store the voxelization results
+        Populates the grids which store the voxelization results for a batch of present voxels
 
         Args:
-        - x_index (int): x index for grids
-        - y_index (int): y index for grids
-        - z_index (int): z index for grids
-        - voxel_color (list): RGB values specifying voxel's color
+        - x_index (np.ndarray): x indices for grids
+        - y_index (np.ndarray): y indices for grids
+        - z_index (np.ndarray): z indices for grids
+        - voxel_color (np.ndarray): (M, 3) array of RGB values specifying each voxel's color
         """
         self.voxel_grid[x_index, y_index, z_index] = True
         # the remaining grid population is implemented in subclass
@@ -118,32 +654,83 @@ class VoxelizerBase:
 class VoxelizerMinecraft(VoxelizerBase):
     """Voxelizer with minecraft-specific functionality"""
 
-    def __init__(self, model, voxel_size, kdtree):
+    def __init__(self, model, voxel_size, color_lookup, workers=1, sparse=False, algorithm="sat", bounds=None, color_mode="face"):
         """
         Initializes VoxelizerMinecraft
 
         Args:
-        - model (ObjReader): contains parsed data from input file (vertices, faces, colors)
+        - model (ObjReader): contains parsed NumPy arrays from input file (vertices, faces, colors)
         - voxel_size (float): the desired sidelength for the voxels (lower = higher detail)
-        - kdtree (KDTree): for finding the minecraft block color closest to each voxel's color
+        - color_lookup (ColorLookup): built from the colors of color_block_pairs, for finding the minecraft block color closest to each voxel's color
+        - workers (int): number of processes to voxelize with (1 = no process pool)
+        - sparse (bool): whether to store the grids as ChunkedGrids (only allocating chunks containing voxels)
+        - algorithm (str): "sat" to test every voxel in each triangle's bounding box, or "raster" to only test the voxels near 
+        each triangle's plane (same results)
+        - bounds (tuple): minimum and maximum corner voxels to limit the grid to (None = the model's bounding voxels)
+        - color_mode (str): "face" (first triangle's average vertex color) or "barycentric" (see VoxelizerBase)
         """
-        super().__init__(model, voxel_size)
-        self.kdtree = kdtree
+        super().__init__(model, voxel_size, workers, sparse, algorithm, bounds, color_mode)
+        self.color_lookup = color_lookup
+        # palette index i + 1 holds the block of the i-th color in color_block_pairs
+        self.block_palette = ["air"] + list(color_block_pairs.values())
     
     def _populate_grids(self, x_index, y_index, z_index, voxel_color):
         """
-        Overrides base class method to include block_grid population
+        Overrides base class method to include color_grid and block_grid population
 
         Args:
-        - x_index (int): x index for grids
-        - y_index (int): y index for grids
-        - z_index (int): z index for grids
-        - voxel_color (list): RGB values specifying voxel's color
+        - x_index (np.ndarray): x indices for grids
+        - y_index (np.ndarray): y indices for grids
+        - z_index (np.ndarray): z indices for grids
+        - voxel_color (np.ndarray): (M, 3) array of RGB values specifying each voxel's color
         """
         super()._populate_grids(x_index, y_index, z_index, voxel_color)
-        # find the minecraft block which best approximates the voxel's color
-        closest_color = self.kdtree.get_nearest_point(voxel_color) 
-        self.block_grid[x_index, y_index, z_index] = color_block_pairs[closest_color.value]
+        # colors are kept too, so that coarser levels of detail can be matched from their average colors
+        self.color_grid[x_index, y_index, z_index] = voxel_color
+        # find the minecraft blocks which best approximate the voxels' colors
+        block_indices = self.color_lookup.get_nearest_indices(voxel_color)
+        self.block_grid[x_index, y_index, z_index] = block_indices.astype(self.block_grid.dtype) + 1
+
+    def _copy_voxels(self, destination_indices, source_indices):
+        """
+        Overrides base class method to include color_grid and block_grid copying
+
+        Args:
+        - destination_indices (tuple): x, y, and z index arrays of the voxels to fill
+        - source_indices (tuple): x, y, and z index arrays of the voxels to copy from
+        """
+        super()._copy_voxels(destination_indices, source_indices)
+        self.color_grid[destination_indices] = self.color_grid[source_indices]
+        self.block_grid[destination_indices] = self.block_grid[source_indices]
+
+    def dither(self, mode):
+        """
+        Matches the blocks of every present voxel again from color_grid with dithering (see Dither), so that smooth color 
+        gradients don't band into large areas of the same block
+
+        Args:
+        - mode (str): one of Dither.MODES ("none" leaves the nearest blocks)
+        """
+        if mode == "none" or self.voxel_grid is None:
+            return
+        indices = argwhere(self.voxel_grid)
+        x_index, y_index, z_index = indices.T
+        # world positions rather than grid indices, so the ordered dither lines up across tiles
+        block_indices = Dither.get_block_indices(
+            mode, indices + self.grid_min_corner, self.color_grid[x_index, y_index, z_index], self.color_lookup)
+        self.block_grid[x_index, y_index, z_index] = block_indices.astype(self.block_grid.dtype) + 1
+
+    def get_lods(self, levels):
+        """
+        Overrides base class method to match each level's average colors to minecraft blocks
+
+        Args:
+        - levels (int): number of coarser levels to build
+
+        Returns:
+        - list: VoxelLevels from the finest (this voxelization) to the coarsest
+        """
+        return build_pyramid(self, self.voxel_size, levels, self.color_lookup)
 
 class VoxelizerWithoutMinecraft(VoxelizerBase):
     """Voxelizer with functionality needed when not using minecraft"""
@@ -153,10 +740,21 @@ class VoxelizerWithoutMinecraft(VoxelizerBase):
         Overrides base class method to include color_grid population
 
         Args:
-        - x_index (int): x index for grids
-        - y_index (int): y index for grids
-        - z_index (int): z index for grids
-        - voxel_color (list): RGB values specifying voxel's color
+        - x_index (np.ndarray): x indices for grids
+        - y_index (np.ndarray): y indices for grids
+        - z_index (np.ndarray): z indices for grids
+        - voxel_color (np.ndarray): (M, 3) array of RGB values specifying each voxel's color
         """
         super()._populate_grids(x_index, y_index, z_index, voxel_color)
-        self.color_grid[x_index, y_index, z_index] = voxel_color
\ No newline at end of file
+        self.color_grid[x_index, y_index, z_index] = voxel_color
+
+    def _copy_voxels(self, destination_indices, source_indices):
+        """
+        Overrides base class method to include color_grid copying
+
+        Args:
+        - destination_indices (tuple): x, y, and z index arrays of the voxels to fill
+        - source_indices (tuple): x, y, and z index arrays of the voxels to copy from
+        """
+        super()._copy_voxels(destination_indices, source_indices)
+        self.color_grid[destination_indices] = self.color_grid[source_indices]